@@ -0,0 +1,305 @@
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from flatast import child_nodes
+from interpreter import Interpreter
+from governor import ExecutionGovernor
+from output import CaptureSink
+from resolver import TEMPORARY_PREFIX
+
+# What each record's value is. A variable is NONE in the records where it
+# is unassigned, since a failed value (None) is never stored.
+NONE, INT, FLOAT = 0, 1, 2
+
+# Ints are computed in float64, which holds them exactly below 2**53;
+# records whose ints get that big are run with the scalar Interpreter
+EXACT_INT_LIMIT = 2 ** 53
+
+def _numpy():
+    # NumPy is only needed for batch mode, so it is imported on first use
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Batch mode requires NumPy (pip install numpy)") from None
+    return numpy
+
+class BatchInterpreter:
+    """Runs one program over many records at once with NumPy.
+
+    run() takes the columns of the records: a mapping from variable name to
+    an array (or sequence) of numbers, the variable's value before the
+    program runs in each record. Every AST node is evaluated for all
+    records at once with array operations; an if runs its branches on the
+    records that take them (masks), and a while repeats until the loop has
+    ended in every record. Each record ends up as the scalar Interpreter
+    would leave it with the same variables preset, except that nothing is
+    printed: BatchResult.errors marks the records that would have reported
+    an error.
+
+    Records the arrays cannot represent exactly (ints of 2**53 and more)
+    are run again with the scalar Interpreter, and so are all records of
+    a program with string literals.
+
+    Loops are accounted with governor as they run over the arrays: a step
+    is one iteration over all records still in the loop. Records run with
+    the scalar Interpreter get a governor with the same budgets each.
+    """
+
+    def __init__(self, symbol_table=None, governor=None):
+        self.np = _numpy()
+        self.symbol_table = symbol_table if symbol_table is not None else {}
+        self.governor = governor if governor is not None else ExecutionGovernor()
+
+    def run(self, node, columns, size=None):
+        np = self.np
+        inputs = {}
+        for name, values in columns.items():
+            array = np.asarray(values)
+            if array.ndim != 1 or array.dtype.kind not in 'iuf':
+                raise TypeError(f"Column '{name}' must be a one-dimensional array of numbers")
+            if size is None:
+                size = len(array)
+            elif len(array) != size:
+                raise ValueError(f"Column '{name}' has {len(array)} records, expected {size}")
+            inputs[name] = array
+        if size is None:
+            raise ValueError("The number of records is unknown: pass columns or size")
+
+        self.size = size
+        self.errors = np.zeros(size, dtype=bool)
+        self.fallback = np.zeros(size, dtype=bool)
+        self.variables = {} # name -> (float64 values, int8 kinds)
+        for name, array in inputs.items():
+            kind = INT if array.dtype.kind in 'iu' else FLOAT
+            data = array.astype(np.float64)
+            if kind == INT:
+                self.fallback |= np.abs(data) >= EXACT_INT_LIMIT
+            self.variables[name] = (data, np.full(size, kind, dtype=np.int8))
+
+        self.governor.start()
+        everything = np.ones(size, dtype=bool)
+        if _contains_string(node):
+            # The arrays only hold numbers
+            self.fallback = everything
+            result = self.none()
+        else:
+            with np.errstate(all='ignore'):
+                result = self.evaluate(node, everything)
+
+        overrides = {}
+        for record in np.flatnonzero(self.fallback).tolist():
+            overrides[record] = self.run_scalar(node, inputs, record)
+        return BatchResult(np, self.variables, result, self.errors, overrides)
+
+    def run_scalar(self, node, inputs, record):
+        output = CaptureSink()
+        interpreter = Interpreter(self.symbol_table, governor=self.governor.copy(), output=output)
+        for name, array in inputs.items():
+            interpreter.env[name] = array[record].item()
+        result = interpreter.eval(node)
+        self.errors[record] = bool(output.diagnostics)
+        return result, interpreter.get_formatted_env()
+
+    def none(self):
+        np = self.np
+        return np.zeros(self.size), np.zeros(self.size, dtype=np.int8)
+
+    def evaluate(self, node, active):
+        """Evaluate node in the records where active is set and return its
+        (values, kinds); the other records' entries are meaningless."""
+        np = self.np
+        node_type = type(node)
+
+        if node_type is NumberNode:
+            value = number_value(node.value)
+            if value is None:
+                self.errors |= active
+                return self.none()
+            if type(value) is int and abs(value) >= EXACT_INT_LIMIT:
+                self.fallback |= active
+            return (np.full(self.size, float(value)),
+                    np.full(self.size, INT if type(value) is int else FLOAT, dtype=np.int8))
+
+        if node_type is VarNode:
+            variable = self.variables.get(node.name)
+            if variable is None:
+                self.errors |= active
+                return self.none()
+            self.errors |= active & (variable[1] == NONE)
+            return variable
+
+        if node_type is BinOpNode:
+            left = self.evaluate(node.left, active)
+            right = self.evaluate(node.right, active)
+            return self.binary_op(node.op, left, right, active)
+
+        if node_type is UnaryOpNode:
+            zero = (np.zeros(self.size), np.full(self.size, INT, dtype=np.int8))
+            return self.binary_op(node.op, zero, self.evaluate(node.operand, active), active)
+
+        if node_type is AssignNode:
+            data, kind = self.evaluate(node.value, active)
+            old_data, old_kind = self.variables.get(node.name) or self.none()
+            # A failed value (None) leaves the variable as it was
+            stored = active & (kind != NONE)
+            self.variables[node.name] = (np.where(stored, data, old_data), np.where(stored, kind, old_kind))
+            return data, kind
+
+        if node_type is BlockNode:
+            result = self.none()
+            for stmt in node.statements:
+                result = self.evaluate(stmt, active)
+            return result
+
+        if node_type is IfNode:
+            condition, kind = self.evaluate(node.condition, active)
+            # Custom truthiness rule: > 0 is true, <= 0 is false; a failed
+            # condition (None) runs neither branch
+            present = active & (kind != NONE)
+            positive = condition > 0
+            data, kind = self.none()
+            for mask, branch in ((present & positive, node.then_branch), (present & ~positive, node.else_branch)):
+                if branch and mask.any():
+                    branch_data, branch_kind = self.evaluate(branch, mask)
+                    data = np.where(mask, branch_data, data)
+                    kind = np.where(mask, branch_kind, kind)
+            return data, kind
+
+        if node_type is WhileNode:
+            data, kind = self.none()
+            count = 0 # the most iterations any record has run
+            looping = active.copy()
+            while looping.any():
+                condition, condition_kind = self.evaluate(node.condition, looping)
+                looping &= (condition_kind != NONE) & (condition != 0)
+                if not looping.any():
+                    break
+                count += 1
+                self.governor.tick(count)
+                body_data, body_kind = self.evaluate(node.body, looping)
+                data = np.where(looping, body_data, data)
+                kind = np.where(looping, body_kind, kind)
+            return data, kind
+
+        self.errors |= active
+        return self.none()
+
+    def binary_op(self, op, left, right, active):
+        np = self.np
+        a, a_kind = left
+        b, b_kind = right
+        # A failed operand (None) makes the result None without a message
+        failed = (a_kind == NONE) | (b_kind == NONE)
+        ints = (a_kind == INT) & (b_kind == INT)
+        if op in ('+', '-', '*'):
+            if op == '+':
+                data = a + b
+            elif op == '-':
+                data = a - b
+            else:
+                data = a * b
+            # An int result is never -0.0, which would show in later float
+            # arithmetic
+            data = np.where(ints, data + 0.0, data)
+            self.fallback |= active & ints & ~failed & (np.abs(data) >= EXACT_INT_LIMIT)
+            kind = np.where(ints, INT, FLOAT).astype(np.int8)
+        elif op == '/':
+            zero = ~failed & (b == 0)
+            self.errors |= active & zero
+            failed = failed | zero
+            data = a / b
+            kind = np.full(self.size, FLOAT, dtype=np.int8)
+        elif op in ('<', '>', '<=', '>='):
+            if op == '<':
+                data = a < b
+            elif op == '>':
+                data = a > b
+            elif op == '<=':
+                data = a <= b
+            else:
+                data = a >= b
+            data = data.astype(np.float64)
+            kind = np.full(self.size, INT, dtype=np.int8)
+        else:
+            self.errors |= active & ~failed
+            return self.none()
+        kind[failed] = NONE
+        return data, kind
+
+class BatchResult:
+    """The outcome of BatchInterpreter.run for every record.
+
+    column() gives a variable's final values as a masked array (masked
+    where the variable is unassigned); environments() and results() give
+    each record's final environment and program result as the scalar
+    Interpreter returns them.
+    """
+
+    def __init__(self, np, variables, result, errors, overrides):
+        self.np = np
+        self.variables = variables
+        self.result = result
+        self.errors = errors       # bool array: the record would have reported an error
+        self.overrides = overrides # record -> (result, environment) from the scalar Interpreter
+        self.size = len(errors)
+
+    def names(self):
+        """The program variables assigned in at least one record."""
+        names = [name for name, (_, kind) in self.variables.items()
+                 if not name.startswith(TEMPORARY_PREFIX) and (kind != NONE).any()]
+        for _, environment in self.overrides.values():
+            names.extend(name for name in environment if name not in names)
+        return names
+
+    def column(self, name):
+        np = self.np
+        data, kind = self.variables.get(name) or (np.zeros(self.size), np.zeros(self.size, dtype=np.int8))
+        unset = kind == NONE
+        if self.overrides:
+            # Scalar results may be strings or ints beyond float64
+            values = np.array(_python_values(data, kind), dtype=object)
+            for record, (_, environment) in self.overrides.items():
+                values[record] = environment.get(name)
+                unset[record] = name not in environment
+            return np.ma.masked_array(values, mask=unset)
+        if (kind[~unset] == INT).all():
+            data = data.astype(np.int64)
+        return np.ma.masked_array(data, mask=unset)
+
+    def columns(self):
+        return {name: self.column(name) for name in self.names()}
+
+    def results(self):
+        """Each record's program result (None where it failed)."""
+        results = _python_values(*self.result)
+        for record, (result, _) in self.overrides.items():
+            results[record] = result
+        return results
+
+    def environments(self):
+        """Each record's final environment as a name -> value dict."""
+        environments = [{} for _ in range(self.size)]
+        for name, (data, kind) in self.variables.items():
+            if name.startswith(TEMPORARY_PREFIX):
+                continue
+            for environment, value in zip(environments, _python_values(data, kind)):
+                if value is not None:
+                    environment[name] = value
+        for record, (_, environment) in self.overrides.items():
+            environments[record] = dict(environment)
+        return environments
+
+def _python_values(data, kind):
+    # The arrays' values as ints, floats and None
+    return [None if k == NONE else int(value) if k == INT else value
+            for value, k in zip(data.tolist(), kind.tolist())]
+
+def _contains_string(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is StringNode:
+            return True
+        stack.extend(child_nodes(node))
+    return False
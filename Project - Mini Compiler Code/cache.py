@@ -0,0 +1,253 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from flatast import FlatAST
+
+# Part of every cache key: bump it whenever the lexer, parser or semantic
+# analyzer would produce something different, or the file format changes
+COMPILER_VERSION = 'mini-compiler-1'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mini-compiler')
+
+# Bytes of cache files kept in the directory
+CACHE_BYTES = 256 * 1024 * 1024
+
+# Eviction frees the directory down to this fraction of its bytes, so the
+# next full scan is that many stored bytes away
+EVICTION_TARGET = 0.9
+
+MAGIC = b'MCA1'
+SUFFIX = '.mca'
+TEMPORARY_PREFIX = '.tmp-'
+
+# Age in seconds after which a temporary file is taken to be left over
+# from a process that died while writing it
+STALE_SECONDS = 3600
+
+# Header: node count, child count, pool size, typed node count, symbol
+# count and root index
+_HEADER = struct.Struct('<6i')
+_CHECKSUM_SIZE = 16
+
+# Pool entry tags
+_STR, _INT, _FLOAT = b's', b'i', b'f'
+
+def _int32s(values):
+    # Array fields are stored as little-endian 32-bit integers
+    data = array('i', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+def _read_int32s(data, offset, count):
+    values = array('i')
+    values.frombytes(data[offset:offset + 4 * count])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, offset + 4 * count
+
+def encode(ast, symbol_table):
+    """The cache file contents for an analyzed AST and its symbol table.
+
+    The tree is stored as its FlatAST arrays, with the analyzer's operator
+    types and the symbol table as pool indices, followed by a checksum.
+    Raises TypeError for a literal that is not a str, int or float.
+    """
+    flat = FlatAST.encode(ast)
+    intern = flat.intern
+    typed = sorted(flat.types.items())
+    types = [value for index, type_ in typed for value in (index, intern(type_))]
+    symbols = [intern(value) for name, type_ in symbol_table.items() for value in (name, type_)]
+
+    parts = [MAGIC, _HEADER.pack(len(flat), len(flat.children), len(flat.pool), len(typed),
+                                 len(symbol_table), flat.root)]
+    parts.append(flat.kinds.tobytes())
+    for field in (flat.a, flat.b, flat.c, flat.children):
+        parts.append(_int32s(field))
+    parts.append(_int32s(types))
+    parts.append(_int32s(symbols))
+    for value in flat.pool:
+        if type(value) is str:
+            tag, text = _STR, value
+        elif type(value) is int:
+            tag, text = _INT, str(value)
+        elif type(value) is float:
+            tag, text = _FLOAT, repr(value)
+        else:
+            raise TypeError(f"Cannot cache literal of type {type(value).__name__}")
+        data = text.encode('utf-8')
+        parts.append(tag + struct.pack('<i', len(data)) + data)
+    body = b''.join(parts)
+    return body + hashlib.blake2b(body, digest_size=_CHECKSUM_SIZE).digest()
+
+def decode(data):
+    """(ast, symbol_table) from encode()'s output; ValueError if it is
+    damaged or in another format."""
+    body, checksum = data[:-_CHECKSUM_SIZE], data[-_CHECKSUM_SIZE:]
+    if not body.startswith(MAGIC) or hashlib.blake2b(body, digest_size=_CHECKSUM_SIZE).digest() != checksum:
+        raise ValueError("Not a valid cache file")
+    offset = len(MAGIC)
+    nodes, children, pool_size, typed, symbols, root = _HEADER.unpack_from(body, offset)
+    offset += _HEADER.size
+
+    flat = FlatAST()
+    flat.kinds.frombytes(body[offset:offset + nodes])
+    offset += nodes
+    for name in ('a', 'b', 'c', 'children'):
+        values, offset = _read_int32s(body, offset, children if name == 'children' else nodes)
+        setattr(flat, name, array(getattr(flat, name).typecode, values))
+    types, offset = _read_int32s(body, offset, 2 * typed)
+    symbol_pairs, offset = _read_int32s(body, offset, 2 * symbols)
+    for _ in range(pool_size):
+        tag = body[offset:offset + 1]
+        (size,) = struct.unpack_from('<i', body, offset + 1)
+        text = body[offset + 5:offset + 5 + size].decode('utf-8')
+        offset += 5 + size
+        flat.pool.append(text if tag == _STR else int(text) if tag == _INT else float(text))
+    if offset != len(body):
+        raise ValueError("Not a valid cache file")
+    flat.root = root
+
+    pool = flat.pool
+    flat.types = {types[i]: pool[types[i + 1]] for i in range(0, len(types), 2)}
+    symbol_table = {pool[symbol_pairs[i]]: pool[symbol_pairs[i + 1]] for i in range(0, len(symbol_pairs), 2)}
+    return flat.decode(), symbol_table
+
+class CompilationCache:
+    """On-disk cache of analyzed programs, shared by any number of processes.
+
+    A program is stored under the hash of COMPILER_VERSION and its source,
+    as one file in the format of encode(). Files are written to a temporary
+    name and renamed into place, so a reader sees either nothing or a whole
+    file. Reading a file touches its modification time, and once the files
+    take more than max_bytes the least recently used are deleted. The
+    directory is only scanned for that when the size it had at the last
+    scan plus what this object stored since goes over max_bytes, so other
+    processes' files may push it over by what they stored since. hits,
+    misses and evictions count this object's lookups and deletions; a
+    damaged or unreadable file counts as a miss.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = None # bytes in the directory as of the last scan, plus those stored since
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, source):
+        digest = hashlib.blake2b(COMPILER_VERSION.encode() + b'\0' + source.encode('utf-8'), digest_size=20)
+        return os.path.join(self.directory, digest.hexdigest() + SUFFIX)
+
+    def compile(self, source):
+        """(ast, symbol_table) of source, analyzed, from the cache if it is
+        there; otherwise compiled and stored. Errors are raised as usual
+        and nothing is stored for them."""
+        result = self.load(source)
+        if result is None:
+            ast = Parser(Lexer(source).tokenize()).parse()
+            semantic = SemanticAnalyzer()
+            semantic.analyze(ast)
+            result = ast, semantic.symbol_table
+            self.store(source, *result)
+        return result
+
+    def load(self, source):
+        path = self.path(source)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            result = decode(data)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass # evicted by another process meanwhile
+        self.hits += 1
+        return result
+
+    def store(self, source, ast, symbol_table):
+        """Store an analyzed program; False if it cannot be encoded."""
+        try:
+            data = encode(ast, symbol_table)
+        except TypeError:
+            return False
+        handle, temporary = tempfile.mkstemp(dir=self.directory, prefix=TEMPORARY_PREFIX)
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, self.path(source))
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+        if self.size is not None:
+            self.size += len(data)
+        if self.size is None or self.size > self.max_bytes:
+            self.evict()
+        return True
+
+    def evict(self):
+        """If the files take more than max_bytes, delete the least recently
+        used until EVICTION_TARGET of it remains; also delete temporary
+        files left over by crashed writers."""
+        entries = []
+        total = 0
+        stale = time.time() - STALE_SECONDS
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.startswith(TEMPORARY_PREFIX):
+                    if stat.st_mtime < stale:
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+                    continue
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        target = self.max_bytes * EVICTION_TARGET if total > self.max_bytes else self.max_bytes
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except OSError:
+                pass # already gone
+            total -= size
+        self.size = total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+if __name__ == '__main__':
+    from engines import create_engine, DEFAULT_ENGINE
+    cache = CompilationCache()
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as file:
+            ast, symbol_table = cache.compile(file.read())
+        result = create_engine(DEFAULT_ENGINE, symbol_table).eval(ast)
+        if result is not None:
+            print(f"Final Result: {result}")
+    print(f"Compilation cache: {cache.stats()}", file=sys.stderr)
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+import gc
+import threading
+
+_pause_lock = threading.Lock()
+_pauses = 0 # collection_paused() blocks running, in any thread
+_resume = False # whether the collector was enabled when the first began
+
+@contextmanager
+def collection_paused():
+    """Keep the cyclic garbage collector off for the block, for passes that
+    allocate many acyclic objects per node: on big programs the repeated
+    full collections over them cost more than the pass itself.
+
+    The collector is process-wide, so blocks count rather than toggle: it
+    goes off when the first block in any thread begins and is enabled again,
+    if it was before, only when the last one ends.
+    """
+    global _pauses, _resume
+    with _pause_lock:
+        if not _pauses:
+            _resume = gc.isenabled()
+            gc.disable()
+        _pauses += 1
+    try:
+        yield
+    finally:
+        with _pause_lock:
+            _pauses -= 1
+            if not _pauses and _resume:
+                gc.enable()
@@ -0,0 +1,356 @@
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, number_value
+)
+from flatast import assigned_names
+from loops import temporary_names
+from resolver import TEMPORARY_PREFIX
+from semantic import cannot_fail
+
+_MISSING = object()
+
+# Numbered apart from the loop optimizer's temporaries, so that hoisting one
+# more invariant in a later loop does not rename these
+CSE_PREFIX = TEMPORARY_PREFIX + 'c'
+
+class _Expression:
+    # One value of a subexpression: its occurrences while its inputs are unchanged
+    __slots__ = ('key', 'reads', 'size', 'nodes', 'anchor', 'order', 'clean', 'merged', 'temporary')
+
+    def __init__(self, key, reads, size, node, anchor, order, clean):
+        self.key = key
+        self.reads = reads
+        self.size = size
+        self.nodes = [node]  # the first occurrence, then the ones that reuse its value
+        self.anchor = anchor # (id(region), statement index) the temporary is assigned before
+        self.order = order
+        self.clean = clean   # no input assigned since the region was entered
+        self.merged = False
+        self.temporary = None
+
+class CommonSubexpressions:
+    """Common-subexpression elimination, run by the Optimizer at level 3.
+
+    Structurally identical operators are hash-consed to the same key. Walking
+    the program in evaluation order, an operator whose key is still
+    available (no input assigned since it was computed) reuses the earlier
+    value: the value is assigned to a temporary before the statement of its
+    first occurrence and every occurrence reads the temporary. An operator
+    computed at the start of both branches of an if is computed once before
+    the if. Only operators that cannot fail (see semantic.cannot_fail) take
+    part, so no error message is skipped or moved, and only when reading
+    the temporary saves more nodes than the assignment costs.
+    """
+
+    def __init__(self):
+        self.changes = {}
+
+    def optimize(self, root):
+        self.changes = {'common subexpressions eliminated': 0}
+        self.keys = {}     # structure -> key (hash-consing)
+        self.node_keys = {} # id(node) -> (key, reads, size), key None if not a candidate
+        self.visited = set()
+        self.shared = False
+        self.expressions = []
+        self.available = {} # key -> _Expression
+        self.readers = {}   # variable -> keys in available that read it
+        self.log = []       # (dict, key, previous value) or (list, None, length) to undo branch changes
+        self.branches = 0   # branches being walked; changes outside them are never undone
+        self.since = []     # sets collecting the variables assigned since some point
+        self.parents = {}   # id(region) -> (id(parent region), statement index)
+        self.anchor = None
+        self.statement_since = None
+
+        self.region(root, None, set())
+        if self.shared:
+            return root # a node reachable twice cannot be replaced by position
+
+        names = temporary_names(root, CSE_PREFIX)
+        self.anchored = {}
+        self.replacements = {} # id(node) -> _Expression
+        for expression in self.expressions:
+            count = len(expression.nodes)
+            # A temporary costs an assignment and a read per occurrence
+            if expression.merged or count < 2 or (count - 1) * expression.size <= count + 1:
+                continue
+            expression.temporary = next(names)
+            self.anchored.setdefault(expression.anchor, []).append(expression)
+            for node in expression.nodes:
+                self.replacements[id(node)] = expression
+            self.changes['common subexpressions eliminated'] += count - 1
+        if not self.replacements:
+            return root
+        return self.rewrite_region(root)
+
+    # Analysis
+
+    def region(self, node, parent, entry):
+        """Walk a statement sequence: a block, or a branch or loop body.
+        entry holds the variables assigned since the enclosing if began."""
+        if parent is not None:
+            self.parents[id(node)] = parent
+        self.since.append(entry)
+        statements = node.statements if type(node) is BlockNode else [node]
+        for index, stmt in enumerate(statements):
+            self.statement(stmt, (id(node), index), entry)
+        self.since.pop()
+
+    def statement(self, node, anchor, entry):
+        node_type = type(node)
+        if node_type is BlockNode:
+            self.region(node, anchor, entry)
+            return
+        outer = (self.anchor, self.statement_since)
+        self.anchor = anchor
+        self.statement_since = set()
+        self.since.append(self.statement_since)
+
+        if node_type is AssignNode:
+            self.expression(node.value)
+            self.kill(node.name)
+
+        elif node_type is IfNode:
+            self.expression(node.condition)
+            condition_assigned = set(self.statement_since)
+            mark = len(self.log)
+            self.branches += 1
+            then_start = len(self.expressions)
+            self.region(node.then_branch, anchor, set(condition_assigned))
+            self.undo(mark)
+            else_start = len(self.expressions)
+            if node.else_branch:
+                self.region(node.else_branch, anchor, set(condition_assigned))
+                self.undo(mark)
+            self.branches -= 1
+            merged = self.merge_branches(node, then_start, else_start)
+            for name in assigned_names(node):
+                self.kill(name)
+            for expression in merged:
+                if not (expression.reads & self.statement_since):
+                    self.make_available(expression)
+
+        elif node_type is WhileNode:
+            # The condition and body run again after the body, so only
+            # values whose inputs the loop never assigns carry over
+            for name in assigned_names(node):
+                self.kill(name)
+            self.expression(node.condition, register=False)
+            mark = len(self.log)
+            self.branches += 1
+            self.region(node.body, anchor, set())
+            self.undo(mark)
+            self.branches -= 1
+
+        else:
+            self.expression(node)
+
+        self.since.pop()
+        self.anchor, self.statement_since = outer
+
+    def merge_branches(self, node, then_start, else_start):
+        """Combine the values computed at the start of both branches into
+        values computed before the if."""
+        then_region = id(node.then_branch)
+        else_region = id(node.else_branch) if node.else_branch else None
+        firsts = {}
+        for expression in self.expressions[then_start:else_start]:
+            if expression.anchor[0] == then_region and expression.clean:
+                firsts.setdefault(expression.key, expression)
+        merged = []
+        for expression in self.expressions[else_start:]:
+            other = firsts.pop(expression.key, None)
+            if other is None or expression.anchor[0] != else_region or not expression.clean:
+                continue
+            combined = _Expression(expression.key, expression.reads, expression.size,
+                                   other.nodes[0], self.anchor, len(self.expressions), True)
+            combined.nodes = other.nodes + expression.nodes
+            other.merged = expression.merged = True
+            self.expressions.append(combined)
+            merged.append(combined)
+        return merged
+
+    def expression(self, node, register=True):
+        node_type = type(node)
+        if node_type is BinOpNode or node_type is UnaryOpNode:
+            if id(node) in self.visited:
+                self.shared = True
+                return
+            self.visited.add(id(node))
+            key, reads, size = self.key(node)
+            if key is not None:
+                expression = self.available.get(key)
+                if expression is not None:
+                    expression.nodes.append(node)
+                    return
+            if node_type is BinOpNode:
+                self.expression(node.left, register)
+                self.expression(node.right, register)
+            else:
+                self.expression(node.operand, register)
+            # Inputs assigned earlier in this statement have changed since
+            # the point where the temporary would be assigned
+            if key is not None and register and not (reads & self.statement_since):
+                expression = _Expression(key, reads, size, node, self.anchor, len(self.expressions),
+                                         not (reads & self.since[-2]))
+                self.expressions.append(expression)
+                self.make_available(expression)
+        elif node_type is AssignNode:
+            self.expression(node.value, register)
+            self.kill(node.name)
+
+    def key(self, node):
+        """(key, variables read, size) of node; key is None for anything
+        that is not a candidate (may fail, contains an assignment)."""
+        found = self.node_keys.get(id(node))
+        if found is not None:
+            return found
+        node_type = type(node)
+        if node_type is VarNode:
+            found = (self.intern(('var', node.name)), frozenset((node.name,)), 1)
+        elif node_type is NumberNode:
+            value = number_value(node.value)
+            # repr keeps 0.0 and -0.0 apart
+            found = ((None if value is None else self.intern((type(value), repr(value)))), frozenset(), 1)
+        elif node_type is BinOpNode:
+            left, left_reads, left_size = self.key(node.left)
+            right, right_reads, right_size = self.key(node.right)
+            key = None
+            if left is not None and right is not None and cannot_fail(node):
+                key = self.intern((node.op, left, right))
+            reads = left_reads | right_reads if right_reads else left_reads
+            found = (key, reads, left_size + right_size + 1)
+        elif node_type is UnaryOpNode:
+            operand, reads, size = self.key(node.operand)
+            key = None
+            if operand is not None and cannot_fail(node):
+                key = self.intern(('unary', node.op, operand))
+            found = (key, reads, size + 1)
+        else:
+            found = (None, frozenset(), 1)
+        self.node_keys[id(node)] = found
+        return found
+
+    def intern(self, structure):
+        key = self.keys.get(structure)
+        if key is None:
+            key = self.keys[structure] = len(self.keys)
+        return key
+
+    def make_available(self, expression):
+        self.set(self.available, expression.key, expression)
+        for name in expression.reads:
+            keys = self.readers.get(name)
+            if keys is None:
+                keys = []
+                self.set(self.readers, name, keys)
+            if self.branches:
+                self.log.append((keys, None, len(keys)))
+            keys.append(expression.key)
+
+    def kill(self, name):
+        for collected in self.since:
+            collected.add(name)
+        keys = self.readers.get(name)
+        if keys:
+            for key in keys:
+                if key in self.available:
+                    self.set(self.available, key, _MISSING)
+            self.set(self.readers, name, [])
+
+    def set(self, table, key, value):
+        if self.branches:
+            self.log.append((table, key, table.get(key, _MISSING)))
+        if value is _MISSING:
+            table.pop(key, None)
+        else:
+            table[key] = value
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            table, key, previous = self.log.pop()
+            if type(table) is list:
+                del table[previous:] # undo appends
+            elif previous is _MISSING:
+                table.pop(key, None)
+            else:
+                table[key] = previous
+
+    def dominates(self, first, expression):
+        """Whether first's temporary is assigned before expression's."""
+        region, index = expression.anchor
+        if region == first.anchor[0]:
+            return first.anchor[1] < index or (first.anchor[1] == index and first.order < expression.order)
+        while region in self.parents:
+            region, index = self.parents[region]
+            if region == first.anchor[0]:
+                return first.anchor[1] <= index
+        return False
+
+    # Rewriting
+
+    def rewrite_region(self, node):
+        statements = node.statements if type(node) is BlockNode else [node]
+        rewritten = []
+        for index, stmt in enumerate(statements):
+            for expression in sorted(self.anchored.get((id(node), index), ()), key=lambda e: e.order):
+                value = self.rewrite_expression(expression.nodes[0], expression)
+                rewritten.append(AssignNode(expression.temporary, value))
+            rewritten.append(self.rewrite_statement(stmt))
+        if type(node) is not BlockNode and len(rewritten) == 1:
+            return rewritten[0]
+        if type(node) is BlockNode and all(a is b for a, b in zip(rewritten, node.statements)) \
+                and len(rewritten) == len(node.statements):
+            return node
+        # The statement keeps its place at the end, and with it the result
+        return BlockNode(rewritten)
+
+    def rewrite_statement(self, node):
+        node_type = type(node)
+        if node_type is BlockNode:
+            return self.rewrite_region(node)
+        if node_type is AssignNode:
+            value = self.rewrite_expression(node.value)
+            return node if value is node.value else AssignNode(node.name, value)
+        if node_type is IfNode:
+            condition = self.rewrite_expression(node.condition)
+            then_branch = self.rewrite_region(node.then_branch)
+            else_branch = self.rewrite_region(node.else_branch) if node.else_branch else None
+            if (condition is node.condition and then_branch is node.then_branch
+                    and else_branch is node.else_branch):
+                return node
+            return IfNode(condition, then_branch, else_branch)
+        if node_type is WhileNode:
+            condition = self.rewrite_expression(node.condition)
+            body = self.rewrite_region(node.body)
+            if condition is node.condition and body is node.body:
+                return node
+            return WhileNode(condition, body)
+        return self.rewrite_expression(node)
+
+    def rewrite_expression(self, node, owner=None):
+        """node with its eliminated occurrences read from temporaries; inside
+        owner's own value only temporaries assigned before owner's count."""
+        expression = self.replacements.get(id(node))
+        if expression is not None:
+            if owner is None or (expression is not owner and self.dominates(expression, owner)):
+                return VarNode(expression.temporary)
+        node_type = type(node)
+        if node_type is BinOpNode:
+            left = self.rewrite_expression(node.left, owner)
+            right = self.rewrite_expression(node.right, owner)
+            if left is node.left and right is node.right:
+                return node
+            rebuilt = BinOpNode(left, node.op, right)
+            rebuilt.type = node.type
+            return rebuilt
+        if node_type is UnaryOpNode:
+            operand = self.rewrite_expression(node.operand, owner)
+            if operand is node.operand:
+                return node
+            rebuilt = UnaryOpNode(node.op, operand)
+            rebuilt.type = node.type
+            return rebuilt
+        if node_type is AssignNode:
+            value = self.rewrite_expression(node.value, owner)
+            return node if value is node.value else AssignNode(node.name, value)
+        return node
@@ -0,0 +1,26 @@
+from interpreter import Interpreter
+from vm import VirtualMachine
+from closures import ClosureInterpreter
+from transpiler import PythonInterpreter
+from irinterpreter import IRInterpreter
+from scheduler import ParallelInterpreter
+
+# Execution engines with the Interpreter surface: constructed with the
+# analyzer's symbol table (and optionally a governor and an output sink),
+# run with eval(ast), inspected with get_formatted_env(). The compiling
+# engines spend time before the first statement runs; 'ir' spends the most
+# and only pays off for loop-heavy code (see IRInterpreter)
+ENGINES = {
+    'tree': Interpreter,
+    'vm': VirtualMachine,
+    'closure': ClosureInterpreter,
+    'python': PythonInterpreter,
+    'ir': IRInterpreter,
+    'parallel': ParallelInterpreter,
+}
+DEFAULT_ENGINE = 'tree'
+
+def create_engine(name, symbol_table, input_func=None, governor=None, output=None):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown execution engine '{name}'. Expected one of: {', '.join(ENGINES)}")
+    return ENGINES[name](symbol_table, input_func, governor=governor, output=output)
@@ -0,0 +1,205 @@
+from array import array
+import tracemalloc
+
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode
+)
+
+# Node kind codes stored in FlatAST.kinds
+NUMBER, VAR, STRING, BINOP, ASSIGN, IF, WHILE, BLOCK, UNARY = range(9)
+
+NO_CHILD = -1
+
+class FlatAST:
+    """Array-backed encoding of an AST.
+
+    Node i is described by kinds[i] and the three integer fields a[i], b[i]
+    and c[i]; children are always stored before their parents.
+
+        NUMBER, VAR, STRING  a = pool index of the value / name
+        BINOP                a = left, b = pool index of the operator, c = right
+        ASSIGN               a = pool index of the name, b = value
+        IF                   a = condition, b = then branch, c = else branch or NO_CHILD
+        WHILE                a = condition, b = body
+        BLOCK                a = first entry in children, b = statement count
+        UNARY                a = operand, b = pool index of the operator
+
+    Literals, names and operators live once each in pool. Shared subtrees
+    (such as interned leaves) are encoded once. types maps the index of a
+    BINOP or UNARY node to the type the semantic analyzer recorded on it.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.a = array('l')
+        self.b = array('l')
+        self.c = array('l')
+        self.children = array('l')
+        self.pool = []
+        self.pool_index = {}
+        self.types = {}
+        self.root = NO_CHILD
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def intern(self, value):
+        key = (type(value), value)
+        index = self.pool_index.get(key)
+        if index is None:
+            index = self.pool_index[key] = len(self.pool)
+            self.pool.append(value)
+        return index
+
+    def add(self, kind, a=NO_CHILD, b=NO_CHILD, c=NO_CHILD):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.kinds) - 1
+
+    @classmethod
+    def encode(cls, root):
+        flat = cls()
+        encoded = {} # id(node) -> index
+        # Iterative post-order walk so deep trees do not hit the recursion limit
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in encoded:
+                continue
+            children = child_nodes(node)
+            if not expanded and children:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+            index = encoded[id(node)] = flat._encode_node(node, encoded)
+            if getattr(node, 'type', None) is not None:
+                flat.types[index] = node.type
+        flat.root = encoded[id(root)]
+        return flat
+
+    def _encode_node(self, node, encoded):
+        if isinstance(node, NumberNode):
+            return self.add(NUMBER, self.intern(node.value))
+        elif isinstance(node, VarNode):
+            return self.add(VAR, self.intern(node.name))
+        elif isinstance(node, StringNode):
+            return self.add(STRING, self.intern(node.value))
+        elif isinstance(node, BinOpNode):
+            return self.add(BINOP, encoded[id(node.left)], self.intern(node.op), encoded[id(node.right)])
+        elif isinstance(node, UnaryOpNode):
+            return self.add(UNARY, encoded[id(node.operand)], self.intern(node.op))
+        elif isinstance(node, AssignNode):
+            return self.add(ASSIGN, self.intern(node.name), encoded[id(node.value)])
+        elif isinstance(node, IfNode):
+            else_index = encoded[id(node.else_branch)] if node.else_branch else NO_CHILD
+            return self.add(IF, encoded[id(node.condition)], encoded[id(node.then_branch)], else_index)
+        elif isinstance(node, WhileNode):
+            return self.add(WHILE, encoded[id(node.condition)], encoded[id(node.body)])
+        elif isinstance(node, BlockNode):
+            start = len(self.children)
+            self.children.extend(encoded[id(stmt)] for stmt in node.statements)
+            return self.add(BLOCK, start, len(node.statements))
+        raise TypeError(f"Cannot encode AST node type: {type(node).__name__}")
+
+    def statements(self, index):
+        start = self.a[index]
+        return self.children[start:start + self.b[index]]
+
+    def decode(self, index=None):
+        """Rebuild node objects, sharing nodes that were shared when encoded."""
+        nodes = []
+        pool = self.pool
+        # Children precede parents, so one forward pass rebuilds the whole tree
+        for i, kind in enumerate(self.kinds):
+            a, b, c = self.a[i], self.b[i], self.c[i]
+            if kind == NUMBER:
+                node = NumberNode(pool[a])
+            elif kind == VAR:
+                node = VarNode(pool[a])
+            elif kind == STRING:
+                node = StringNode(pool[a])
+            elif kind == BINOP:
+                node = BinOpNode(nodes[a], pool[b], nodes[c])
+                node.type = self.types.get(i)
+            elif kind == UNARY:
+                node = UnaryOpNode(pool[b], nodes[a])
+                node.type = self.types.get(i)
+            elif kind == ASSIGN:
+                node = AssignNode(pool[a], nodes[b])
+            elif kind == IF:
+                node = IfNode(nodes[a], nodes[b], nodes[c] if c != NO_CHILD else None)
+            elif kind == WHILE:
+                node = WhileNode(nodes[a], nodes[b])
+            else:
+                node = BlockNode([nodes[stmt] for stmt in self.children[a:a + b]])
+            nodes.append(node)
+        return nodes[self.root if index is None else index]
+
+def child_nodes(node):
+    if isinstance(node, BinOpNode):
+        return (node.left, node.right)
+    elif isinstance(node, UnaryOpNode):
+        return (node.operand,)
+    elif isinstance(node, AssignNode):
+        return (node.value,)
+    elif isinstance(node, IfNode):
+        if node.else_branch:
+            return (node.condition, node.then_branch, node.else_branch)
+        return (node.condition, node.then_branch)
+    elif isinstance(node, WhileNode):
+        return (node.condition, node.body)
+    elif isinstance(node, BlockNode):
+        return tuple(node.statements)
+    return ()
+
+def walk(node):
+    """Yield node and every node below it, depth first. Iterative, so deep
+    trees do not hit the recursion limit."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(child_nodes(node))
+
+def assigned_names(node):
+    """The names of the variables node may assign."""
+    return {found.name for found in walk(node) if type(found) is AssignNode}
+
+def benchmark(statements=20000):
+    """Measure with tracemalloc the memory one program's tree holds as node
+    objects with and without interned leaves and as a FlatAST; returns
+    {encoding: bytes}."""
+    from lexer import Lexer
+    from parser import Parser
+    lines = []
+    for number in range(statements):
+        lines.append(f"x{number % 50} = x{number % 50} * 2 + {number % 10} - y;")
+        if number % 5 == 0:
+            lines.append(f"if x{number % 50} > 100 then y = 0 else y = y + 1;")
+        if number % 10 == 0:
+            lines.append("while y < 3 do y = y + 1;")
+    tokens = Lexer('\n'.join(lines)).tokenize()
+    encodings = (
+        ('nodes', lambda tree: Parser(tokens, intern_leaves=False).parse()),
+        ('nodes, interned leaves', lambda tree: Parser(tokens).parse()),
+        ('FlatAST', FlatAST.encode),
+    )
+    tree = Parser(tokens).parse()
+    sizes = {}
+    tracemalloc.start()
+    try:
+        for name, build in encodings:
+            before = tracemalloc.get_traced_memory()[0]
+            encoded = build(tree)
+            sizes[name] = tracemalloc.get_traced_memory()[0] - before
+            del encoded
+    finally:
+        tracemalloc.stop()
+    return sizes
+
+if __name__ == '__main__':
+    for name, size in benchmark().items():
+        print(f"{name}: {size / 1024 / 1024:.2f} MiB")
@@ -0,0 +1,128 @@
+import math
+import sys
+import time
+
+from resolver import UNSET
+
+# Budgets of a default ExecutionGovernor: loop iterations in total per run
+DEFAULT_MAX_STEPS = 1000000
+
+# Steps between the checks of the clock and the environment size
+CHECK_INTERVAL = 1000
+
+BUDGET_NAMES = {
+    'steps': 'loop iterations in total',
+    'iterations': 'iterations of one loop',
+    'seconds': 'seconds',
+    'env_size': 'bytes of variables',
+}
+
+class BudgetExceeded(Exception):
+    """Raised when a run uses more of a budget than its ExecutionGovernor allows.
+
+    budget is the budget's name ('steps', 'iterations', 'seconds' or
+    'env_size'), limit its configured value and used how much the run had
+    used when it was stopped.
+    """
+
+    def __init__(self, budget, limit, used):
+        self.budget = budget
+        self.limit = limit
+        self.used = used
+        super().__init__(f"Execution budget exceeded: more than {limit} {BUDGET_NAMES[budget]} ({used})")
+
+class Cancelled(Exception):
+    """Raised in a run whose ExecutionGovernor was cancelled."""
+
+    def __init__(self):
+        super().__init__("Execution cancelled")
+
+class ExecutionGovernor:
+    """The budgets a program run may use, enforced by the engines.
+
+    The only thing the language repeats is a while loop, so a step is one
+    loop iteration: max_steps bounds the iterations of all loops together,
+    max_iterations those of a single run of one loop. max_seconds bounds the
+    wall-clock time and max_env_size the memory of the variables' values
+    (sys.getsizeof, in bytes); None means unlimited. Engines call tick()
+    before every iteration, which only counts; the clock and the variables
+    are looked at every check_interval steps. A run that goes over a budget
+    is stopped with BudgetExceeded.
+
+    With trace set, loops print "Result:" and the body's value after every
+    iteration.
+
+    cancel() may be called from another thread: the run raises Cancelled
+    at its next loop iteration.
+    """
+
+    def __init__(self, max_steps=DEFAULT_MAX_STEPS, max_iterations=None, max_seconds=None,
+                 max_env_size=None, trace=False, check_interval=CHECK_INTERVAL):
+        self.max_steps = max_steps
+        self.max_iterations = max_iterations
+        self.max_seconds = max_seconds
+        self.max_env_size = max_env_size
+        self.trace = trace
+        self.check_interval = check_interval
+        self.iteration_limit = math.inf if max_iterations is None else max_iterations
+        self.cancelled = False
+        self.start()
+
+    def copy(self, **budgets):
+        """A new governor with the same budgets, except those given."""
+        settings = {
+            'max_steps': self.max_steps,
+            'max_iterations': self.max_iterations,
+            'max_seconds': self.max_seconds,
+            'max_env_size': self.max_env_size,
+            'trace': self.trace,
+            'check_interval': self.check_interval,
+        }
+        settings.update(budgets)
+        return ExecutionGovernor(**settings)
+
+    def start(self, env=None):
+        """Start accounting for a new run on env (an Environment)."""
+        self.env = env
+        self.steps = 0
+        self.started = time.perf_counter()
+        self.next_check = 0 if self.cancelled else self.check_interval
+        if self.max_steps is not None:
+            self.next_check = min(self.next_check, self.max_steps + 1)
+
+    def cancel(self):
+        self.cancelled = True
+        self.next_check = 0 # the next tick() checks
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def tick(self, count):
+        """Account for a loop iteration about to run, the count-th of its loop."""
+        if count > self.iteration_limit:
+            raise BudgetExceeded('iterations', self.max_iterations, count)
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check()
+
+    def check(self):
+        """Check every budget now."""
+        if self.cancelled:
+            raise Cancelled()
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetExceeded('steps', self.max_steps, self.steps)
+        if self.max_seconds is not None:
+            elapsed = self.elapsed()
+            if elapsed > self.max_seconds:
+                raise BudgetExceeded('seconds', self.max_seconds, round(elapsed, 3))
+        if self.max_env_size is not None and self.env is not None:
+            size = env_size(self.env)
+            if size > self.max_env_size:
+                raise BudgetExceeded('env_size', self.max_env_size, size)
+        self.next_check = self.steps + self.check_interval
+        if self.max_steps is not None:
+            self.next_check = min(self.next_check, self.max_steps + 1)
+
+def env_size(env):
+    """The bytes taken by the values of env's variables."""
+    return sum(sys.getsizeof(value) for value in env.values if value is not UNSET)
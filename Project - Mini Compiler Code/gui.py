@@ -1,14 +1,107 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import threading
-import io
-import sys
-from contextlib import redirect_stdout, redirect_stderr
 
-from lexer import Lexer
-from parser import Parser
+from incremental import IncrementalFrontEnd
+from parser import BinOpNode, UnaryOpNode, AssignNode, IfNode, WhileNode, BlockNode
 from semantic import SemanticAnalyzer
-from interpreter import Interpreter
+from engines import create_engine, DEFAULT_ENGINE
+from optimizer import Optimizer, DEFAULT_LEVEL
+from governor import ExecutionGovernor, BudgetExceeded
+from output import OutputSink
+from runner import Runner
+from highlight import Highlighter
+from session import Session
+
+# Milliseconds between polls of the runner: status, tabs and the Output tab
+OUTPUT_INTERVAL = 50
+# Lines of program output collected before they are queued for the Output tab
+OUTPUT_BATCH_LINES = 32
+# Characters of program output the Output tab shows per run
+OUTPUT_LIMIT = 1000000
+# Tokens the Tokens tab shows per page
+TOKEN_PAGE = 1000
+# Rows the Parser tab adds under a node at once; longer lists are split
+# into ranges that are filled when opened
+AST_PAGE = 500
+
+
+def ast_outline(node):
+    """(label, details, children) of an AST node for display: details are
+    lines about the node itself, children its (field, child) pairs, field
+    None for the statements of a block. children is None for a leaf, whose
+    label is its repr."""
+    if isinstance(node, BlockNode):
+        return "Block", (), [(None, stmt) for stmt in node.statements]
+    elif isinstance(node, IfNode):
+        if node.else_branch:
+            return "If", (), (("Condition", node.condition), ("Then", node.then_branch), ("Else", node.else_branch))
+        return "If", (), (("Condition", node.condition), ("Then", node.then_branch))
+    elif isinstance(node, WhileNode):
+        return "While", (), (("Condition", node.condition), ("Body", node.body))
+    elif isinstance(node, AssignNode):
+        return "Assignment", (f"Variable: {node.name}",), (("Value", node.value),)
+    elif isinstance(node, UnaryOpNode):
+        return f"UnaryOp ({node.op})", (), (("Operand", node.operand),)
+    elif isinstance(node, BinOpNode):
+        return f"BinaryOp ({node.op})", (), (("Left", node.left), ("Right", node.right))
+    return repr(node), (), None
+
+
+def format_ast(node):
+    """The AST under node as indented text, one line per row of the
+    Parser tab with every row open."""
+    lines = []
+    stack = [(node, "")] # (node, its indent), or (None, a heading line)
+    while stack:
+        node, indent_str = stack.pop()
+        if node is None:
+            lines.append(indent_str)
+            continue
+        label, details, children = ast_outline(node)
+        if children is None:
+            lines.append(f"{indent_str}{label}\n")
+            continue
+        lines.append(f"{indent_str}{label}:\n")
+        for line in details:
+            lines.append(f"{indent_str}  {line}\n")
+        inner = indent_str + "  "
+        for field, child in reversed(children):
+            if field is None:
+                stack.append((child, inner))
+            else:
+                stack.append((child, inner + "  "))
+                stack.append((None, f"{inner}{field}:\n"))
+    return ''.join(lines)
+
+
+class TextWidgetSink(OutputSink):
+    """Output sink that streams a run's output into a Tk text widget.
+
+    Batches may be emitted from any thread; they are queued until drain(),
+    which the Tk thread calls, appends them to the widget.
+    """
+
+    def __init__(self, widget, max_chars=OUTPUT_LIMIT):
+        super().__init__(batch_lines=OUTPUT_BATCH_LINES, max_chars=max_chars)
+        self.widget = widget
+        self.lock = threading.Lock()
+        self.queued = []
+
+    def emit(self, text):
+        with self.lock:
+            self.queued.append(text)
+
+    def drain(self):
+        with self.lock:
+            text = ''.join(self.queued)
+            self.queued = []
+        if not text:
+            return
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, text)
+        self.widget.see(tk.END)
+        self.widget.config(state=tk.DISABLED)
 
 
 class InterpreterGUI:
@@ -21,8 +114,24 @@ class InterpreterGUI:
         style = ttk.Style()
         style.theme_use('clam')
         
+        # Keeps the previous tokens and statements so re-runs only redo edited parts
+        self.front_end = IncrementalFrontEnd()
+        self.engine = DEFAULT_ENGINE
+        self.optimization_level = DEFAULT_LEVEL
+        # Budgets of every run, so a runaway loop cannot hang the window
+        self.governor = ExecutionGovernor(max_seconds=10)
+        # Compiles and runs the code off the Tk thread, one run at a time
+        self.runner = Runner()
+        # Checkpoints of the tree interpreter's runs, so a re-run resumes
+        # after the statements that did not change
+        self.session = Session()
+        self.job = None # the run whose results are shown
+        self.output_sink = None
+        self.phase = None
+        
         self.setup_ui()
         self.load_example_code()
+        self.poll_runner()
         
     def setup_ui(self):
         # Create main frame
@@ -49,7 +158,7 @@ class InterpreterGUI:
         code_label = ttk.Label(parent, text="Enter your sample code:", font=('Arial', 10, 'bold'))
         code_label.pack(anchor=tk.W, pady=(0, 5))
         
-        # Code text area with syntax highlighting placeholder
+        # Code text area, highlighted as it is edited and scrolled
         self.code_text = scrolledtext.ScrolledText(
             parent, 
             height=20, 
@@ -61,6 +170,7 @@ class InterpreterGUI:
             selectbackground='#264f78'
         )
         self.code_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.highlighter = Highlighter(self.code_text)
         
         # Button frame
         button_frame = ttk.Frame(parent)
@@ -75,6 +185,14 @@ class InterpreterGUI:
         )
         self.run_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.stop_button = ttk.Button(
+            button_frame, 
+            text="Stop", 
+            command=self.stop_code,
+            state=tk.DISABLED
+        )
+        self.stop_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.clear_button = ttk.Button(
             button_frame, 
             text="Clear", 
@@ -129,6 +247,16 @@ class InterpreterGUI:
         tokens_label = ttk.Label(tokens_frame, text="Lexical Analysis - Tokens:", font=('Arial', 10, 'bold'))
         tokens_label.pack(anchor=tk.W, pady=(0, 5))
         
+        # Only one page of tokens is formatted and shown at a time
+        self.tokens = []
+        self.token_page = 0
+        page_frame = ttk.Frame(tokens_frame)
+        page_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Button(page_frame, text="< Previous", command=lambda: self.show_token_page(self.token_page - 1)).pack(side=tk.LEFT)
+        ttk.Button(page_frame, text="Next >", command=lambda: self.show_token_page(self.token_page + 1)).pack(side=tk.LEFT, padx=(5, 0))
+        self.token_page_var = tk.StringVar()
+        ttk.Label(page_frame, textvariable=self.token_page_var).pack(side=tk.LEFT, padx=(10, 0))
+        
         self.tokens_text = scrolledtext.ScrolledText(
             tokens_frame,
             height=10,
@@ -143,18 +271,23 @@ class InterpreterGUI:
         ast_frame = ttk.Frame(notebook)
         notebook.add(ast_frame, text="Parser")
         
-        ast_label = ttk.Label(ast_frame, text="Abstract Syntax Tree:", font=('Arial', 10, 'bold'))
-        ast_label.pack(anchor=tk.W, pady=(0, 5))
+        ast_header = ttk.Frame(ast_frame)
+        ast_header.pack(fill=tk.X, pady=(0, 5))
+        ast_label = ttk.Label(ast_header, text="Abstract Syntax Tree:", font=('Arial', 10, 'bold'))
+        ast_label.pack(side=tk.LEFT)
+        ttk.Button(ast_header, text="Copy as Text", command=self.copy_ast).pack(side=tk.RIGHT)
         
-        self.ast_text = scrolledtext.ScrolledText(
-            ast_frame,
-            height=10,
-            font=('Consolas', 9),
-            state=tk.DISABLED,
-            bg='#f0fff0',
-            fg='#333333'
-        )
-        self.ast_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        # Tree of the AST whose rows are created when their parent is opened
+        self.ast_tree = ttk.Treeview(ast_frame, show='tree')
+        self.ast = None # the AST shown
+        self.ast_pending = {} # item -> its node, or the rows of a range, not yet added under it
+        self.ast_tree.bind('<<TreeviewOpen>>', self.open_ast_item)
+        
+        ast_scrollbar = ttk.Scrollbar(ast_frame, orient=tk.VERTICAL, command=self.ast_tree.yview)
+        self.ast_tree.configure(yscrollcommand=ast_scrollbar.set)
+        
+        self.ast_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, pady=(0, 10))
+        ast_scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=(0, 10))
         
         # Variables tab
         vars_frame = ttk.Frame(notebook)
@@ -176,24 +309,23 @@ class InterpreterGUI:
         vars_scrollbar = ttk.Scrollbar(vars_frame, orient=tk.VERTICAL, command=self.vars_tree.yview)
         self.vars_tree.configure(yscrollcommand=vars_scrollbar.set)
         
+        self.vars_rows = {} # variable name -> (item, values shown)
+        
         self.vars_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         vars_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
     def clear_code(self):
         self.code_text.delete(1.0, tk.END)
         self.clear_output_panels()
+        self.update_variables_tree({})
         self.status_var.set("Code cleared")
         
     def clear_output_panels(self):
-        # Clear all output panels
-        for text_widget in [self.output_text, self.tokens_text, self.ast_text]:
-            text_widget.config(state=tk.NORMAL)
-            text_widget.delete(1.0, tk.END)
-            text_widget.config(state=tk.DISABLED)
-        
-        # Clear variables tree
-        for item in self.vars_tree.get_children():
-            self.vars_tree.delete(item)
+        # Clear all output panels; the variables stay until the next run's
+        # environment is diffed against them
+        self.update_text_widget(self.output_text, '')
+        self.show_tokens([])
+        self.show_ast(None)
     
     def load_example_code(self):
         example_code = '''// Simple arithmetic and variables
@@ -223,110 +355,184 @@ class InterpreterGUI:
         widget.config(state=tk.DISABLED)
     
     def update_variables_tree(self, env):
-        # Clear existing items
-        for item in self.vars_tree.get_children():
-            self.vars_tree.delete(item)
-        
-        # Add variables to tree
+        # Only rows whose variable appeared, went away or changed are touched
+        rows = self.vars_rows
+        for var_name in [name for name in rows if name not in env]:
+            self.vars_tree.delete(rows.pop(var_name)[0])
         for var_name, value in env.items():
-            var_type = type(value).__name__
-            self.vars_tree.insert('', tk.END, text=var_name, values=(value, var_type))
+            values = (value, type(value).__name__)
+            row = rows.get(var_name)
+            if row is None:
+                rows[var_name] = (self.vars_tree.insert('', tk.END, text=var_name, values=values), values)
+            elif row[1] != values:
+                self.vars_tree.item(row[0], values=values)
+                rows[var_name] = (row[0], values)
+    
+    def show_tokens(self, tokens):
+        self.tokens = tokens
+        self.show_token_page(0)
     
-    def run_code_thread(self, code):
+    def show_token_page(self, page):
+        pages = max(1, -(-len(self.tokens) // TOKEN_PAGE))
+        self.token_page = page = min(max(page, 0), pages - 1)
+        start = page * TOKEN_PAGE
+        end = min(start + TOKEN_PAGE, len(self.tokens))
+        self.update_text_widget(self.tokens_text, '\n'.join(str(token) for token in self.tokens[start:end]))
+        if self.tokens:
+            self.token_page_var.set(f"Tokens {start + 1}-{end} of {len(self.tokens)} (page {page + 1} of {pages})")
+        else:
+            self.token_page_var.set("")
+    
+    def show_ast(self, ast, report=None):
+        """Show ast (or nothing, if None) in the Parser tab, with the
+        optimizer report's lines under a row of their own."""
+        self.ast_tree.delete(*self.ast_tree.get_children())
+        self.ast_pending = {}
+        self.ast = ast
+        if ast is None:
+            return
+        if report is not None:
+            title, lines = report
+            self.add_ast_row('', title, [(line, None) for line in lines])
+        self.add_ast_rows('', [(None, ast)])
+        root = self.ast_tree.get_children()[-1]
+        self.ast_tree.item(root, open=True)
+        self.open_ast_item(item=root)
+    
+    def add_ast_rows(self, parent, entries):
+        """Add a row under parent for each entry: a (field, node) pair, or
+        (text, None) for a line of text. More than AST_PAGE entries are
+        split into ranges, whose rows are added when they are opened."""
+        if len(entries) > AST_PAGE:
+            step = AST_PAGE
+            while len(entries) > step * AST_PAGE:
+                step *= AST_PAGE
+            for start in range(0, len(entries), step):
+                end = min(start + step, len(entries))
+                self.add_ast_row(parent, f"[{start}..{end - 1}]", entries[start:end])
+            return
+        for field, node in entries:
+            if node is None:
+                self.add_ast_row(parent, field)
+                continue
+            label, _, children = ast_outline(node)
+            text = label if field is None else f"{field}: {label}"
+            self.add_ast_row(parent, text, None if children is None else node)
+    
+    def add_ast_row(self, parent, text, contents=None):
+        # contents, a node or a list of entries, is added when the row is opened
+        item = self.ast_tree.insert(parent, tk.END, text=text)
+        if contents is not None:
+            self.ast_pending[item] = contents
+            self.ast_tree.insert(item, tk.END) # placeholder, so the row can be opened
+    
+    def open_ast_item(self, event=None, item=None):
+        if item is None:
+            item = self.ast_tree.focus()
+        contents = self.ast_pending.pop(item, None)
+        if contents is None:
+            return
+        self.ast_tree.delete(*self.ast_tree.get_children(item))
+        if type(contents) is not list:
+            _, details, children = ast_outline(contents)
+            contents = [(line, None) for line in details] + list(children)
+        self.add_ast_rows(item, contents)
+    
+    def copy_ast(self):
+        # The whole tree, including the rows not opened yet
+        if self.ast is None:
+            self.status_var.set("No AST to copy: run the code first")
+            return
+        self.root.clipboard_clear()
+        self.root.clipboard_append(format_ast(self.ast))
+        self.status_var.set("AST copied to the clipboard")
+    
+    def compile_and_run(self, job, code, output):
+        # Runs on the runner's worker thread: it only reports to the Tk
+        # thread through job.post(), which poll_runner() picks up
+        job.post('status', "Tokenizing...")
+        
+        # Lexical and Syntax Analysis (incremental: only edited statements are redone)
+        ast = self.front_end.update(code)
+        # Only the page of tokens shown is placed, on the Tk thread
+        job.post('tokens', self.front_end.token_view())
+        job.check()
+        
+        job.post('status', "Parsing...")
+        job.post('ast', ast, None)
+        job.check()
+        
+        job.post('status', "Semantic analysis...")
+        semantic = SemanticAnalyzer()
+        semantic.analyze(ast)
+        job.check()
+        
+        job.post('status', "Optimizing...")
+        # Optimization (folding, literal conversion, dead branches, loops)
+        job.governor = self.governor.copy()
+        optimizer = Optimizer(self.optimization_level, job.governor)
+        parsed = ast
+        ast = optimizer.optimize(ast)
+        job.post('ast', parsed, (f"Optimizer (level {self.optimization_level})", optimizer.report()))
+        job.check()
+        
+        job.post('status', "Interpreting...")
+        # Interpretation, streaming its output to the Output tab
+        interpreter = create_engine(self.engine, semantic.symbol_table, governor=job.governor, output=output)
         try:
-            self.status_var.set("Tokenizing...")
-            self.root.update()
-            
-            # Lexical Analysis
-            lexer = Lexer(code)
-            tokens = lexer.tokenize()
-            
-            # Update tokens display
-            tokens_str = '\n'.join(str(token) for token in tokens)
-            self.root.after(0, lambda: self.update_text_widget(self.tokens_text, tokens_str))
-            
-            self.status_var.set("Parsing...")
-            self.root.update()
-            
-            # Syntax Analysis
-            parser = Parser(tokens)
-            ast = parser.parse()
-            
-            # Update AST display
-            ast_str = self.format_ast(ast, 0)
-            self.root.after(0, lambda: self.update_text_widget(self.ast_text, ast_str))
-            
-            self.status_var.set("Semantic analysis...")
-            self.root.update()
-            
-            # Semantic Analysis
-            semantic = SemanticAnalyzer()
-            semantic.analyze(ast)
-            
-            self.status_var.set("Interpreting...")
-            self.root.update()
-            
-            # Interpretation with output capture
-            output_capture = io.StringIO()
-            
-            with redirect_stdout(output_capture), redirect_stderr(output_capture):
-                interpreter = Interpreter(semantic.symbol_table)
+            if self.engine == 'tree':
+                result = self.session.run(interpreter, ast)
+            else:
                 result = interpreter.eval(ast)
-                
-                if result is not None:
-                    print(f"Final Result: {result}")
-            
-            # Update output display
-            output_str = output_capture.getvalue()
-            self.root.after(0, lambda: self.update_text_widget(self.output_text, output_str))
-            
-            # Update variables display
-            self.root.after(0, lambda: self.update_variables_tree(interpreter.get_formatted_env()))
-            
-            self.status_var.set("Execution Completed Successfully")
-            
-        except Exception as e:
-            error_msg = f"Error: {str(e)}"
-            self.root.after(0, lambda: self.update_text_widget(self.output_text, error_msg))
-            self.status_var.set(f"Error: {type(e).__name__}")
-            
-        finally:
-            # Re-enable the run button
-            self.root.after(0, lambda: self.run_button.config(state=tk.NORMAL))
+        except BudgetExceeded as e:
+            # The variables stay as the run left them
+            output.write(str(e))
+            result = None
+        
+        if result is not None:
+            output.write(f"Final Result: {result}")
+        output.flush()
+        return interpreter.get_formatted_env()
     
-    def format_ast(self, node, indent=0):
-        """Format AST for display with proper indentation"""
-        indent_str = "  " * indent
-        
-        if hasattr(node, 'statements'):  # BlockNode
-            result = f"{indent_str}Block:\n"
-            for stmt in node.statements:
-                result += self.format_ast(stmt, indent + 1)
-            return result
-        elif hasattr(node, 'condition') and hasattr(node, 'then_branch'):  # IfNode
-            result = f"{indent_str}If:\n"
-            result += f"{indent_str}  Condition:\n{self.format_ast(node.condition, indent + 2)}"
-            result += f"{indent_str}  Then:\n{self.format_ast(node.then_branch, indent + 2)}"
-            if node.else_branch:
-                result += f"{indent_str}  Else:\n{self.format_ast(node.else_branch, indent + 2)}"
-            return result
-        elif hasattr(node, 'condition') and hasattr(node, 'body'):  # WhileNode
-            result = f"{indent_str}While:\n"
-            result += f"{indent_str}  Condition:\n{self.format_ast(node.condition, indent + 2)}"
-            result += f"{indent_str}  Body:\n{self.format_ast(node.body, indent + 2)}"
-            return result
-        elif hasattr(node, 'name') and hasattr(node, 'value'):  # AssignNode
-            result = f"{indent_str}Assignment:\n"
-            result += f"{indent_str}  Variable: {node.name}\n"
-            result += f"{indent_str}  Value:\n{self.format_ast(node.value, indent + 2)}"
-            return result
-        elif hasattr(node, 'left') and hasattr(node, 'right'):  # BinOpNode
-            result = f"{indent_str}BinaryOp ({node.op}):\n"
-            result += f"{indent_str}  Left:\n{self.format_ast(node.left, indent + 2)}"
-            result += f"{indent_str}  Right:\n{self.format_ast(node.right, indent + 2)}"
-            return result
-        else:
-            return f"{indent_str}{repr(node)}\n"
+    def poll_runner(self):
+        """Apply what the runner's jobs reported since the last poll;
+        reschedules itself every OUTPUT_INTERVAL ms."""
+        for event in self.runner.poll():
+            job, kind = event[:2]
+            if job is not self.job:
+                continue # superseded by a later run
+            if kind == 'status':
+                self.phase = event[2]
+                self.status_var.set(self.phase)
+            elif kind == 'tokens':
+                self.show_tokens(event[2])
+            elif kind == 'ast':
+                self.show_ast(event[2], event[3])
+            elif kind == 'done':
+                self.output_sink.drain()
+                self.update_variables_tree(event[2])
+                self.finish_run("Execution Completed Successfully")
+            elif kind == 'cancelled':
+                self.output_sink.write("Execution stopped")
+                self.output_sink.flush()
+                self.output_sink.drain()
+                self.finish_run("Stopped")
+            elif kind == 'failed':
+                error = event[2]
+                self.output_sink.drain()
+                self.update_text_widget(self.output_text, f"Error: {str(error)}")
+                self.finish_run(f"Error: {type(error).__name__}")
+        if self.job is not None:
+            self.output_sink.drain()
+            governor = self.job.governor
+            if self.phase == "Interpreting..." and governor is not None:
+                self.status_var.set(f"Interpreting... {governor.steps} steps")
+        self.root.after(OUTPUT_INTERVAL, self.poll_runner)
+    
+    def finish_run(self, status):
+        self.job = None
+        self.status_var.set(status)
+        self.stop_button.config(state=tk.DISABLED)
     
     def run_code(self):
         code = self.code_text.get(1.0, tk.END).strip()
@@ -338,13 +544,15 @@ class InterpreterGUI:
         # Clear previous results
         self.clear_output_panels()
         
-        # Disable run button during execution
-        self.run_button.config(state=tk.DISABLED)
-        
-        # Run in separate thread to prevent GUI freezing
-        thread = threading.Thread(target=self.run_code_thread, args=(code,))
-        thread.daemon = True
-        thread.start()
+        # Runs on the runner's worker; a run still going is cancelled, and
+        # only the latest of several quick clicks starts
+        output = self.output_sink = TextWidgetSink(self.output_text)
+        self.phase = None
+        self.job = self.runner.submit(lambda job: self.compile_and_run(job, code, output))
+        self.stop_button.config(state=tk.NORMAL)
+    
+    def stop_code(self):
+        self.runner.stop()
 
 
 def main():
@@ -360,6 +568,7 @@ def main():
     
     # Handle window closing
     def on_closing():
+        app.runner.close()
         root.quit()
         root.destroy()
     
@@ -0,0 +1,114 @@
+from lexer import Lexer, TokenType, DEFAULT_BACKEND
+
+# Milliseconds without edits or scrolling before the editor is highlighted
+DEBOUNCE_MS = 60
+
+# Lines whose spans are kept, by their text
+SPAN_CACHE_LINES = 4096
+
+# Text widget tag of each token type (untagged types keep the widget's colours)
+TYPE_TAGS = {
+    TokenType.KEYWORD: 'keyword',
+    TokenType.BOOLEAN: 'keyword',
+    TokenType.NUMBER: 'number',
+    TokenType.STRING: 'string',
+    TokenType.CHAR: 'string',
+    TokenType.IDENTIFIER: 'identifier',
+    None: 'error',
+}
+
+TAG_STYLES = {
+    'keyword': {'foreground': '#569cd6'},
+    'number': {'foreground': '#b5cea8'},
+    'string': {'foreground': '#ce9178'},
+    'identifier': {'foreground': '#9cdcfe'},
+    'error': {'foreground': '#f44747', 'underline': True},
+}
+
+class Highlighter:
+    """Syntax highlighting for a Tk text widget, limited to what is visible.
+
+    Edits, scrolling and resizing schedule a refresh() DEBOUNCE_MS later,
+    pushed back by every further event. A refresh looks only at the lines
+    in view: those whose text changed since they were last tagged are
+    scanned with Lexer.line_spans() (unless an identical line was scanned
+    recently) and retagged, all tags in one batch per tag. Tk moves tags
+    along with the text, so lines that merely moved keep theirs, except
+    that a change in the number of lines retags the whole view.
+    """
+
+    def __init__(self, widget, delay=DEBOUNCE_MS, backend=DEFAULT_BACKEND):
+        self.widget = widget
+        self.delay = delay
+        self.backend = backend
+        self.cache = {} # line text -> spans, least recently used first
+        self.shown = {} # line number -> the text its tags were made for
+        self.line_count = None
+        self.pending = None
+        for tag, style in TAG_STYLES.items():
+            widget.tag_configure(tag, **style)
+        widget.bind('<<Modified>>', self.modified, add='+')
+        widget.bind('<Configure>', self.schedule, add='+')
+        # Scrolling reports to the scrollbar through yscrollcommand
+        self.scroll_command = widget.tk.splitlist(widget.cget('yscrollcommand'))
+        widget.configure(yscrollcommand=self.scrolled)
+
+    def modified(self, event=None):
+        # Clearing the flag makes the next edit generate <<Modified>> again
+        self.widget.edit_modified(False)
+        self.schedule()
+
+    def scrolled(self, first, last):
+        if self.scroll_command:
+            self.widget.tk.call(*self.scroll_command, first, last)
+        self.schedule()
+
+    def schedule(self, event=None):
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+        self.pending = self.widget.after(self.delay, self.refresh)
+
+    def spans(self, text):
+        """The (tag, start, end) of the tokens to highlight on a line."""
+        spans = self.cache.pop(text, None)
+        if spans is None:
+            spans = [(TYPE_TAGS[type_], start, end)
+                     for type_, start, end in Lexer(text, self.backend).line_spans()
+                     if type_ in TYPE_TAGS]
+            if len(self.cache) >= SPAN_CACHE_LINES:
+                del self.cache[next(iter(self.cache))]
+        self.cache[text] = spans
+        return spans
+
+    def refresh(self):
+        """Highlight the lines in view that need it."""
+        self.pending = None
+        widget = self.widget
+        line_count = int(widget.index('end-1c').split('.')[0])
+        if line_count != self.line_count:
+            self.line_count = line_count
+            self.shown = {}
+        first = int(widget.index('@0,0').split('.')[0])
+        last = int(widget.index(f'@0,{widget.winfo_height()}').split('.')[0])
+        texts = widget.get(f'{first}.0', f'{last}.end').split('\n')
+
+        ranges = {tag: [] for tag in TAG_STYLES}
+        runs = [] # [first, last] line numbers of the retagged lines
+        for number, text in enumerate(texts, first):
+            if self.shown.get(number) == text:
+                continue
+            self.shown[number] = text
+            if runs and runs[-1][1] == number - 1:
+                runs[-1][1] = number
+            else:
+                runs.append([number, number])
+            for tag, start, end in self.spans(text):
+                ranges[tag] += (f'{number}.{start}', f'{number}.{end}')
+
+        if not runs:
+            return
+        for tag, indices in ranges.items():
+            for start, end in runs:
+                widget.tag_remove(tag, f'{start}.0', f'{end}.end')
+            if indices:
+                widget.tag_add(tag, *indices)
@@ -0,0 +1,233 @@
+import bisect
+import itertools
+
+from lexer import Lexer, Token, TokenType, DEFAULT_BACKEND
+from parser import Parser, BlockNode
+
+class StatementRecord:
+    """One top-level statement together with the source span it came from.
+
+    A span runs from the statement's first token up to the next statement's
+    first token (the first span also covers leading whitespace), so the spans
+    of all records tile the whole source. Spans are stored as lengths rather
+    than absolute offsets so that records after an edit never need updating.
+    """
+    __slots__ = ('node', 'length', 'newlines', 'tokens', 'origin', 'origin_line')
+
+    def __init__(self, node, length, newlines, tokens, origin, origin_line):
+        self.node = node
+        self.length = length
+        self.newlines = newlines
+        self.tokens = tokens # as lexed, with positions relative to origin/origin_line
+        self.origin = origin
+        self.origin_line = origin_line
+
+class IncrementalFrontEnd:
+    """Lexer + parser front end that only redoes the work an edit touches.
+
+    update() diffs the new source against the previous one, re-lexes and
+    re-parses from the top-level statement just before the damaged region and
+    stops as soon as the parse lines up with an old statement boundary inside
+    the unchanged tail. Statements outside that window, and their subtrees,
+    are reused by identity.
+    """
+
+    def __init__(self, backend=DEFAULT_BACKEND, parser_class=Parser):
+        self.backend = backend
+        self.parser_class = parser_class
+        self.code = ''
+        self.records = []
+        self.ast = BlockNode([])
+        # Statistics of the last update()
+        self.reused = 0
+        self.reparsed = 0
+
+    def update(self, code):
+        """Bring the front end up to date with code and return its BlockNode."""
+        old = self.code
+        if code == old and self.records:
+            self.reused, self.reparsed = len(self.records), 0
+            return self.ast
+
+        prefix = _common_prefix(old, code)
+        suffix = _common_suffix(old, code, min(len(old), len(code)) - prefix)
+        delta = len(code) - len(old)
+        damage_end = len(code) - suffix # end of the changed text in the new source
+
+        # Find the first record whose span reaches the edit, then step back one
+        # more: a statement's parse peeks at the first token of the next one
+        # (for ';', 'else' or an operator), which may itself have changed.
+        records = self.records
+        first = 0
+        start = 0
+        line = 1
+        while first < len(records) and start + records[first].length < prefix:
+            start += records[first].length
+            line += records[first].newlines
+            first += 1
+        if first:
+            first -= 1
+            start -= records[first].length
+            line -= records[first].newlines
+
+        new_records, resume = self._reparse(code, start, line, damage_end, delta, first)
+        tail = records[resume:] if resume is not None else []
+
+        self.code = code
+        self.records = records[:first] + new_records + tail
+        self.ast = BlockNode([record.node for record in self.records])
+        self.reused = len(self.records) - len(new_records)
+        self.reparsed = len(new_records)
+        return self.ast
+
+    def _reparse(self, code, start, line, damage_end, delta, first):
+        """Parse statements from start until the parse resynchronizes with an
+        old record; returns the new records and the index of the first old
+        record to keep (None when parsing ran to the end of the source)."""
+        lexed = []
+        def tokens():
+            for token in Lexer(code, self.backend).iter_tokens(start):
+                lexed.append(token)
+                yield token
+
+        parser = self.parser_class(tokens())
+        old_records = self.records
+        old_index = first
+        old_start = start # old-source offset of old_records[old_index]
+        new_records = []
+        span_start = start
+        consumed = 0
+
+        while parser.current().type != TokenType.EOF:
+            node = parser.parse_statement()
+            statement_tokens = lexed[consumed:parser.pos]
+            consumed = parser.pos
+            next_start = parser.current().pos
+            if next_start is None:
+                next_start = len(code)
+            newlines = code.count('\n', span_start, next_start)
+            new_records.append(StatementRecord(node, next_start - span_start, newlines,
+                                               statement_tokens, span_start, line))
+            span_start = next_start
+            line += newlines
+
+            # Resynchronize once the next statement starts inside the unchanged
+            # tail exactly where an old statement used to start
+            if next_start > damage_end:
+                target = next_start - delta
+                while old_index < len(old_records) and old_start < target:
+                    old_start += old_records[old_index].length
+                    old_index += 1
+                if old_start == target and old_index < len(old_records):
+                    return new_records, old_index
+
+        return new_records, None
+
+    @property
+    def tokens(self):
+        """All tokens of the current source with absolute positions, plus EOF."""
+        return list(self.token_view())
+
+    def token_view(self):
+        """The tokens of the current source as a TokenView, which only
+        places the tokens that are read."""
+        return TokenView(self.code, self.records)
+
+class TokenView:
+    """The tokens of one version of the source, as a read-only sequence.
+
+    Records keep their tokens as lexed, relative to where the record was
+    then. Building the whole list means shifting every token of every
+    record that moved; a view only does that for the tokens indexed or
+    sliced, and otherwise keeps three numbers per record.
+    Records are never modified, so a view stays valid after later updates.
+    """
+
+    def __init__(self, code, records):
+        self.code = code
+        self.records = records
+        self.ends = list(itertools.accumulate(len(record.tokens) for record in records))
+        # Where each record starts, and after the last one the end
+        self.starts = list(itertools.accumulate((record.length for record in records), initial=0))
+        self.lines = list(itertools.accumulate((record.newlines for record in records), initial=1))
+
+    def __len__(self):
+        return (self.ends[-1] if self.ends else 0) + 1 # and EOF
+
+    def __iter__(self):
+        for index in range(len(self.records)):
+            yield from self.record_tokens(index)
+        yield self.eof()
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            tokens = []
+            record = bisect.bisect_right(self.ends, start)
+            while start < stop and record < len(self.records):
+                first = self.ends[record - 1] if record else 0
+                tokens += self.record_tokens(record, start - first, stop - first)
+                start = self.ends[record]
+                record += 1
+            if start < stop:
+                tokens.append(self.eof())
+            return tokens
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        record = bisect.bisect_right(self.ends, index)
+        if record == len(self.records):
+            return self.eof()
+        first = self.ends[record - 1] if record else 0
+        return self.record_tokens(record, index - first, index - first + 1)[0]
+
+    def record_tokens(self, index, start=0, stop=None):
+        """Tokens start:stop of record index with absolute positions."""
+        code = self.code
+        record = self.records[index]
+        shift = self.starts[index] - record.origin
+        line_shift = self.lines[index] - record.origin_line
+        tokens = []
+        for token in record.tokens[start:stop]:
+            pos = token.pos + shift
+            column = token.column
+            if token.line == record.origin_line:
+                # The record's first line may start before the record, so
+                # an edit earlier on that line moves the column too
+                column = pos - code.rfind('\n', 0, pos)
+            if shift or line_shift or column != token.column:
+                token = Token(token.type, token.value, pos, token.line + line_shift, column)
+            tokens.append(token)
+        return tokens
+
+    def eof(self):
+        code = self.code
+        line = self.lines[-1]
+        if not self.records:
+            line = code.count('\n') + 1 # whitespace-only source
+        column = len(code) - code.rfind('\n')
+        return Token(TokenType.EOF, '', len(code), line, column)
+
+def _common_prefix(a, b):
+    # Binary search on slice equality keeps the character comparisons in C
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
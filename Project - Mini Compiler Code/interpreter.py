@@ -1,115 +1,234 @@
+import operator
+
 from parser import (
-    NumberNode, VarNode, AssignNode, BinOpNode, IfNode, WhileNode,
-    BlockNode, StringNode
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
 )
+from resolver import Environment, Resolver, UNSET, resolved_slots
+from governor import ExecutionGovernor
+from output import StdoutSink
+import flatast
+
+# Operators on values the semantic analyzer proved to be numbers; division
+# still needs its zero check
+UNCHECKED_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '<': lambda a, b: 1 if a < b else 0,
+    '>': lambda a, b: 1 if a > b else 0,
+    '<=': lambda a, b: 1 if a <= b else 0,
+    '>=': lambda a, b: 1 if a >= b else 0,
+}
 
 class Interpreter:
-    def __init__(self, symbol_table, input_func=None):
-        self.env = {} # this is a storage for variables (like a dictionary)
+    def __init__(self, symbol_table, input_func=None, governor=None, output=None):
+        self.env = Environment() # storage for variables: a list indexed by slot, viewable as a dict
         self.symbol_table = symbol_table # stores extra info about variables, types, etc.
         self.input_func = input_func if input_func is not None else input # Default to built-in input if not provided
+        self.governor = governor if governor is not None else ExecutionGovernor() # budgets of a run
+        self.output = output if output is not None else StdoutSink() # where results and errors are reported
 
     def eval(self, node):
+        self.governor.start(self.env)
+        try:
+            self.resolve(node)
+            return self.execute(node)
+        finally:
+            self.output.flush()
+
+    def resolve(self, node):
+        """Resolve node's variables to slots of env (unless they still are)
+        and return the slots that need an undefined-variable check."""
+        checked = resolved_slots(node, self.env)
+        if checked is None:
+            resolver = Resolver(self.env)
+            resolver.resolve(node)
+            checked = resolver.checked
+        return checked
+
+    def execute(self, node):
+        """Evaluate a resolved node."""
         if isinstance(node, BlockNode):
             result = None
             for stmt in node.statements:
-                result = self.eval(stmt)
+                result = self.execute(stmt)
             return result
 
         elif isinstance(node, NumberNode):
-            try:
-                # Try float first
-                num = float(node.value)
-                # Convert to int if it has no decimal part
-                return int(num) if num.is_integer() else num
-            except ValueError:
-                print(f"Semantic Error: Invalid number '{node.value}'")
-                return None
+            return self.number(node.value, node)
 
 
         elif isinstance(node, VarNode):
-            # Retrieve variable value from environment
-            if node.name not in self.env:
-                print(f"Semantic Error: Undefined variable '{node.name}'")
+            # Retrieve variable value from its slot
+            value = self.env.values[node.slot]
+            if value is UNSET:
+                self.output.error('semantic', f"Undefined variable '{node.name}'", node)
                 return None
-            return self.env[node.name]
+            return value
 
         elif isinstance(node, StringNode):
             return node.value
 
         elif isinstance(node, AssignNode):
             # Evaluate the right-hand side expression
-            value = self.eval(node.value)
+            value = self.execute(node.value)
             if value is None:
                 return None # Propagate error if value evaluation failed
             
             # Assign the value to the variable in the environment
-            self.env[node.name] = value
+            self.env.values[node.slot] = value
             return value # Assignment typically returns the assigned value
 
         elif isinstance(node, BinOpNode):
-            left = self.eval(node.left)
-            right = self.eval(node.right)
-
-            if left is None or right is None:
-                return None # Propagate error if operand evaluation failed
-
-            # Type checking for arithmetic operations
-            if not (isinstance(left, (int, float)) and isinstance(right, (int, float))):
-                print(f"Semantic Error: Invalid operand types for operator '{node.op}': {type(left).__name__} and {type(right).__name__}")
-                return None
-
-            # Perform the binary operation
-            if node.op == '+':
-                return left + right
-            elif node.op == '-':
-                return left - right
-            elif node.op == '*':
-                return left * right
-            elif node.op == '/':
-                if right == 0:
-                    print("Runtime Error: Division by zero")
-                    return None
-                return left / right # Integer division as per common compiler behavior
-            elif node.op == '<':
-                return int(left < right) # Return 1 for true, 0 for false
-            elif node.op == '>':
-                return int(left > right)
-            elif node.op == '<=':
-                return int(left <= right)
-            elif node.op == '>=':
-                return int(left >= right)
-            else:
-                print(f"Runtime Error: Unknown operator '{node.op}'")
-                return None
+            left = self.execute(node.left)
+            right = self.execute(node.right)
+            if node.type is not None and (right or node.op != '/'):
+                return UNCHECKED_OPS[node.op](left, right)
+            return self.binary_op(node.op, left, right, node)
+
+        elif isinstance(node, UnaryOpNode):
+            # Evaluated as 0 - x rather than -x so that e.g. 0.0 stays 0.0
+            if node.type is not None:
+                return UNCHECKED_OPS[node.op](0, self.execute(node.operand))
+            return self.binary_op(node.op, 0, self.execute(node.operand), node)
 
         elif isinstance(node, IfNode):
-            condition_value = self.eval(node.condition)
+            condition_value = self.execute(node.condition)
             if condition_value is None:
                 return None # Propagate error if condition evaluation failed
 
             # Apply your custom truthiness rule: > 0 is true, <= 0 is false
             if condition_value > 0:
-                return self.eval(node.then_branch)
+                return self.execute(node.then_branch)
             elif node.else_branch:
-                return self.eval(node.else_branch)
+                return self.execute(node.else_branch)
             return None # If no else branch and condition is false
 
         elif isinstance(node, WhileNode):
-            loop_limit = 10 
+            result = None # A loop that never runs yields no result
+            governor = self.governor
             count = 0
-            while self.eval(node.condition):
-                result = self.eval(node.body)
-                print("Result:", result)
+            while self.execute(node.condition):
                 count += 1
-                if count >= loop_limit:
-                    print("Loop limit reached (10 iterations). Breaking loop to prevent infinite execution.")
-                    break
+                governor.tick(count) # raises BudgetExceeded when over budget
+                result = self.execute(node.body)
+                if governor.trace:
+                    self.output.write(f"Result: {result}")
             return result
 
         else:
-            print(f"Runtime Error: Unknown AST node type: {type(node).__name__}")
+            self.output.error('runtime', f"Unknown AST node type: {type(node).__name__}", node)
             return None
 
+    def number(self, value, node=None):
+        num = number_value(value)
+        if num is None:
+            self.output.error('semantic', f"Invalid number '{value}'", node)
+        return num
+
+    def binary_op(self, op, left, right, node=None):
+        if left is None or right is None:
+            return None # Propagate error if operand evaluation failed
+
+        # Type checking for arithmetic operations
+        if not (isinstance(left, (int, float)) and isinstance(right, (int, float))):
+            self.output.error('semantic', f"Invalid operand types for operator '{op}': {type(left).__name__} and {type(right).__name__}", node)
+            return None
+
+        # Perform the binary operation
+        if op == '+':
+            return left + right
+        elif op == '-':
+            return left - right
+        elif op == '*':
+            return left * right
+        elif op == '/':
+            if right == 0:
+                self.output.error('runtime', "Division by zero", node)
+                return None
+            return left / right # Integer division as per common compiler behavior
+        elif op == '<':
+            return int(left < right) # Return 1 for true, 0 for false
+        elif op == '>':
+            return int(left > right)
+        elif op == '<=':
+            return int(left <= right)
+        elif op == '>=':
+            return int(left >= right)
+        else:
+            self.output.error('runtime', f"Unknown operator '{op}'", node)
+            return None
+
+    def eval_flat(self, flat, index=None):
+        """Evaluate a FlatAST directly, with the same semantics as eval()."""
+        if index is None:
+            try:
+                return self.eval_flat(flat, flat.root)
+            finally:
+                self.output.flush()
+        kind = flat.kinds[index]
+        a = flat.a[index]
+
+        if kind == flatast.BLOCK:
+            result = None
+            for stmt in flat.statements(index):
+                result = self.eval_flat(flat, stmt)
+            return result
+
+        elif kind == flatast.NUMBER:
+            return self.number(flat.pool[a])
+
+        elif kind == flatast.VAR:
+            name = flat.pool[a]
+            if name not in self.env:
+                self.output.error('semantic', f"Undefined variable '{name}'")
+                return None
+            return self.env[name]
+
+        elif kind == flatast.STRING:
+            return flat.pool[a]
+
+        elif kind == flatast.ASSIGN:
+            value = self.eval_flat(flat, flat.b[index])
+            if value is None:
+                return None
+            self.env[flat.pool[a]] = value
+            return value
+
+        elif kind == flatast.BINOP:
+            left = self.eval_flat(flat, a)
+            right = self.eval_flat(flat, flat.c[index])
+            return self.binary_op(flat.pool[flat.b[index]], left, right)
+
+        elif kind == flatast.UNARY:
+            return self.binary_op(flat.pool[flat.b[index]], 0, self.eval_flat(flat, a))
+
+        elif kind == flatast.IF:
+            condition_value = self.eval_flat(flat, a)
+            if condition_value is None:
+                return None
+            if condition_value > 0:
+                return self.eval_flat(flat, flat.b[index])
+            elif flat.c[index] != flatast.NO_CHILD:
+                return self.eval_flat(flat, flat.c[index])
+            return None
+
+        elif kind == flatast.WHILE:
+            result = None
+            governor = self.governor
+            count = 0
+            while self.eval_flat(flat, a):
+                count += 1
+                governor.tick(count)
+                result = self.eval_flat(flat, flat.b[index])
+                if governor.trace:
+                    self.output.write(f"Result: {result}")
+            return result
+
+        self.output.error('runtime', f"Unknown flat AST node kind: {kind}")
+        return None
+
     def get_formatted_env(self):
-        return self.env
+        return self.env.variables()
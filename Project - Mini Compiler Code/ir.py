@@ -0,0 +1,417 @@
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from flatast import child_nodes
+
+# Opcodes. Instructions that produce a value define a fresh value number
+# (SSA): every value is assigned by exactly one instruction.
+(
+    CONST,    # dest = attr
+    PARAM,    # dest = the variable in slot attr on entry (UNSET if unassigned)
+    CHECK,    # dest = args[0], or None after reporting variable attr as undefined if it is UNSET
+    INVALID,  # report attr as an invalid number literal; dest = None
+    UNKNOWN,  # report attr as an unknown AST node type; dest = None
+    BINARY,   # dest = args[0] attr args[1] with the interpreter's checks
+    NUMBER,   # the same on operands proven to be numbers (division still checks for zero)
+    KEEP,     # dest = args[0] unless it is None, else args[1]: a variable after an assignment
+    COPY,     # dest = args[0]
+    PHI,      # dest = args[i] when control came from the block attr[i]
+    STORE,    # assign args[0] to the variable in slot attr unless it is None
+    TRACE,    # print "Result:" and args[0] after a loop iteration if the governor traces
+    TICK,     # count the args[0]-th iteration of a loop with the governor (may raise BudgetExceeded)
+    JUMP,     # continue at successors[0]
+    BRANCH,   # continue at successors[0] if args[0] passes the test attr, else at successors[1]
+    RETURN,   # stop with the program's result args[0]
+) = range(16)
+
+OPCODE_NAMES = [
+    'const', 'param', 'check', 'invalid', 'unknown', 'binary', 'number', 'keep',
+    'copy', 'phi', 'store', 'trace', 'tick', 'jump', 'branch', 'return',
+]
+
+# BRANCH tests: the value is None, the if rule (> 0), Python truthiness (while)
+BRANCH_TESTS = ('none', 'positive', 'truthy')
+
+# Opcodes that only compute their value, so an unused one can be deleted
+PURE_OPCODES = frozenset((CONST, PARAM, KEEP, COPY, PHI))
+
+class Instruction:
+    __slots__ = ('opcode', 'dest', 'args', 'attr')
+
+    def __init__(self, opcode, dest=None, args=(), attr=None):
+        self.opcode = opcode
+        self.dest = dest   # value number defined, or None
+        self.args = args   # value numbers used (a list for PHI, else a tuple)
+        self.attr = attr   # constant, slot, operator, variable name, branch test or PHI blocks
+
+    def __repr__(self):
+        return f"Instruction({OPCODE_NAMES[self.opcode]}, {self.dest}, {self.args}, {self.attr!r})"
+
+class Block:
+    """A basic block: PHIs, straight-line instructions and one terminator."""
+
+    __slots__ = ('phis', 'instructions', 'terminator', 'successors', 'predecessors')
+
+    def __init__(self):
+        self.phis = []
+        self.instructions = []
+        self.terminator = None
+        self.successors = []
+        self.predecessors = []
+
+class DefUse:
+    """Where the values of a Program are defined and used, as it was when
+    the DefUse was built: owner maps every instruction (PHIs and
+    terminators included) to its block, definitions every value to the
+    instruction defining it and uses every value to the instructions using
+    it, in program order.
+    """
+
+    def __init__(self, program):
+        self.owner = owner = {}
+        self.definitions = definitions = {}
+        self.uses = uses = {}
+        for block in program.blocks:
+            for instruction in block.phis + block.instructions + [block.terminator]:
+                owner[instruction] = block
+                if instruction.dest is not None:
+                    definitions[instruction.dest] = instruction
+                for arg in instruction.args:
+                    users = uses.get(arg)
+                    if users is None:
+                        uses[arg] = [instruction]
+                    else:
+                        users.append(instruction)
+
+class Program:
+    """Three-address code in SSA form over a control-flow graph.
+
+    blocks[0] is the entry. Program variables live in the slots of an
+    Environment; names maps slot -> variable name.
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self.blocks = []
+        self.value_count = 0
+        self.analysis = None # the DefUse of def_use(), until the program changes
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def new_block(self):
+        block = Block()
+        self.blocks.append(block)
+        return block
+
+    def new_value(self):
+        self.value_count += 1
+        return self.value_count - 1
+
+    def instructions(self):
+        """Every instruction, PHIs and terminators included, in block order."""
+        for block in self.blocks:
+            yield from block.phis
+            yield from block.instructions
+            yield block.terminator
+
+    def definitions(self):
+        """value -> the instruction defining it."""
+        if self.analysis is not None:
+            return self.analysis.definitions
+        return {instruction.dest: instruction for instruction in self.instructions()
+                if instruction.dest is not None}
+
+    def def_use(self):
+        """The program's DefUse, built when there is none. Whoever changes
+        the program drops it (analysis = None); PassManager does so after
+        every pass that made changes."""
+        if self.analysis is None:
+            self.analysis = DefUse(self)
+        return self.analysis
+
+    def add_edge(self, block, successor):
+        block.successors.append(successor)
+        successor.predecessors.append(block)
+
+    def remove_edge(self, block, successor):
+        """Drop the edge block -> successor and the PHI operands it carried."""
+        block.successors.remove(successor)
+        index = successor.predecessors.index(block)
+        del successor.predecessors[index]
+        for phi in successor.phis:
+            del phi.args[index]
+            del phi.attr[index]
+
+    def remove_unreachable(self, reachable=None):
+        """Delete the blocks not in reachable (by default those the entry
+        cannot reach) and return how many there were."""
+        if reachable is None:
+            reachable = {self.entry}
+            stack = [self.entry]
+            while stack:
+                for successor in stack.pop().successors:
+                    if successor not in reachable:
+                        reachable.add(successor)
+                        stack.append(successor)
+        dead = [block for block in self.blocks if block not in reachable]
+        for block in dead:
+            for successor in list(block.successors):
+                self.remove_edge(block, successor)
+        if dead:
+            self.blocks = [block for block in self.blocks if block in reachable]
+            self.analysis = None
+        return len(dead)
+
+    def dump(self):
+        """The program as text, one instruction per line."""
+        labels = {block: f"b{index}" for index, block in enumerate(self.blocks)}
+        lines = []
+        for block in self.blocks:
+            header = f"{labels[block]}:"
+            if block.predecessors:
+                header += f"  ; preds {', '.join(labels[pred] for pred in block.predecessors)}"
+            lines.append(header)
+            for instruction in block.phis + block.instructions:
+                lines.append('    ' + self.format(instruction, labels))
+            lines.append('    ' + self.format(block.terminator, labels, block.successors))
+        return '\n'.join(lines)
+
+    def format(self, instruction, labels, successors=()):
+        opcode = instruction.opcode
+        args = [f"%{arg}" for arg in instruction.args]
+        attr = instruction.attr
+        if opcode == CONST:
+            text = f"const {attr!r}"
+        elif opcode == PARAM:
+            text = f"param {self.names[attr]}"
+        elif opcode == CHECK:
+            text = f"check {args[0]} ({attr})"
+        elif opcode in (INVALID, UNKNOWN):
+            text = f"{OPCODE_NAMES[opcode]} {attr!r}"
+        elif opcode in (BINARY, NUMBER):
+            text = f"{OPCODE_NAMES[opcode]} {args[0]} {attr} {args[1]}"
+        elif opcode == PHI:
+            text = 'phi ' + ', '.join(f"[{labels[block]}: {arg}]" for block, arg in zip(attr, args))
+        elif opcode == STORE:
+            text = f"store {self.names[attr]}, {args[0]}"
+        elif opcode == JUMP:
+            text = f"jump {labels[successors[0]]}"
+        elif opcode == BRANCH:
+            text = f"branch {attr} {args[0]}, {labels[successors[0]]}, {labels[successors[1]]}"
+        else:
+            text = f"{OPCODE_NAMES[opcode]} {', '.join(args)}".rstrip()
+        if instruction.dest is not None:
+            text = f"%{instruction.dest} = {text}"
+        return text
+
+class Lowering:
+    """Lowers a resolved AST to a Program.
+
+    Each AST node becomes the instructions that compute the value
+    Interpreter.eval would return for it. Program variables are tracked as
+    SSA values: reads use the value of the variable's last assignment, and
+    blocks where control flow joins get PHIs. Assignments are also stored
+    to the Environment right away, so its state matches the other engines
+    at every point. Reads of slots outside checked skip the
+    undefined-variable test.
+    """
+
+    def lower(self, node, names, checked):
+        self.program = Program(list(names))
+        self.checked = checked
+        self.constants = {}
+        self.header = []  # PARAMs and constants, placed at the top of the entry block
+        self.written = [] # (slot, previous value) of every change to variables, to undo branches
+        self.block = self.program.new_block()
+        self.variables = {slot: self.define(PARAM, attr=slot) for slot in range(len(names))}
+        result = self.lower_node(node)
+        self.terminate(RETURN, (result,))
+        self.program.entry.instructions[:0] = self.header
+        return self.program
+
+    def define(self, opcode, args=(), attr=None):
+        # An instruction of the entry block's header
+        instruction = Instruction(opcode, self.program.new_value(), args, attr)
+        self.header.append(instruction)
+        return instruction.dest
+
+    def emit(self, opcode, args=(), attr=None):
+        instruction = Instruction(opcode, self.program.new_value(), args, attr)
+        self.block.instructions.append(instruction)
+        return instruction.dest
+
+    def effect(self, opcode, args=(), attr=None):
+        self.block.instructions.append(Instruction(opcode, None, args, attr))
+
+    def constant(self, value):
+        # repr keeps 0.0 and -0.0 apart
+        key = (type(value), repr(value))
+        dest = self.constants.get(key)
+        if dest is None:
+            dest = self.constants[key] = self.define(CONST, attr=value)
+        return dest
+
+    def terminate(self, opcode, args=(), attr=None, successors=()):
+        self.block.terminator = Instruction(opcode, None, args, attr)
+        for successor in successors:
+            self.program.add_edge(self.block, successor)
+
+    def phi(self, values, blocks, target):
+        if all(value == values[0] for value in values):
+            return values[0]
+        instruction = Instruction(PHI, self.program.new_value(), list(values), list(blocks))
+        target.phis.append(instruction)
+        return instruction.dest
+
+    def assign(self, slot, value):
+        self.written.append((slot, self.variables[slot]))
+        self.variables[slot] = value
+
+    def undo(self, mark):
+        """Undo the changes to variables since len(written) was mark and
+        return the values they had left, by slot."""
+        changes = {slot: self.variables[slot] for slot, _ in self.written[mark:]}
+        for slot, value in reversed(self.written[mark:]):
+            self.variables[slot] = value
+        del self.written[mark:]
+        return changes
+
+    def merge(self, incoming):
+        """Join the (block, changes, result) paths into the current block
+        and return the joined result; changes maps the slots a path
+        assigned to their values at its end, the others keep theirs."""
+        blocks = [block for block, _, _ in incoming]
+        slots = set()
+        for _, changes, _ in incoming:
+            slots.update(changes)
+        for slot in slots:
+            current = self.variables[slot]
+            value = self.phi([changes.get(slot, current) for _, changes, _ in incoming], blocks, self.block)
+            if value != current:
+                self.assign(slot, value)
+        return self.phi([result for _, _, result in incoming], blocks, self.block)
+
+    def lower_node(self, node):
+        node_type = type(node)
+        if node_type is NumberNode:
+            value = number_value(node.value)
+            if value is None:
+                return self.emit(INVALID, attr=node.value)
+            return self.constant(value)
+
+        if node_type is VarNode:
+            value = self.variables[node.slot]
+            if node.slot in self.checked:
+                return self.emit(CHECK, (value,), node.name)
+            return value
+
+        if node_type is StringNode:
+            return self.constant(node.value)
+
+        if node_type is BinOpNode:
+            left = self.lower_node(node.left)
+            right = self.lower_node(node.right)
+            return self.emit(BINARY if node.type is None else NUMBER, (left, right), node.op)
+
+        if node_type is UnaryOpNode:
+            # Evaluated as 0 - x like the other engines
+            zero = self.constant(0)
+            operand = self.lower_node(node.operand)
+            return self.emit(BINARY if node.type is None else NUMBER, (zero, operand), node.op)
+
+        if node_type is AssignNode:
+            value = self.lower_node(node.value)
+            self.effect(STORE, (value,), node.slot)
+            # A failed value (None) leaves the variable as it was
+            self.assign(node.slot, self.emit(KEEP, (value, self.variables[node.slot])))
+            return value
+
+        if node_type is BlockNode:
+            result = self.constant(None)
+            for stmt in node.statements:
+                result = self.lower_node(stmt)
+            return result
+
+        if node_type is IfNode:
+            return self.lower_if(node)
+
+        if node_type is WhileNode:
+            return self.lower_while(node)
+
+        return self.emit(UNKNOWN, attr=node_type.__name__)
+
+    def lower_if(self, node):
+        program = self.program
+        condition = self.lower_node(node.condition)
+        start = self.block
+        test, then_block, else_block, end = (program.new_block() for _ in range(4))
+        # A failed condition (None) is itself the result of the if
+        self.terminate(BRANCH, (condition,), 'none', (end, test))
+        self.block = test
+        self.terminate(BRANCH, (condition,), 'positive', (then_block, else_block))
+
+        # Each branch is lowered on the variables as they are here and then
+        # undone, rather than on a copy, which would cost every variable
+        incoming = [(start, {}, self.constant(None))]
+        for block, branch in ((then_block, node.then_branch), (else_block, node.else_branch)):
+            self.block = block
+            mark = len(self.written)
+            result = self.lower_node(branch) if branch else self.constant(None)
+            incoming.append((self.block, self.undo(mark), result))
+            self.terminate(JUMP, successors=(end,))
+
+        self.block = end
+        return self.merge(incoming)
+
+    def lower_while(self, node):
+        program = self.program
+        assigned = _assigned_slots(node)
+        start = self.block
+        header, body, end = (program.new_block() for _ in range(3))
+        self.terminate(JUMP, successors=(header,))
+
+        # The loop's result and its iteration count are SSA values too; the
+        # back edge operands are added once the body is lowered
+        self.block = header
+        phis = {}
+        for slot in assigned:
+            phis[slot] = Instruction(PHI, program.new_value(), [self.variables[slot]], [start])
+            self.assign(slot, phis[slot].dest)
+        result = Instruction(PHI, program.new_value(), [self.constant(None)], [start])
+        count = Instruction(PHI, program.new_value(), [self.constant(0)], [start])
+        header.phis.extend(phis.values())
+        header.phis += [result, count]
+        condition = self.lower_node(node.condition)
+        after_condition = {slot: self.variables[slot] for slot in assigned}
+        self.terminate(BRANCH, (condition,), 'truthy', (body, end))
+
+        self.block = body
+        next_count = self.emit(NUMBER, (count.dest, self.constant(1)), '+')
+        self.effect(TICK, (next_count,))
+        value = self.lower_node(node.body)
+        self.effect(TRACE, (value,))
+        latch = self.block
+        self.terminate(JUMP, successors=(header,))
+        for slot, phi in phis.items():
+            phi.args.append(self.variables[slot])
+            phi.attr.append(latch)
+        result.args.append(value)
+        result.attr.append(latch)
+        count.args.append(next_count)
+        count.attr.append(latch)
+
+        self.block = end
+        return self.merge([(header, after_condition, result.dest)])
+
+def _assigned_slots(node):
+    slots = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is AssignNode:
+            slots.add(node.slot)
+        stack.extend(child_nodes(node))
+    return slots
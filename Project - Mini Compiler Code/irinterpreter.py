@@ -0,0 +1,160 @@
+from ir import (
+    Lowering, CONST, PARAM, CHECK, INVALID, BINARY, NUMBER, KEEP, COPY, STORE,
+    TRACE, TICK, JUMP, BRANCH, BRANCH_TESTS
+)
+from interpreter import Interpreter, UNCHECKED_OPS
+from passes import PassManager
+from resolver import UNSET
+from collector import collection_paused
+
+# run() tells BRANCH tests apart by their index: none, positive, truthy
+BRANCH_TEST_CODES = {test: code for code, test in enumerate(BRANCH_TESTS)}
+
+class IRInterpreter(Interpreter):
+    """Interpreter that lowers the AST to the SSA IR (ir.py), optimizes it
+    with the IR passes and runs the result.
+
+    Compiling costs much more than walking the tree once: on straight-line
+    code, lowering and the passes take several times as long as the tree
+    Interpreter takes to run the whole program (about 0.2 s against 0.03 s for
+    4000 statements). The engine only pays off for loop-heavy code, whose
+    compiled loop bodies run about twice as fast as the tree walker's.
+
+    The last compiled Program is kept in self.program and the pass
+    statistics in self.passes, for debugging and benchmarking.
+    """
+
+    def __init__(self, symbol_table, input_func=None, pipeline=None, governor=None, output=None):
+        super().__init__(symbol_table, input_func, governor, output)
+        self.passes = PassManager(pipeline)
+        self.program = None
+        self.compiled = None # (node, prepared entry block) of the last compile
+
+    def eval(self, node):
+        self.governor.start(self.env)
+        if self.compiled is None or self.compiled[0] is not node:
+            self.compiled = (node, self.compile(node))
+        entry = self.compiled[1]
+        try:
+            if entry is None:
+                # Too deeply nested to lower; the tree walker handles it
+                return self.execute(node)
+            return self.run(entry)
+        finally:
+            self.output.flush()
+
+    def compile(self, node):
+        """Lower and optimize node and return its entry block prepared for
+        run(), or None when the tree is nested deeper than the recursion
+        limit allows."""
+        checked = self.resolve(node)
+        # Lowering allocates several objects per node, none of them cyclic
+        # garbage; see ClosureInterpreter.compile
+        try:
+            with collection_paused():
+                self.program = Lowering().lower(node, self.env.names, checked)
+                self.passes.run(self.program)
+                return _prepare(self.program)
+        except RecursionError:
+            self.program = None
+            return None
+
+    def run(self, block):
+        registers = [None] * self.program.value_count
+        values = self.env.values
+        binary_op = self.binary_op
+        tick = self.governor.tick
+        trace = self.governor.trace
+        write = self.output.write
+        error = self.output.error
+
+        while True:
+            code, opcode, condition, test, targets = block
+            for op, dest, a, b, attr in code:
+                if op == NUMBER:
+                    registers[dest] = attr(registers[a], registers[b])
+                elif op == KEEP:
+                    value = registers[a]
+                    registers[dest] = registers[b] if value is None else value
+                elif op == STORE:
+                    value = registers[a]
+                    if value is not None:
+                        values[attr] = value
+                elif op == BINARY:
+                    registers[dest] = binary_op(attr, registers[a], registers[b])
+                elif op == CHECK:
+                    value = registers[a]
+                    if value is UNSET:
+                        error('semantic', f"Undefined variable '{attr}'")
+                        value = None
+                    registers[dest] = value
+                elif op == CONST:
+                    registers[dest] = attr
+                elif op == PARAM:
+                    registers[dest] = values[attr]
+                elif op == COPY:
+                    registers[dest] = registers[a]
+                elif op == TICK:
+                    tick(registers[a])
+                elif op == TRACE:
+                    if trace:
+                        write(f"Result: {registers[a]}")
+                elif op == INVALID:
+                    error('semantic', f"Invalid number '{attr}'")
+                    registers[dest] = None
+                else:
+                    error('runtime', f"Unknown AST node type: {attr}")
+                    registers[dest] = None
+
+            if opcode == JUMP:
+                block, dests, sources = targets[0]
+            elif opcode == BRANCH:
+                value = registers[condition]
+                if test == 0:
+                    taken = value is None
+                elif test == 1:
+                    # Custom truthiness rule: > 0 is true, <= 0 is false
+                    taken = value > 0
+                else:
+                    taken = value
+                block, dests, sources = targets[0] if taken else targets[1]
+            else:
+                return registers[condition]
+            if dests:
+                # PHIs read their operands before any of them is assigned
+                moved = [registers[source] for source in sources]
+                for dest, value in zip(dests, moved):
+                    registers[dest] = value
+
+def _prepare(program):
+    """Turn the Program into nested lists run() walks without attribute
+    lookups: each block becomes [code, opcode, condition, test, targets],
+    code a list of (op, dest, a, b, attr), and every target the prepared
+    successor with the PHI assignments of that edge."""
+    prepared = {block: [] for block in program.blocks}
+    for block, entry in prepared.items():
+        code = []
+        for instruction in block.instructions:
+            op = instruction.opcode
+            args = instruction.args
+            attr = instruction.attr
+            if op == NUMBER:
+                if attr == '/':
+                    op = BINARY # zero check and message of the checked operator
+                else:
+                    attr = UNCHECKED_OPS[attr]
+            a = args[0] if args else None
+            b = args[1] if len(args) > 1 else None
+            code.append((op, instruction.dest, a, b, attr))
+
+        terminator = block.terminator
+        targets = []
+        for successor in block.successors:
+            index = successor.predecessors.index(block)
+            dests = tuple(phi.dest for phi in successor.phis)
+            sources = tuple(phi.args[index] for phi in successor.phis)
+            targets.append((prepared[successor], dests, sources))
+        condition = terminator.args[0] if terminator.args else None
+        test = BRANCH_TEST_CODES.get(terminator.attr) if terminator.opcode == BRANCH else None
+        entry.extend((code, terminator.opcode, condition, test, targets))
+    return prepared[program.entry]
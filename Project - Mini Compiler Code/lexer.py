@@ -1,4 +1,10 @@
+import codecs
+import os
 import re
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum, auto
 
 class TokenType(Enum):
@@ -29,100 +35,485 @@ class TokenType(Enum):
     EOF = auto()
 
 class Token:
-    def __init__(self, type_, value):
+    __slots__ = ('type', 'value', 'pos', 'line', 'column')
+
+    def __init__(self, type_, value, pos=None, line=None, column=None):
         self.type = type_
         self.value = value
+        self.pos = pos # absolute offset of the first character in the source
+        self.line = line
+        self.column = column
 
     def __repr__(self):
         return f'Token({self.type}, {self.value})'
 
+# Chunk size used when streaming from files or memory-mapped buffers
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# A match is only trusted once this many characters follow it in the buffer,
+# so '<' can still grow into '<=' and '12' into '12.5' when the next chunk arrives
+LOOKAHEAD = 2
+
+# Target size of the pieces handed to worker processes by tokenize_parallel()
+PARALLEL_CHUNK_SIZE = 1024 * 1024
+
+KEYWORDS = frozenset({'if', 'else', 'then', 'while', 'do'})
+
+TOKEN_PATTERNS = {
+    'WHITESPACE': r'\s+',          
+    'STRING': r'"[^"\n]*"',        
+    'CHAR': r"'[^'\n]'",           
+    'BOOLEAN': r'\b(true|false)\b', 
+    'NUMBER': r'\d+(\.\d+)?',              
+    'IDENTIFIER': r'[a-zA-Z_]\w*', 
+    # Specific operators matching the new TokenType enum
+    'ASSIGN': r'=',
+    'PLUS': r'\+',
+    'MINUS': r'-',
+    'MULTIPLY': r'\*',
+    'DIVIDE': r'/',
+    'LE': r'<=', 
+    'GE': r'>=', 
+    'LT': r'<',  
+    'GT': r'>',  
+    'LPAREN': r'\(' ,              
+    'RPAREN': r'\)',               
+    'SEMICOLON': r';',             
+}
+
+# Sort patterns by length of regex string (descending) to prioritize longer matches
+# (e.g., '<=' must be matched before '<'). Built once at import time.
+_sorted_patterns = sorted(TOKEN_PATTERNS.items(), key=lambda item: len(item[1]), reverse=True)
+TOKEN_REGEX = re.compile('|'.join(f'(?P<{k}>{v})' for k, v in _sorted_patterns if v))
+
+# Regex group name -> token type (None for whitespace, which is skipped)
+_GROUP_TYPES = {name: (None if name == 'WHITESPACE' else TokenType[name]) for name in TOKEN_PATTERNS}
+
+def _scan_regex(text, pos, keywords):
+    """Yield (token type, lexeme, end) for consecutive tokens starting at pos.
+
+    Stops as soon as no token matches at the current position.
+    """
+    for match in TOKEN_REGEX.finditer(text, pos):
+        if match.start() != pos:
+            return
+        pos = match.end()
+        type_ = _GROUP_TYPES[match.lastgroup]
+        lexeme = match.group()
+        if type_ is TokenType.IDENTIFIER and lexeme in keywords:
+            type_ = TokenType.KEYWORD
+        yield type_, lexeme, pos
+
+# --- Table-driven backend -------------------------------------------------
+# The first character of a token selects its class through a lookup table;
+# operators dispatch straight to their TokenType and runs (digits, words,
+# whitespace) are finished with small precompiled patterns.
+
+_WS, _DIGIT, _ALPHA, _QUOTE, _APOSTROPHE, _OPERATOR, _COMPARE, _ILLEGAL = range(8)
+
+_OPERATOR_TYPES = {
+    '=': TokenType.ASSIGN,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    ';': TokenType.SEMICOLON,
+}
+# '<' and '>' may be followed by '=' to form a two-character operator
+_COMPARE_TYPES = {
+    '<': (TokenType.LT, TokenType.LE),
+    '>': (TokenType.GT, TokenType.GE),
+}
+_BOOLEANS = frozenset({'true', 'false'})
+
+def _classify(char):
+    if char.isspace():
+        return _WS
+    if char.isdecimal():
+        return _DIGIT
+    if char.isascii() and (char.isalpha() or char == '_'):
+        return _ALPHA
+    if char == '"':
+        return _QUOTE
+    if char == "'":
+        return _APOSTROPHE
+    if char in _OPERATOR_TYPES:
+        return _OPERATOR
+    if char in _COMPARE_TYPES:
+        return _COMPARE
+    return _ILLEGAL
+
+_ASCII_CLASSES = [_classify(chr(code)) for code in range(128)]
+
+_WS_RUN = re.compile(r'\s+')
+_NUMBER_RUN = re.compile(r'\d+(\.\d+)?')
+_WORD_RUN = re.compile(r'\w+')
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+def _scan_table(text, pos, keywords):
+    """Yield (token type, lexeme, end) for consecutive tokens starting at pos.
+
+    Stops as soon as no token matches at the current position.
+    """
+    size = len(text)
+    while pos < size:
+        char = text[pos]
+        code = ord(char)
+        cls = _ASCII_CLASSES[code] if code < 128 else _classify(char)
+
+        if cls == _OPERATOR:
+            yield _OPERATOR_TYPES[char], char, pos + 1
+            pos += 1
+            continue
+
+        if cls == _ALPHA:
+            end = _WORD_RUN.match(text, pos).end()
+            lexeme = text[pos:end]
+            if lexeme in keywords:
+                type_ = TokenType.KEYWORD
+            # Booleans need a word boundary in front, just like the regex backend
+            elif lexeme in _BOOLEANS and (pos == 0 or not _is_word(text[pos - 1])):
+                type_ = TokenType.BOOLEAN
+            else:
+                type_ = TokenType.IDENTIFIER
+        elif cls == _WS:
+            end = _WS_RUN.match(text, pos).end()
+            type_ = None
+            lexeme = text[pos:end]
+        elif cls == _DIGIT:
+            end = _NUMBER_RUN.match(text, pos).end()
+            type_ = TokenType.NUMBER
+            lexeme = text[pos:end]
+        elif cls == _COMPARE:
+            short, long = _COMPARE_TYPES[char]
+            if text.startswith('=', pos + 1):
+                type_, lexeme, end = long, text[pos:pos + 2], pos + 2
+            else:
+                type_, lexeme, end = short, char, pos + 1
+        elif cls == _QUOTE:
+            close = text.find('"', pos + 1)
+            if close == -1 or text.find('\n', pos + 1, close) != -1:
+                return
+            end = close + 1
+            type_ = TokenType.STRING
+            lexeme = text[pos:end]
+        elif cls == _APOSTROPHE:
+            if pos + 2 >= size or text[pos + 2] != "'" or text[pos + 1] in "'\n":
+                return
+            end = pos + 3
+            type_ = TokenType.CHAR
+            lexeme = text[pos:end]
+        else:
+            return
+
+        yield type_, lexeme, end
+        pos = end
+
+BACKENDS = {
+    'regex': _scan_regex,
+    'table': _scan_table,
+}
+DEFAULT_BACKEND = 'table'
+
+# Token types whose lexeme needs converting into the token value
+_VALUE_CONVERSIONS = {
+    TokenType.STRING: lambda lexeme: lexeme.strip('"'),
+    TokenType.CHAR: lambda lexeme: lexeme.strip("'"),
+    TokenType.BOOLEAN: lambda lexeme: int(lexeme == 'true'),
+}
+
+_STATEMENT_END = re.compile(r';[ \t\r\f\v]*\n')
+
+def split_statements(code, chunk_size):
+    """Return offsets [0, ..., len(code)] cutting code into pieces of roughly
+    chunk_size characters, each cut placed right after a line break."""
+    bounds = [0]
+    while len(code) - bounds[-1] > chunk_size:
+        target = bounds[-1] + chunk_size
+        match = _STATEMENT_END.search(code, target)
+        if match is not None:
+            cut = match.end()
+        else:
+            cut = code.find('\n', target) + 1
+            if cut == 0:
+                break
+        bounds.append(cut)
+    if bounds[-1] != len(code):
+        bounds.append(len(code))
+    return bounds
+
+def _tokenize_chunk(job):
+    # Runs in a worker process, so it has to be a module-level function
+    code, offset, backend, offset_code = job
+    types, starts, ends = array('B'), array(offset_code), array(offset_code)
+    Lexer(code, backend)._scan_spans(code, types, starts, ends, offset)
+    return types, starts, ends
+
 class Lexer:
-    def __init__(self, code):
+    def __init__(self, code, backend=DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown lexer backend '{backend}'. Expected one of: {', '.join(BACKENDS)}")
         self.code = code
-        self.keywords = {'if', 'else', 'then', 'while', 'do'}
+        self.keywords = KEYWORDS
+        self.backend = backend
+        self.source = None
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+
+    @classmethod
+    def from_file(cls, source, chunk_size=DEFAULT_CHUNK_SIZE, backend=DEFAULT_BACKEND):
+        """Create a lexer that streams from a path, a file object or an mmap.
+
+        The source is read lazily in chunks of chunk_size characters (or bytes,
+        decoded as UTF-8) when iter_tokens() is consumed.
+        """
+        lexer = cls(None, backend)
+        lexer.source = source
+        lexer.chunk_size = chunk_size
+        return lexer
 
     def tokenize(self):
-        patterns = {
-            'WHITESPACE': r'\s+',          
-            'STRING': r'"[^"\n]*"',        
-            'CHAR': r"'[^'\n]'",           
-            'BOOLEAN': r'\b(true|false)\b', 
-            'NUMBER': r'\d+(\.\d+)?',              
-            'IDENTIFIER': r'[a-zA-Z_]\w*', 
-            # Specific operators matching the new TokenType enum
-            'ASSIGN': r'=',
-            'PLUS': r'\+',
-            'MINUS': r'-',
-            'MULTIPLY': r'\*',
-            'DIVIDE': r'/',
-            'LE': r'<=', 
-            'GE': r'>=', 
-            'LT': r'<',  
-            'GT': r'>',  
-            'LPAREN': r'\(' ,              
-            'RPAREN': r'\)',               
-            'SEMICOLON': r';',             
-        }
-        
-        # Sort patterns by length of regex string (descending) to prioritize longer matches
-        # (e.g., '<=' must be matched before '<')
-        sorted_patterns = sorted(patterns.items(), key=lambda item: len(item[1]), reverse=True)
-        token_regex = '|'.join(f'(?P<{k}>{v})' for k, v in sorted_patterns if v)
-        
-        tokens = []
-        current_pos = 0 
-
-        for match in re.finditer(token_regex, self.code):
-            kind = match.lastgroup
-            value = match.group()
-            
-            if match.start() > current_pos:
-                raise SyntaxError(f"Illegal character: '{self.code[current_pos]}'"
-                                  f" at position {current_pos}")
-            
-            if kind == 'WHITESPACE':
-                pass 
-            elif kind == 'IDENTIFIER' and value in self.keywords:
-                tokens.append(Token(TokenType.KEYWORD, value))
-            elif kind == 'STRING':
-                tokens.append(Token(TokenType.STRING, value.strip('"')))
-            elif kind == 'CHAR':
-                tokens.append(Token(TokenType.CHAR, value.strip("'"))) 
-            elif kind == 'BOOLEAN':
-                tokens.append(Token(TokenType.BOOLEAN, int(value == 'true'))) 
-            elif kind == 'ASSIGN':
-                tokens.append(Token(TokenType.ASSIGN, value))
-            elif kind == 'PLUS':
-                tokens.append(Token(TokenType.PLUS, value))
-            elif kind == 'MINUS':
-                tokens.append(Token(TokenType.MINUS, value))
-            elif kind == 'MULTIPLY':
-                tokens.append(Token(TokenType.MULTIPLY, value))
-            elif kind == 'DIVIDE':
-                tokens.append(Token(TokenType.DIVIDE, value))
-            elif kind == 'LT':
-                tokens.append(Token(TokenType.LT, value))
-            elif kind == 'GT':
-                tokens.append(Token(TokenType.GT, value))
-            elif kind == 'LE':
-                tokens.append(Token(TokenType.LE, value))
-            elif kind == 'GE':
-                tokens.append(Token(TokenType.GE, value))
-            elif kind == 'LPAREN':
-                tokens.append(Token(TokenType.LPAREN, value))
-            elif kind == 'RPAREN':
-                tokens.append(Token(TokenType.RPAREN, value))
-            elif kind == 'SEMICOLON': 
-                tokens.append(Token(TokenType.SEMICOLON, value))
+        return list(self.iter_tokens())
+
+    def line_spans(self):
+        """Scan self.code, one line of source, for display: a list of (token
+        type, start, end), the type None for an illegal character.
+
+        No token can span a line break, so every line scans the same on its
+        own, without the lines before it. Scanning restarts after an illegal
+        character instead of raising.
+        """
+        code = self.code
+        scan = BACKENDS[self.backend]
+        spans = []
+        pos = 0
+        while pos < len(code):
+            for type_, lexeme, end in scan(code, pos, self.keywords):
+                if type_ is not None:
+                    spans.append((type_, pos, end))
+                pos = end
+            if pos < len(code):
+                spans.append((None, pos, pos + 1))
+                pos += 1
+        return spans
+
+    def tokenize_compact(self):
+        """Tokenize into a TokenStream instead of a list of Token objects."""
+        if self.code is None:
+            raise ValueError("tokenize_compact() needs the whole source in memory; use iter_tokens() when streaming")
+        code = self.code
+        stream = TokenStream(code)
+        self._scan_spans(code, stream.types, stream.starts, stream.ends)
+        stream.append_eof()
+        return stream
+
+    def tokenize_parallel(self, max_workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        """Tokenize a large source across a process pool into a TokenStream.
+
+        The source is cut after line breaks that follow a ';', which can never
+        fall inside a STRING or CHAR literal because neither may contain a
+        newline. Each chunk is scanned in a worker, positions are rebased onto
+        the whole source and a single EOF token is appended. The first error in
+        source order is raised with its absolute position.
+        """
+        if self.code is None:
+            raise ValueError("tokenize_parallel() needs the whole source in memory; use iter_tokens() when streaming")
+        code = self.code
+        bounds = split_statements(code, chunk_size)
+        if len(bounds) <= 2:
+            return self.tokenize_compact()
+
+        stream = TokenStream(code)
+        jobs = [(code[start:stop], start, self.backend, stream.starts.typecode)
+                for start, stop in zip(bounds, bounds[1:])]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for types, starts, ends in executor.map(_tokenize_chunk, jobs):
+                stream.types.extend(types)
+                stream.starts.extend(starts)
+                stream.ends.extend(ends)
+        stream.append_eof()
+        return stream
+
+    def _scan_spans(self, code, types, starts, ends, offset=0):
+        pos = 0
+        for type_, lexeme, end in BACKENDS[self.backend](code, 0, self.keywords):
+            if type_ is not None:
+                types.append(type_.value)
+                starts.append(offset + pos)
+                ends.append(offset + end)
+            pos = end
+        if pos < len(code):
+            raise SyntaxError(f"Illegal character: '{code[pos]}'"
+                              f" at position {offset + pos}")
+
+    def iter_tokens(self, start=0):
+        """Yield tokens lazily, ending with a single EOF token.
+
+        For in-memory code, scanning may begin at offset start (which must be
+        a token boundary); positions, lines and columns stay absolute.
+        """
+        if self.source is not None:
+            if start:
+                raise ValueError("iter_tokens() can only start mid-source for in-memory code")
+            return self._scan(self._read_chunks())
+        code = self.code
+        line = code.count('\n', 0, start) + 1
+        line_start = code.rfind('\n', 0, start) + 1
+        return self._scan((code,), start, line, line_start)
+
+    def _read_chunks(self):
+        source = self.source
+        owns_file = isinstance(source, (str, os.PathLike))
+        if owns_file:
+            source = open(source, encoding='utf-8', newline='')
+        decoder = None
+        try:
+            while True:
+                data = source.read(self.chunk_size)
+                if not data:
+                    break
+                if isinstance(data, bytes):
+                    # mmap objects and binary files hand out raw bytes
+                    if decoder is None:
+                        decoder = codecs.getincrementaldecoder('utf-8')()
+                    data = decoder.decode(data)
+                yield data
+            if decoder is not None:
+                yield decoder.decode(b'', final=True)
+        finally:
+            if owns_file:
+                source.close()
+
+    def _scan(self, chunks, pos=0, line=1, line_start=0):
+        # pos/line/line_start: where to begin within the first chunk;
+        # line_start is the absolute position of the first character of the current line
+        scan = BACKENDS[self.backend]
+        keywords = self.keywords
+        conversions = _VALUE_CONVERSIONS
+        chunks = iter(chunks)
+        buffer = ''
+        offset = 0 # absolute position of buffer[0]
+        final = False
+
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            elif not buffer:
+                buffer = chunk
+            else:
+                # Keep one character of context so word boundaries ('12true')
+                # are judged the same way as in a single-string scan
+                keep = max(pos - 1, 0)
+                buffer = buffer[keep:] + chunk
+                offset += keep
+                pos -= keep
+            limit = len(buffer) if final else len(buffer) - LOOKAHEAD
+
+            for type_, lexeme, end in scan(buffer, pos, keywords):
+                if end > limit:
+                    break
+                if type_ is None:
+                    if '\n' in lexeme:
+                        line += lexeme.count('\n')
+                        line_start = offset + pos + lexeme.rindex('\n') + 1
+                else:
+                    start = offset + pos
+                    convert = conversions.get(type_)
+                    yield Token(type_, lexeme if convert is None else convert(lexeme),
+                                start, line, start - line_start + 1)
+                pos = end
             else:
-                tokens.append(Token(TokenType[kind], value)) 
-            
-            current_pos = match.end() 
-        
-        if current_pos < len(self.code):
-            raise SyntaxError(f"Illegal character: '{self.code[current_pos]}'"
-                              f" at position {current_pos}")
+                if pos < len(buffer):
+                    # Only a quote can start a token that is still incomplete, and
+                    # literals never span lines, so anything else is a real error
+                    if final or buffer[pos] not in '"\'' or buffer.find('\n', pos) != -1:
+                        raise SyntaxError(f"Illegal character: '{buffer[pos]}'"
+                                          f" at position {offset + pos}")
+
+            if final:
+                break
+
+        end = offset + len(buffer)
+        yield Token(TokenType.EOF, '', end, line, end - line_start + 1)
+
+
+_TYPES_BY_CODE = {type_.value: type_ for type_ in TokenType}
+
+class TokenStream(Sequence):
+    """Compact token list backed by parallel arrays.
+
+    Only a one-byte type code and the start/end offsets into the source are
+    stored per token; values, lines and columns are derived on demand. Indexing
+    returns Token objects, so Parser accepts a TokenStream like a list, and the
+    stream also offers the current()/peek()/consume() cursor Parser uses.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        offset_code = 'I' if len(source) < 2 ** 32 else 'q'
+        self.types = array('B')
+        self.starts = array(offset_code)
+        self.ends = array(offset_code)
+        self.pos = 0
+        self._newlines = None
+        self._cached_index = -1
+        self._cached_token = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index == self._cached_index:
+            return self._cached_token
+        type_ = self.type_at(index)
+        line, column = self.location(index)
+        token = Token(type_, self.value_at(index), self.starts[index], line, column)
+        self._cached_index = index
+        self._cached_token = token
+        return token
+
+    def type_at(self, index):
+        return _TYPES_BY_CODE[self.types[index]]
+
+    def value_at(self, index):
+        type_ = self.type_at(index)
+        start, end = self.starts[index], self.ends[index]
+        if type_ is TokenType.STRING or type_ is TokenType.CHAR:
+            return self.source[start + 1:end - 1]
+        if type_ is TokenType.BOOLEAN:
+            return int(self.source.startswith('true', start))
+        return self.source[start:end]
+
+    def location(self, index):
+        """Return the (line, column) of the token at index."""
+        if self._newlines is None:
+            self._newlines = array('q', (match.start() for match in re.finditer('\n', self.source)))
+        start = self.starts[index]
+        line = bisect_right(self._newlines, start)
+        line_start = self._newlines[line - 1] + 1 if line else 0
+        return line + 1, start - line_start + 1
+
+    def append_eof(self):
+        self.types.append(TokenType.EOF.value)
+        self.starts.append(len(self.source))
+        self.ends.append(len(self.source))
+
+    def current(self):
+        return self.peek(0)
 
-        tokens.append(Token(TokenType.EOF, '')) 
-        return tokens
+    def peek(self, offset=1):
+        peek_pos = self.pos + offset
+        if peek_pos < len(self.types):
+            return self[peek_pos]
+        return Token(TokenType.EOF, None)
 
+    def consume(self):
+        self.pos += 1
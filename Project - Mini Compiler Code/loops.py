@@ -0,0 +1,383 @@
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from fractions import Fraction
+import itertools
+import math
+
+from flatast import walk, assigned_names
+from resolver import TEMPORARY_PREFIX
+from semantic import cannot_fail
+
+COMPARISONS = {
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+}
+
+class LoopOptimizer:
+    """Loop optimizations over WhileNode, run by the Optimizer at level 3.
+
+    Loop-invariant operators (no operand assigned anywhere in the loop) are
+    computed once before the loop into temporaries ($0, $1, ...). Only
+    operators the semantic analyzer typed as numeric are moved, since they
+    cannot print an error, which running them before the loop would expose.
+
+    A counting loop whose body only assigns linear induction variables
+    (i = i + c, with c an int literal) and invariant values, and whose
+    condition compares an induction variable of known start value against a
+    constant bound, is replaced by the assignments of its final state. A
+    traced loop prints every iteration ("Result: ..."), which an assignment
+    cannot reproduce, so this needs trace=False; loops that would run more
+    than max_iterations iterations are kept, for the engine's governor to
+    stop.
+    """
+
+    def __init__(self, trace=False, max_iterations=None):
+        self.trace = trace
+        self.max_iterations = max_iterations
+        self.changes = {}
+
+    def optimize(self, root):
+        self.changes = {
+            'invariants hoisted': 0,
+            'induction variables found': 0,
+            'loops replaced': 0,
+        }
+        self.names = temporary_names(root)
+        self.log = None # (name, previous value) of the changes to known to undo, inside a branch
+        return self.statement(root, {})
+
+    def statement(self, node, known):
+        """Optimize the loops in node. known maps the variables whose value
+        is a known number at this point, and is updated past node (through
+        learn(), so that branch() can undo it)."""
+        node_type = type(node)
+        if node_type is BlockNode:
+            statements = [self.statement(stmt, known) for stmt in node.statements]
+            if all(a is b for a, b in zip(statements, node.statements)):
+                return node
+            return BlockNode(statements)
+
+        if node_type is AssignNode:
+            self.forget(known, assigned_names(node.value))
+            self.learn(known, node.name, _constant(node.value))
+            return node
+
+        if node_type is IfNode:
+            then_branch = self.branch(node.then_branch, known)
+            else_branch = self.branch(node.else_branch, known) if node.else_branch else None
+            self.forget(known, assigned_names(node))
+            if then_branch is node.then_branch and else_branch is node.else_branch:
+                return node
+            return IfNode(node.condition, then_branch, else_branch)
+
+        if node_type is WhileNode:
+            assigned = assigned_names(node)
+            # Inside the loop only the variables it never assigns keep their value
+            body = self.branch(node.body, known, assigned)
+            loop = node if body is node.body else WhileNode(node.condition, body)
+            replaced = self.closed_form(loop, known)
+            if replaced is not None:
+                return replaced
+            self.forget(known, assigned)
+            return self.hoist(loop, assigned)
+
+        self.forget(known, assigned_names(node))
+        return node
+
+    def branch(self, node, known, unknown=()):
+        """Optimize the loops in node, which may not run, as statement()
+        does with the names in unknown forgotten, and leave known as it
+        was."""
+        outer, self.log = self.log, []
+        self.forget(known, unknown)
+        node = self.statement(node, known)
+        for name, value in reversed(self.log):
+            if value is None:
+                known.pop(name, None)
+            else:
+                known[name] = value
+        self.log = outer
+        return node
+
+    def learn(self, known, name, value):
+        """Record name's known value; None if it is not known."""
+        if self.log is not None:
+            self.log.append((name, known.get(name)))
+        if value is None:
+            known.pop(name, None)
+        else:
+            known[name] = value
+
+    def forget(self, known, names):
+        for name in names:
+            if name in known:
+                self.learn(known, name, None)
+
+    def hoist(self, loop, assigned):
+        """loop with its invariant operators computed before it, or loop
+        itself when there are none."""
+        temporaries = []
+        condition = self.hoist_expression(loop.condition, assigned, temporaries)
+        body = self.hoist_statement(loop.body, assigned, temporaries)
+        if not temporaries:
+            return loop
+        self.changes['invariants hoisted'] += len(temporaries)
+        # The block's result is the loop's, its last statement
+        return BlockNode(temporaries + [WhileNode(condition, body)])
+
+    def hoist_statement(self, node, assigned, temporaries):
+        node_type = type(node)
+        if node_type is BlockNode:
+            statements = [self.hoist_statement(stmt, assigned, temporaries) for stmt in node.statements]
+            if all(a is b for a, b in zip(statements, node.statements)):
+                return node
+            return BlockNode(statements)
+
+        if node_type is IfNode:
+            condition = self.hoist_expression(node.condition, assigned, temporaries)
+            then_branch = self.hoist_statement(node.then_branch, assigned, temporaries)
+            else_branch = self.hoist_statement(node.else_branch, assigned, temporaries) if node.else_branch else None
+            if (condition is node.condition and then_branch is node.then_branch
+                    and else_branch is node.else_branch):
+                return node
+            return IfNode(condition, then_branch, else_branch)
+
+        if node_type is WhileNode:
+            condition = self.hoist_expression(node.condition, assigned, temporaries)
+            body = self.hoist_statement(node.body, assigned, temporaries)
+            if condition is node.condition and body is node.body:
+                return node
+            return WhileNode(condition, body)
+
+        return self.hoist_expression(node, assigned, temporaries)
+
+    def hoist_expression(self, node, assigned, temporaries):
+        node, invariant = self.invariant_parts(node, assigned, temporaries)
+        return self.temporary(node, temporaries) if invariant else node
+
+    def invariant_parts(self, node, assigned, temporaries):
+        """Return (node, invariant): node with its maximal invariant
+        operators replaced by temporaries, unless node is invariant as a
+        whole, in which case it is returned unchanged."""
+        node_type = type(node)
+        if node_type is NumberNode or node_type is StringNode:
+            return node, True
+        if node_type is VarNode:
+            return node, node.name not in assigned
+
+        if node_type is BinOpNode:
+            left, left_invariant = self.invariant_parts(node.left, assigned, temporaries)
+            right, right_invariant = self.invariant_parts(node.right, assigned, temporaries)
+            if left_invariant and right_invariant and cannot_fail(node):
+                return node, True
+            if left_invariant:
+                left = self.temporary(left, temporaries)
+            if right_invariant:
+                right = self.temporary(right, temporaries)
+            if left is node.left and right is node.right:
+                return node, False
+            return _typed(BinOpNode(left, node.op, right), node.type), False
+
+        if node_type is UnaryOpNode:
+            operand, invariant = self.invariant_parts(node.operand, assigned, temporaries)
+            if invariant and cannot_fail(node):
+                return node, True
+            if invariant:
+                operand = self.temporary(operand, temporaries)
+            if operand is node.operand:
+                return node, False
+            return _typed(UnaryOpNode(node.op, operand), node.type), False
+
+        if node_type is AssignNode:
+            value = self.hoist_expression(node.value, assigned, temporaries)
+            return (node if value is node.value else AssignNode(node.name, value)), False
+
+        return node, False
+
+    def temporary(self, node, temporaries):
+        # Leaves are as cheap to read as a temporary
+        if type(node) is not BinOpNode and type(node) is not UnaryOpNode:
+            return node
+        for temporary in temporaries:
+            if _same(temporary.value, node):
+                return VarNode(temporary.name)
+        name = next(self.names)
+        temporaries.append(AssignNode(name, node))
+        return VarNode(name)
+
+    def closed_form(self, loop, known):
+        """The statements loop amounts to, or None when it is not a
+        counting loop with a computable trip count."""
+        if self.trace:
+            return None
+        body = loop.body.statements if type(loop.body) is BlockNode else [loop.body]
+        if not body or any(type(stmt) is not AssignNode for stmt in body):
+            return None
+        assigned = {stmt.name for stmt in body}
+        if len(assigned) != len(body):
+            return None
+
+        steps = {} # induction variable -> step per iteration
+        for stmt in body:
+            step = _induction_step(stmt)
+            if step is not None:
+                steps[stmt.name] = step
+            elif not _safe_invariant(stmt.value, assigned, known):
+                return None
+
+        condition = loop.condition
+        if type(condition) is not BinOpNode or condition.op not in COMPARISONS or condition.type is None:
+            return None
+        values = {name: known[name] for name in steps if type(known.get(name)) is int}
+        left = _operand(condition.left, values, assigned, known)
+        right = _operand(condition.right, values, assigned, known)
+        if left is None or right is None:
+            return None
+
+        count = _trip_count(COMPARISONS[condition.op], left, right, values, steps, self.max_iterations)
+        if count is None:
+            return None # runs forever, or past max_iterations for the governor to stop
+        for name in values:
+            values[name] += steps[name] * count
+
+        self.changes['loops replaced'] += 1
+        self.changes['induction variables found'] += len(steps)
+        if count == 0:
+            return BlockNode([]) # the loop yields None
+        statements = []
+        for stmt in body:
+            if stmt.name in values:
+                statements.append(AssignNode(stmt.name, NumberNode(values[stmt.name])))
+                self.learn(known, stmt.name, values[stmt.name])
+            elif stmt.name in steps:
+                step = _typed(BinOpNode(VarNode(stmt.name), '+', NumberNode(steps[stmt.name] * count)), 'int')
+                statements.append(AssignNode(stmt.name, step))
+                self.learn(known, stmt.name, None)
+            else:
+                statements.append(stmt)
+                self.learn(known, stmt.name, _constant(stmt.value))
+        # The last assignment is the value of the final iteration
+        return BlockNode(statements)
+
+def temporary_names(root, prefix=TEMPORARY_PREFIX):
+    """Names for the temporaries an optimization pass adds to root: prefix
+    followed by 0, 1, ... from after the highest such name root already
+    has. Optimizing a tree twice thus never gives two values the same name,
+    and optimizing equal trees gives equal names. root is scanned when the
+    first name is taken."""
+    numbers = [-1]
+    for node in walk(root):
+        if type(node) in (AssignNode, VarNode) and node.name.startswith(prefix):
+            number = node.name[len(prefix):]
+            if number.isdigit():
+                numbers.append(int(number))
+    for number in itertools.count(max(numbers) + 1):
+        yield f"{prefix}{number}"
+
+def _typed(node, type_):
+    node.type = type_
+    return node
+
+def _same(a, b):
+    # Structural equality of expressions
+    if type(a) is not type(b):
+        return False
+    if type(a) is BinOpNode:
+        return a.op == b.op and _same(a.left, b.left) and _same(a.right, b.right)
+    if type(a) is UnaryOpNode:
+        return a.op == b.op and _same(a.operand, b.operand)
+    if type(a) is VarNode:
+        return a.name == b.name
+    if type(a) is NumberNode:
+        left, right = number_value(a.value), number_value(b.value)
+        if left is None or right is None:
+            return a.value == b.value
+        # repr keeps 0.0 and -0.0 apart
+        return repr(left) == repr(right)
+    return type(a) is StringNode and a.value == b.value
+
+def _constant(node):
+    if type(node) is NumberNode:
+        value = number_value(node.value)
+        if type(value) in (int, float):
+            return value
+    return None
+
+def _safe_invariant(node, assigned, known):
+    """Whether node always evaluates to the same value without printing."""
+    node_type = type(node)
+    if node_type is NumberNode:
+        return _constant(node) is not None
+    if node_type is StringNode:
+        return True
+    if node_type is VarNode:
+        return node.name in known and node.name not in assigned
+    if node_type is BinOpNode or node_type is UnaryOpNode:
+        return cannot_fail(node) and not (assigned_names(node) or _read_names(node) & assigned)
+    return False
+
+def _induction_step(stmt):
+    # i = i + c, i = c + i or i = i - c with an int literal c, typed as int
+    value = stmt.value
+    if type(value) is not BinOpNode or value.type != 'int' or value.op not in ('+', '-'):
+        return None
+    left, right = value.left, value.right
+    if type(left) is VarNode and left.name == stmt.name and type(right) is NumberNode:
+        step = number_value(right.value)
+        if type(step) is int:
+            return step if value.op == '+' else -step
+    if value.op == '+' and type(right) is VarNode and right.name == stmt.name and type(left) is NumberNode:
+        step = number_value(left.value)
+        if type(step) is int:
+            return step
+    return None
+
+def _operand(node, values, assigned, known):
+    """('var', name) for an induction variable with a known value,
+    ('const', value) for a number that is fixed during the loop."""
+    if type(node) is VarNode:
+        if node.name in values:
+            return ('var', node.name)
+        if node.name in assigned or node.name not in known:
+            return None
+        return ('const', known[node.name])
+    value = _constant(node)
+    return None if value is None else ('const', value)
+
+def _trip_count(compare, left, right, values, steps, max_iterations=None):
+    """How many iterations a loop runs whose condition is compare(left,
+    right) on the _operand()s, with the induction variables starting at
+    values; None if it never ends or would run more than max_iterations."""
+    def side(operand):
+        kind, value = operand
+        return values[value] if kind == 'var' else value
+
+    def step(operand):
+        kind, value = operand
+        return steps[value] if kind == 'var' else 0
+
+    if not compare(side(left), side(right)):
+        return 0
+    if any(type(side(operand)) is float and not math.isfinite(side(operand)) for operand in (left, right)):
+        return None # an infinite bound is never reached
+    delta = step(left) - step(right)
+    if delta == 0 or compare(delta, 0):
+        return None # the difference never leaves the range where compare holds
+    # Python compares ints and floats exactly, so the difference is taken
+    # exactly too: the loop runs until start + delta * count stops
+    # comparing with 0 the way the condition requires
+    start = Fraction(side(left)) - Fraction(side(right))
+    if compare(0, 0):
+        count = math.floor(-start / delta) + 1
+    else:
+        count = math.ceil(-start / delta)
+    if max_iterations is not None and count > max_iterations:
+        return None # the governor stops it
+    return count
+
+def _read_names(node):
+    return {found.name for found in walk(node) if type(found) is VarNode}
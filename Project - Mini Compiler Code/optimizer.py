@@ -0,0 +1,196 @@
+from parser import (
+    NumberNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from flatast import child_nodes
+from loops import LoopOptimizer
+from cse import CommonSubexpressions
+from governor import ExecutionGovernor
+
+# Optimization levels:
+#   0  no changes
+#   1  pre-convert numeric literals, turn the parser's 0 - x / 0 + x into UnaryOpNode
+#   2  level 1 plus constant folding and removal of branches that can never run
+#   3  level 2 plus loop optimizations and common-subexpression elimination
+OPTIMIZATION_LEVELS = (0, 1, 2, 3)
+DEFAULT_LEVEL = 3
+
+class Optimizer:
+    """AST-to-AST optimizer run between semantic analysis and execution.
+
+    optimize() returns a new tree and leaves the input untouched (nodes may
+    be shared). Anything that would print a diagnostic at runtime (invalid
+    literals, division by zero, string operands) is left for the engine to
+    report. The changes made by the last call are counted in self.changes.
+
+    governor is the ExecutionGovernor the program will run under: loops are
+    only replaced when they are not traced and stay within its budgets (a
+    replaced loop's iterations no longer count as steps).
+    """
+
+    def __init__(self, level=DEFAULT_LEVEL, governor=None):
+        if level not in OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown optimization level {level}. Expected one of: {', '.join(map(str, OPTIMIZATION_LEVELS))}")
+        self.level = level
+        self.governor = governor if governor is not None else ExecutionGovernor()
+        self.changes = {}
+
+    def optimize(self, root):
+        self.changes = {
+            'literals converted': 0,
+            'negations collapsed': 0,
+            'constants folded': 0,
+            'dead branches removed': 0,
+        }
+        governor = self.governor
+        budgets = [limit for limit in (governor.max_iterations, governor.max_steps) if limit is not None]
+        loops = LoopOptimizer(trace=governor.trace, max_iterations=min(budgets, default=None))
+        if self.level == 0:
+            return root
+
+        optimized = {} # id(node) -> optimized node; shared subtrees stay shared
+        # Iterative post-order walk so deep trees do not hit the recursion limit
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in optimized:
+                continue
+            children = child_nodes(node)
+            if not expanded and children:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+            optimized[id(node)] = self.optimize_node(node, optimized)
+        root = optimized[id(root)]
+        if self.level >= 3:
+            root = loops.optimize(root)
+            self.changes.update(loops.changes)
+            cse = CommonSubexpressions()
+            root = cse.optimize(root)
+            self.changes.update(cse.changes)
+        return root
+
+    def optimize_node(self, node, optimized):
+        node_type = type(node)
+
+        if node_type is NumberNode:
+            if isinstance(node.value, str):
+                value = number_value(node.value)
+                if value is not None:
+                    self.changes['literals converted'] += 1
+                    return NumberNode(value)
+            return node
+
+        if node_type is BinOpNode:
+            left = optimized[id(node.left)]
+            right = optimized[id(node.right)]
+            if node.op in ('+', '-') and type(left) is NumberNode and type(left.value) is int and left.value == 0:
+                self.changes['negations collapsed'] += 1
+                return self.fold_unary(_typed(UnaryOpNode(node.op, right), node.type))
+            if self.level >= 2 and _is_constant(left) and _is_constant(right):
+                value = _fold(node.op, left.value, right.value)
+                if value is not None:
+                    self.changes['constants folded'] += 1
+                    return NumberNode(value)
+            if left is node.left and right is node.right:
+                return node
+            return _typed(BinOpNode(left, node.op, right), node.type)
+
+        if node_type is UnaryOpNode:
+            operand = optimized[id(node.operand)]
+            if operand is not node.operand:
+                node = _typed(UnaryOpNode(node.op, operand), node.type)
+            return self.fold_unary(node)
+
+        if node_type is AssignNode:
+            value = optimized[id(node.value)]
+            return node if value is node.value else AssignNode(node.name, value)
+
+        if node_type is IfNode:
+            condition = optimized[id(node.condition)]
+            then_branch = optimized[id(node.then_branch)]
+            else_branch = optimized[id(node.else_branch)] if node.else_branch else None
+            if self.level >= 2 and _is_constant(condition):
+                self.changes['dead branches removed'] += 1
+                # Custom truthiness rule: > 0 is true, <= 0 is false
+                if condition.value > 0:
+                    return then_branch
+                return else_branch if else_branch else BlockNode([])
+            if (condition is node.condition and then_branch is node.then_branch
+                    and else_branch is node.else_branch):
+                return node
+            return IfNode(condition, then_branch, else_branch)
+
+        if node_type is WhileNode:
+            condition = optimized[id(node.condition)]
+            body = optimized[id(node.body)]
+            if self.level >= 2 and (_is_constant(condition) or type(condition) is StringNode) and not condition.value:
+                # The loop never runs and yields None, like an empty block
+                self.changes['dead branches removed'] += 1
+                return BlockNode([])
+            if condition is node.condition and body is node.body:
+                return node
+            return WhileNode(condition, body)
+
+        if node_type is BlockNode:
+            statements = [optimized[id(stmt)] for stmt in node.statements]
+            # An empty block only matters as the last statement, where it is the result
+            kept = [stmt for i, stmt in enumerate(statements)
+                    if i == len(statements) - 1 or not _is_empty_block(stmt)]
+            if len(kept) == len(node.statements) and all(a is b for a, b in zip(kept, node.statements)):
+                return node
+            return BlockNode(kept)
+
+        return node
+
+    def fold_unary(self, node):
+        if self.level >= 2 and _is_constant(node.operand):
+            value = _fold(node.op, 0, node.operand.value)
+            if value is not None:
+                self.changes['constants folded'] += 1
+                return NumberNode(value)
+        return node
+
+    def report(self):
+        """The changes of the last optimize() call as readable lines."""
+        if self.level == 0:
+            return ["Optimizer disabled (level 0)"]
+        lines = [f"{count} {change}" for change, count in self.changes.items() if count]
+        return lines or ["No changes"]
+
+def _typed(node, type_):
+    # Rewritten operators keep the semantic analyzer's annotation: their
+    # operands evaluate to the same values as before
+    node.type = type_
+    return node
+
+def _is_constant(node):
+    # Only numbers are folded: operations on strings are runtime errors
+    return type(node) is NumberNode and type(node.value) in (int, float)
+
+def _is_empty_block(node):
+    return type(node) is BlockNode and not node.statements
+
+def _fold(op, left, right):
+    """Compute op like Interpreter.binary_op, or None when the operation
+    would report an error at runtime and must be left to the engine."""
+    try:
+        if op == '+':
+            return left + right
+        elif op == '-':
+            return left - right
+        elif op == '*':
+            return left * right
+        elif op == '/':
+            return left / right if right != 0 else None
+        elif op == '<':
+            return int(left < right)
+        elif op == '>':
+            return int(left > right)
+        elif op == '<=':
+            return int(left <= right)
+        elif op == '>=':
+            return int(left >= right)
+    except ArithmeticError:
+        return None
+    return None
@@ -0,0 +1,110 @@
+import sys
+
+# Line prefix of each diagnostic kind
+DIAGNOSTIC_PREFIXES = {
+    'semantic': 'Semantic Error',
+    'runtime': 'Runtime Error',
+}
+
+# Lines an OutputSink collects before handing them on in one batch
+BATCH_LINES = 256
+
+class Diagnostic:
+    """An error an engine reported while running: kind ('semantic' or
+    'runtime'), the message and the AST node it concerns (None when the
+    engine no longer knows it)."""
+
+    __slots__ = ('kind', 'message', 'node')
+
+    def __init__(self, kind, message, node=None):
+        self.kind = kind
+        self.message = message
+        self.node = node
+
+    def __str__(self):
+        return f"{DIAGNOSTIC_PREFIXES[self.kind]}: {self.message}"
+
+    def __repr__(self):
+        return f"Diagnostic({self.kind!r}, {self.message!r})"
+
+class OutputSink:
+    """Where an engine's output goes, instead of print().
+
+    write() takes a line of output, error() reports a Diagnostic, which is
+    kept in self.diagnostics and written as its usual line. Lines are
+    collected and handed to emit() batch_lines at a time, and whatever is
+    left when flush() is called (engines flush at the end of every run).
+    With max_chars set, output stops after that many characters: one
+    notice line is written, and later lines and diagnostics are only
+    counted in self.dropped.
+
+    Subclasses implement emit(text), text being whole lines each ending
+    with a newline.
+    """
+
+    def __init__(self, batch_lines=BATCH_LINES, max_chars=None):
+        self.batch_lines = batch_lines
+        self.max_chars = max_chars
+        self.pending = []
+        self.diagnostics = []
+        self.chars = 0
+        self.dropped = 0
+
+    def write(self, line):
+        if self.max_chars is not None:
+            if self.chars >= self.max_chars:
+                self.dropped += 1
+                return
+            self.chars += len(line) + 1
+            if self.chars >= self.max_chars:
+                line += f"\n[Output truncated at {self.max_chars} characters]"
+        self.pending.append(line)
+        if len(self.pending) >= self.batch_lines:
+            self.flush()
+
+    def error(self, kind, message, node=None):
+        diagnostic = Diagnostic(kind, message, node)
+        if self.max_chars is None or self.chars < self.max_chars:
+            self.diagnostics.append(diagnostic)
+        self.write(str(diagnostic))
+
+    def flush(self):
+        if self.pending:
+            text = '\n'.join(self.pending) + '\n'
+            self.pending = []
+            self.emit(text)
+
+    def emit(self, text):
+        raise NotImplementedError
+
+class StdoutSink(OutputSink):
+    """Writes to sys.stdout as it is at the time of each batch."""
+
+    def emit(self, text):
+        sys.stdout.write(text)
+
+class CaptureSink(OutputSink):
+    """Keeps the output in memory, for getvalue() or to replay() into
+    another sink in order with the diagnostics."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries = [] # lines, and Diagnostics in place of their lines
+
+    def write(self, line):
+        self.entries.append(line)
+
+    def error(self, kind, message, node=None):
+        diagnostic = Diagnostic(kind, message, node)
+        self.diagnostics.append(diagnostic)
+        self.entries.append(diagnostic)
+
+    def getvalue(self):
+        return ''.join(f"{entry}\n" for entry in self.entries)
+
+    def replay(self, sink):
+        for entry in self.entries:
+            if type(entry) is Diagnostic:
+                sink.error(entry.kind, entry.message, entry.node)
+            else:
+                sink.write(entry)
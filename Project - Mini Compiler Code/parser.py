@@ -1,29 +1,77 @@
+from collections import deque
+from collections.abc import Sequence
+import time
+
 from lexer import TokenType, Token # Ensure Token is also imported from lexer
 
-class ASTNode: pass
+class ASTNode:
+    # Every node declares __slots__ so large trees carry no per-node __dict__.
+    # Leaves (NumberNode, VarNode, StringNode) may be shared between several
+    # parents when the parser interns them, so treat nodes as immutable; the
+    # only exceptions are the variable slots the resolver records and the
+    # operator types the semantic analyzer records.
+    __slots__ = ()
 
 class NumberNode(ASTNode):
+    __slots__ = ('value',)
     def __init__(self, value): self.value = value
     def __repr__(self): return f"Number({self.value})"
 
+def number_value(value):
+    """The runtime value of a numeric literal, or None if it is invalid.
+    Values the optimizer has already converted are returned as they are."""
+    if not isinstance(value, str):
+        return value
+    try:
+        # Try float first
+        num = float(value)
+    except ValueError:
+        return None
+    # Convert to int if it has no decimal part
+    return int(num) if num.is_integer() else num
+
 class VarNode(ASTNode):
-    def __init__(self, name): self.name = name
+    # slot is the variable's storage index, recorded by the resolver
+    __slots__ = ('name', 'slot')
+    def __init__(self, name):
+        self.name = name
+        self.slot = None
     def __repr__(self): return f"Var({self.name})"
 
 class BinOpNode(ASTNode):
+    # type is the result type the semantic analyzer proved, set only when
+    # both operands are known to be numbers that are always present
+    __slots__ = ('left', 'op', 'right', 'type')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.type = None
     def __repr__(self): return f"BinOp({self.left} {self.op} {self.right})"
 
+class UnaryOpNode(ASTNode):
+    # Produced by the optimizer from the parser's 0 - x / 0 + x encoding
+    __slots__ = ('op', 'operand', 'type')
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+        self.type = None
+    def __repr__(self): return f"UnaryOp({self.op}{self.operand})"
+
 class AssignNode(ASTNode):
+    __slots__ = ('name', 'value', 'slot')
+
     def __init__(self, name, value):
         self.name = name
         self.value = value
+        self.slot = None
     def __repr__(self): return f"Assign({self.name} = {self.value})"
 
 class IfNode(ASTNode):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+
     def __init__(self, condition, then_branch, else_branch):
         self.condition = condition
         self.then_branch = then_branch
@@ -33,39 +81,77 @@ class IfNode(ASTNode):
                (f", Else: {self.else_branch})" if self.else_branch else ")")
 
 class WhileNode(ASTNode):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
     def __repr__(self): return f"While({self.condition}, Do: {self.body})"
 
 class BlockNode(ASTNode):
+    __slots__ = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
     def __repr__(self): return f"Block({self.statements})"
 
 class StringNode(ASTNode):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
     def __repr__(self): return f"String('{self.value}')"
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
+    def __init__(self, tokens, intern_leaves=True):
         self.pos = 0
+        # (node class, value type, value) -> shared leaf node
+        self.leaves = {} if intern_leaves else None
+        if isinstance(tokens, Sequence):
+            self.tokens = tokens
+            self.stream = None
+        else:
+            # Streaming mode (e.g. Lexer.iter_tokens()): only the lookahead window
+            # is kept in memory and self.tokens[0] is the token at position self.base
+            self.tokens = deque()
+            self.stream = iter(tokens)
+            self.base = 0
 
     def current(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return Token(TokenType.EOF, None) 
+        return self.peek(0)
 
     def peek(self, offset=1):
         peek_pos = self.pos + offset
+        if self.stream is not None:
+            peek_pos -= self.base
+            while len(self.tokens) <= peek_pos:
+                token = next(self.stream, None)
+                if token is None:
+                    return Token(TokenType.EOF, None)
+                self.tokens.append(token)
         if peek_pos < len(self.tokens):
             return self.tokens[peek_pos]
         return Token(TokenType.EOF, None)
 
     def consume(self):
         self.pos += 1
+        if self.stream is not None:
+            while self.base < self.pos:
+                if self.tokens:
+                    self.tokens.popleft()
+                else:
+                    next(self.stream, None)
+                self.base += 1
+
+    def leaf(self, node_class, value):
+        """Return a leaf node, reusing an identical earlier one when interning."""
+        if self.leaves is None:
+            return node_class(value)
+        key = (node_class, type(value), value)
+        node = self.leaves.get(key)
+        if node is None:
+            node = self.leaves[key] = node_class(value)
+        return node
 
     def match(self, expected_type, expected_value=None):
         token = self.current()
@@ -167,7 +253,7 @@ class Parser:
             self.consume()            
             op = op_token.value       
             right = self.parse_factor() 
-            return BinOpNode(NumberNode(0), op, right) 
+            return BinOpNode(self.leaf(NumberNode, 0), op, right) 
         
         node = self.parse_atom()
         while self.current().type in (TokenType.MULTIPLY, TokenType.DIVIDE):
@@ -182,19 +268,19 @@ class Parser:
         token = self.current()
         if token.type == TokenType.NUMBER:
             self.consume()
-            return NumberNode(token.value)
+            return self.leaf(NumberNode, token.value)
         elif token.type == TokenType.IDENTIFIER:
             self.consume()
-            return VarNode(token.value)
+            return self.leaf(VarNode, token.value)
         elif token.type == TokenType.STRING:
             self.consume()
-            return StringNode(token.value)
+            return self.leaf(StringNode, token.value)
         elif token.type == TokenType.BOOLEAN:
             self.consume()
-            return NumberNode(token.value)
+            return self.leaf(NumberNode, token.value)
         elif token.type == TokenType.CHAR:
             self.consume()
-            return StringNode(token.value)
+            return self.leaf(StringNode, token.value)
         elif token.type == TokenType.LPAREN:
             self.consume()
             node = self.parse_expression()
@@ -203,3 +289,188 @@ class Parser:
         
         raise SyntaxError(f"Unexpected token in expression: {token} at position {self.pos}")
 
+
+
+# Binary operators for PrattParser: token type -> (precedence, right associative)
+BINARY_OPERATORS = {
+    TokenType.ASSIGN: (1, True),
+    TokenType.LT: (2, False),
+    TokenType.GT: (2, False),
+    TokenType.LE: (2, False),
+    TokenType.GE: (2, False),
+    TokenType.PLUS: (3, False),
+    TokenType.MINUS: (3, False),
+    TokenType.MULTIPLY: (4, False),
+    TokenType.DIVIDE: (4, False),
+}
+# A prefix '+'/'-' applies to a whole factor, so it binds tighter than '+'/'-'
+# but looser than '*'/'/'
+UNARY_PRECEDENCE = 3.5
+# Operands that follow '*' or '/' must be plain atoms (no prefix sign)
+ATOM_ONLY_PRECEDENCE = 4
+
+ATOM_NODES = {
+    TokenType.NUMBER: NumberNode,
+    TokenType.IDENTIFIER: VarNode,
+    TokenType.STRING: StringNode,
+    TokenType.BOOLEAN: NumberNode,
+    TokenType.CHAR: StringNode,
+}
+
+class PrattParser(Parser):
+    """Table-driven parser that keeps its own stacks instead of recursing.
+
+    Builds the same trees as Parser, but nesting depth (parentheses, prefix
+    signs, if/while/else-if chains) is limited only by memory.
+    """
+
+    def parse_statement(self):
+        # Pending constructs: ('while', condition, via_statement),
+        # ('if', condition, via_statement) or ('else', condition, then_branch, via_statement).
+        # via_statement records whether the construct was entered through
+        # parse_statement (and so swallows a trailing ';') or as an 'else if'.
+        frames = []
+        via_statement = True
+        while True:
+            token = self.current()
+            if token.type == TokenType.KEYWORD:
+                if token.value == 'if':
+                    self.consume()
+                    condition = self.parse_expression()
+                    self.match(TokenType.KEYWORD, 'then')
+                    frames.append(('if', condition, via_statement))
+                    via_statement = True
+                    continue
+                if token.value == 'while':
+                    self.consume()
+                    condition = self.parse_expression()
+                    self.match(TokenType.KEYWORD, 'do')
+                    frames.append(('while', condition, via_statement))
+                    via_statement = True
+                    continue
+                raise SyntaxError(f"Unexpected keyword: {token} at position {self.pos}")
+
+            node = self.parse_expression()
+            completed_via_statement = via_statement
+            # Fold finished branches back into their enclosing constructs
+            while True:
+                if completed_via_statement and self.current().type == TokenType.SEMICOLON:
+                    self.consume()
+                if not frames:
+                    return node
+                frame = frames.pop()
+                if frame[0] == 'while':
+                    node = WhileNode(frame[1], node)
+                    completed_via_statement = frame[2]
+                elif frame[0] == 'else':
+                    node = IfNode(frame[1], frame[2], node)
+                    completed_via_statement = frame[3]
+                else:
+                    current = self.current()
+                    if current.type == TokenType.KEYWORD and current.value == 'else':
+                        self.consume()
+                        frames.append(('else', frame[1], node, frame[2]))
+                        current = self.current()
+                        # 'else if' is parsed as a bare if, other branches as statements
+                        via_statement = not (current.type == TokenType.KEYWORD and current.value == 'if')
+                        break
+                    node = IfNode(frame[1], node, None)
+                    completed_via_statement = frame[2]
+
+    def parse_expression(self):
+        operands = []
+        # Operator stack entries: (precedence, right_assoc, kind, op) where kind is
+        # 'binary', 'unary' or '(' for an open parenthesis
+        operators = []
+        expect_operand = True
+        atom_only = False
+        open_parens = 0
+
+        while True:
+            token = self.current()
+            if expect_operand:
+                node_class = ATOM_NODES.get(token.type)
+                if node_class is not None:
+                    self.consume()
+                    operands.append(self.leaf(node_class, token.value))
+                    expect_operand = False
+                elif token.type == TokenType.LPAREN:
+                    self.consume()
+                    operators.append((0, False, '(', None))
+                    open_parens += 1
+                    atom_only = False
+                elif token.type in (TokenType.PLUS, TokenType.MINUS) and not atom_only:
+                    self.consume()
+                    operators.append((UNARY_PRECEDENCE, True, 'unary', token.value))
+                else:
+                    raise SyntaxError(f"Unexpected token in expression: {token} at position {self.pos}")
+                continue
+
+            operator = BINARY_OPERATORS.get(token.type)
+            if operator is not None:
+                precedence, right_assoc = operator
+                self._reduce(operands, operators, precedence, right_assoc)
+                self.consume()
+                operators.append((precedence, right_assoc, 'binary', token.value))
+                expect_operand = True
+                atom_only = precedence == ATOM_ONLY_PRECEDENCE
+                continue
+
+            if token.type == TokenType.RPAREN and open_parens:
+                self._reduce(operands, operators, 0, False)
+                operators.pop()
+                open_parens -= 1
+                self.consume()
+                continue
+
+            if open_parens:
+                self.match(TokenType.RPAREN)
+            self._reduce(operands, operators, 0, False)
+            return operands.pop()
+
+    def _reduce(self, operands, operators, precedence, right_assoc):
+        while operators:
+            top_precedence, _, kind, op = operators[-1]
+            if kind == '(':
+                return
+            if top_precedence < precedence or (top_precedence == precedence and right_assoc):
+                return
+            operators.pop()
+            right = operands.pop()
+            if kind == 'unary':
+                operands.append(BinOpNode(self.leaf(NumberNode, 0), op, right))
+            elif op == '=':
+                target = operands.pop()
+                if not isinstance(target, VarNode):
+                    raise SyntaxError(f"Invalid assignment target: Cannot assign to {type(target).__name__}. Must be a variable.")
+                operands.append(AssignNode(target.name, right))
+            else:
+                operands.append(BinOpNode(operands.pop(), op, right))
+
+def benchmark(statements=5000, repeat=3):
+    """Time Parser and PrattParser on the same tokens of a program of
+    assignments, ifs and whiles; returns (Parser seconds, PrattParser
+    seconds), each the best of repeat runs."""
+    from lexer import Lexer
+    lines = []
+    for number in range(statements):
+        lines.append(f"v{number} = (v{number} + {number}) * 2 - -3 / (1 + v{number} * v{number});")
+        if number % 4 == 0:
+            lines.append(f"if v{number} > 3 then w = v{number} <= 2 else if w then w = 0 else w = 1;")
+        if number % 8 == 0:
+            lines.append("while (w = w - 1) >= 0 do total = total + w * 2.5;")
+    tokens = Lexer('\n'.join(lines)).tokenize()
+    timings = []
+    for parser in (Parser, PrattParser):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parser(tokens).parse()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    return tuple(timings)
+
+if __name__ == '__main__':
+    recursive, pratt = benchmark()
+    print(f"Parser {recursive:.3f}s, PrattParser {pratt:.3f}s, speedup {recursive / pratt:.2f}x")
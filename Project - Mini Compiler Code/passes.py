@@ -0,0 +1,468 @@
+import time
+
+from ir import (
+    Instruction, CONST, PARAM, CHECK, INVALID, BINARY, NUMBER, KEEP, COPY, PHI,
+    JUMP, BRANCH, PURE_OPCODES
+)
+from ir import UNKNOWN as UNKNOWN_NODE
+from interpreter import UNCHECKED_OPS
+
+NUMBER_TYPES = (int, float)
+
+# Lattice values of constant propagation besides the constants themselves:
+# not (yet) known to be defined, and not a single constant
+UNKNOWN = object()
+VARYING = object()
+
+class PassManager:
+    """Runs IR passes over a Program in a fixed order and times them.
+
+    A pass is a function that rewrites the Program in place and returns the
+    number of changes it made. The pipeline is repeated while any pass still
+    changes something, at most max_rounds times. After run(), timings and
+    changes hold the seconds spent in and the changes made by each pass.
+
+    Passes look up definitions and uses in program.def_use(), which is
+    dropped after every pass that made changes, so that a round in which
+    nothing changes builds it once rather than once per pass.
+    """
+
+    def __init__(self, pipeline=None, max_rounds=4):
+        self.passes = [] # (name, function) in running order
+        self.max_rounds = max_rounds
+        self.timings = {}
+        self.changes = {}
+        for name in DEFAULT_PIPELINE if pipeline is None else pipeline:
+            if name not in PASSES:
+                raise ValueError(f"Unknown IR pass '{name}'. Expected one of: {', '.join(PASSES)}")
+            self.register(name, PASSES[name])
+
+    def register(self, name, function, before=None, after=None):
+        """Add a pass, at the end or just before/after the pass named."""
+        names = [registered for registered, _ in self.passes]
+        if name in names:
+            raise ValueError(f"IR pass '{name}' is already registered")
+        index = len(self.passes)
+        anchor = before if before is not None else after
+        if anchor is not None:
+            if anchor not in names:
+                raise ValueError(f"Unknown IR pass '{anchor}'")
+            index = names.index(anchor) + (before is None)
+        self.passes.insert(index, (name, function))
+
+    def run(self, program):
+        self.timings = {name: 0.0 for name, _ in self.passes}
+        self.changes = {name: 0 for name, _ in self.passes}
+        for _ in range(self.max_rounds):
+            changed = False
+            for name, function in self.passes:
+                start = time.perf_counter()
+                count = function(program)
+                self.timings[name] += time.perf_counter() - start
+                self.changes[name] += count
+                if count:
+                    program.analysis = None
+                changed = changed or count > 0
+            if not changed:
+                break
+        return program
+
+    def report(self):
+        return '\n'.join(f"{name}: {self.changes[name]} changes, {self.timings[name] * 1000:.2f} ms"
+                         for name, _ in self.passes)
+
+def constant_propagation(program):
+    """Sparse conditional constant propagation.
+
+    Finds the values that are the same constant on every path that can run,
+    and the branches that can only go one way. Instructions that compute a
+    constant without printing become CONST, decided branches become jumps
+    and blocks that can never run are deleted.
+    """
+    def_use = program.def_use()
+    owner = def_use.owner
+    uses = def_use.uses
+
+    lattice = {} # value -> its constant, or VARYING; UNKNOWN while no path defines it
+    executable = set()
+    edges = set()
+    flow = [(None, program.entry)]
+    work = []
+
+    def visit(instruction, block):
+        opcode = instruction.opcode
+        if opcode == PHI:
+            value = UNKNOWN
+            for pred, arg in zip(instruction.attr, instruction.args):
+                if (pred, block) in edges:
+                    value = _meet(value, lattice.get(arg, UNKNOWN))
+        elif opcode == JUMP:
+            flow.append((block, block.successors[0]))
+            return
+        elif opcode == BRANCH:
+            condition = lattice.get(instruction.args[0], UNKNOWN)
+            if condition is UNKNOWN:
+                return
+            taken = None if condition is VARYING else _branch_taken(instruction.attr, condition)
+            if taken is None:
+                flow.append((block, block.successors[0]))
+                flow.append((block, block.successors[1]))
+            else:
+                flow.append((block, block.successors[0 if taken else 1]))
+            return
+        elif instruction.dest is None:
+            return
+        else:
+            value = _evaluate(instruction, lattice)
+        if value is UNKNOWN:
+            return
+        old = lattice.get(instruction.dest, UNKNOWN)
+        if old is VARYING or (old is not UNKNOWN and value is not VARYING and _same_constant(old, value)):
+            return
+        lattice[instruction.dest] = value if old is UNKNOWN else VARYING
+        # Uses in blocks not run through yet are evaluated when they are
+        for use in uses.get(instruction.dest, ()):
+            if owner[use] in executable:
+                work.append(use)
+
+    while flow or work:
+        if flow:
+            pred, block = flow.pop()
+            if pred is not None:
+                if (pred, block) in edges:
+                    continue
+                edges.add((pred, block))
+            for phi in block.phis:
+                visit(phi, block)
+            if block in executable:
+                continue
+            for instruction in block.instructions:
+                visit(instruction, block)
+            visit(block.terminator, block)
+            executable.add(block)
+        else:
+            instruction = work.pop()
+            block = owner[instruction]
+            if block in executable:
+                visit(instruction, block)
+
+    changes = 0
+    for block in program.blocks:
+        if block not in executable:
+            continue
+        folded = []
+        if block.phis:
+            phis = []
+            for phi in block.phis:
+                value = lattice.get(phi.dest, VARYING)
+                if value is VARYING:
+                    phis.append(phi)
+                else:
+                    folded.append(_make_constant(phi, value))
+            block.phis = phis
+        for instruction in block.instructions:
+            if instruction.dest is None or instruction.opcode == CONST:
+                continue
+            value = lattice.get(instruction.dest, VARYING)
+            if value is not VARYING and _silent(instruction, lattice):
+                _make_constant(instruction, value)
+                changes += 1
+        if folded:
+            block.instructions[:0] = folded
+            changes += len(folded)
+
+        terminator = block.terminator
+        if terminator.opcode == BRANCH:
+            condition = lattice.get(terminator.args[0], VARYING)
+            taken = None if condition is VARYING else _branch_taken(terminator.attr, condition)
+            if taken is not None:
+                program.remove_edge(block, block.successors[1 if taken else 0])
+                terminator.opcode = JUMP
+                terminator.args = ()
+                terminator.attr = None
+                changes += 1
+    return changes + program.remove_unreachable(executable)
+
+def copy_propagation(program):
+    """Replace values that are copies of another value by that value.
+
+    Besides COPY this covers PHIs whose operands are all the same value,
+    variables after an assignment that cannot fail (KEEP of a value that is
+    never None), undefined-variable checks of values that are always
+    assigned and repeated constants. Constants are moved to the top of the
+    entry block, which dominates every use.
+    """
+    def_use = program.def_use()
+    definitions = def_use.definitions
+    may_be_none, may_be_unset = _value_facts(program, def_use)
+    replace = {}
+
+    constants = {}
+    moved = 0
+    for block in program.blocks:
+        for instruction in block.instructions:
+            if instruction.opcode == CONST:
+                attr = instruction.attr
+                # repr keeps 0.0 and -0.0 apart, and NaN equal to itself
+                key = (float, repr(attr)) if type(attr) is float else (type(attr), attr)
+                if key in constants:
+                    replace[instruction.dest] = constants[key].dest
+                else:
+                    constants[key] = instruction
+                    moved += block is not program.entry
+    for block in program.blocks:
+        block.instructions = [instruction for instruction in block.instructions if instruction.opcode != CONST]
+    program.entry.instructions[:0] = constants.values()
+
+    def resolve(value):
+        while value in replace:
+            value = replace[value]
+        return value
+
+    for instruction in definitions.values():
+        opcode = instruction.opcode
+        if opcode == COPY:
+            replace[instruction.dest] = instruction.args[0]
+        elif opcode == KEEP and instruction.args[0] not in may_be_none:
+            replace[instruction.dest] = instruction.args[0]
+        elif opcode == CHECK and instruction.args[0] not in may_be_unset:
+            replace[instruction.dest] = instruction.args[0]
+
+    changed = True
+    while changed:
+        changed = False
+        for block in program.blocks:
+            for phi in block.phis:
+                if phi.dest in replace:
+                    continue
+                operands = {resolve(arg) for arg in phi.args}
+                operands.discard(phi.dest)
+                if len(operands) == 1:
+                    replace[phi.dest] = operands.pop()
+                    changed = True
+
+    if not replace:
+        return moved
+    # Only the blocks that defined a replaced value (repeated constants are
+    # gone from theirs already) and the instructions using one change
+    for block in {def_use.owner[definitions[value]] for value in replace}:
+        block.phis = [phi for phi in block.phis if phi.dest not in replace]
+        block.instructions = [instruction for instruction in block.instructions
+                              if instruction.dest not in replace]
+    users = {}
+    for value in replace:
+        for instruction in def_use.uses.get(value, ()):
+            users[instruction] = None
+    for instruction in users:
+        args = [resolve(arg) for arg in instruction.args]
+        instruction.args = args if instruction.opcode == PHI else tuple(args)
+    return moved + len(replace)
+
+def dead_code_elimination(program):
+    """Delete instructions whose value is never used and that print
+    nothing, and blocks that can never run."""
+    removed = program.remove_unreachable()
+    definitions = program.definitions()
+    live = set()
+    stack = []
+    for instruction in program.instructions():
+        if not _removable(instruction, definitions):
+            stack.extend(instruction.args)
+    while stack:
+        value = stack.pop()
+        if value not in live:
+            live.add(value)
+            stack.extend(definitions[value].args)
+
+    for block in program.blocks:
+        phis = [phi for phi in block.phis if phi.dest in live]
+        instructions = [instruction for instruction in block.instructions
+                        if instruction.dest is None or instruction.dest in live
+                        or not _removable(instruction, definitions)]
+        removed += len(block.phis) - len(phis) + len(block.instructions) - len(instructions)
+        block.phis = phis
+        block.instructions = instructions
+    return removed
+
+def simplify_cfg(program):
+    """Merge each block into its predecessor when that is its only
+    predecessor and it is that block's only successor."""
+    merged = set()
+    for block in program.blocks:
+        if block in merged or block.terminator.opcode != JUMP:
+            continue
+        successor = block.successors[0]
+        while (successor is not program.entry and len(successor.predecessors) == 1
+               and successor is not block):
+            # A single predecessor leaves every PHI with one operand
+            block.instructions.extend(Instruction(COPY, phi.dest, (phi.args[0],)) for phi in successor.phis)
+            block.instructions.extend(successor.instructions)
+            block.terminator = successor.terminator
+            block.successors = successor.successors
+            for following in successor.successors:
+                following.predecessors = [block if pred is successor else pred for pred in following.predecessors]
+                for phi in following.phis:
+                    phi.attr = [block if pred is successor else pred for pred in phi.attr]
+            merged.add(successor)
+            if block.terminator.opcode != JUMP:
+                break
+            successor = block.successors[0]
+    if merged:
+        program.blocks = [block for block in program.blocks if block not in merged]
+    return len(merged)
+
+def _make_constant(instruction, value):
+    instruction.opcode = CONST
+    instruction.args = ()
+    instruction.attr = value
+    return instruction
+
+def _fold(op, left, right):
+    """(value, prints) of the interpreter's binary_op on two constants;
+    value is VARYING when Python itself would fail on them (e.g. int
+    overflow), which leaves the operation to run time."""
+    if left is None or right is None:
+        return None, False
+    if type(left) not in NUMBER_TYPES or type(right) not in NUMBER_TYPES:
+        return None, True
+    if op not in UNCHECKED_OPS or (op == '/' and right == 0):
+        return None, True
+    try:
+        return UNCHECKED_OPS[op](left, right), False
+    except ArithmeticError:
+        return VARYING, False
+
+def _evaluate(instruction, lattice):
+    """The lattice value of instruction's result, from its operands'."""
+    opcode = instruction.opcode
+    if opcode == CONST:
+        return instruction.attr
+    if opcode == INVALID or opcode == UNKNOWN_NODE:
+        return None
+    if opcode == PARAM:
+        return VARYING
+    if opcode == BINARY or opcode == NUMBER:
+        left = lattice.get(instruction.args[0], UNKNOWN)
+        right = lattice.get(instruction.args[1], UNKNOWN)
+        # A failed operand (None) makes the result None without a message
+        if left is None or right is None:
+            return None
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        if left is VARYING or right is VARYING:
+            return VARYING
+        return _fold(instruction.attr, left, right)[0]
+    if opcode == KEEP:
+        value = lattice.get(instruction.args[0], UNKNOWN)
+        if value is None:
+            return lattice.get(instruction.args[1], UNKNOWN)
+        return value
+    # COPY, or CHECK: a constant is never UNSET, only PARAMs can be
+    return lattice.get(instruction.args[0], UNKNOWN)
+
+def _silent(instruction, lattice):
+    # Whether instruction, whose result is a known constant, prints nothing
+    opcode = instruction.opcode
+    if opcode in PURE_OPCODES or opcode == CHECK:
+        return True
+    if opcode == BINARY or opcode == NUMBER:
+        left = lattice[instruction.args[0]]
+        right = lattice[instruction.args[1]]
+        if left is None or right is None:
+            return True
+        value, prints = _fold(instruction.attr, left, right)
+        return value is not VARYING and not prints
+    return False
+
+def _meet(a, b):
+    if b is UNKNOWN:
+        return a
+    if a is UNKNOWN:
+        return b
+    if a is VARYING or b is VARYING or not _same_constant(a, b):
+        return VARYING
+    return a
+
+def _same_constant(a, b):
+    if type(a) is not type(b):
+        return False
+    if type(a) is float:
+        # repr keeps 0.0 and -0.0 apart
+        return repr(a) == repr(b)
+    return a == b
+
+def _branch_taken(test, value):
+    """Whether a BRANCH with test goes to its first successor for value, or
+    None when that is only known at runtime."""
+    if test == 'none':
+        return value is None
+    if test == 'truthy':
+        return bool(value)
+    if type(value) in NUMBER_TYPES:
+        return value > 0
+    return None
+
+def _nonzero_constant(value, definitions):
+    definition = definitions[value]
+    return (definition.opcode == CONST and type(definition.attr) in NUMBER_TYPES
+            and definition.attr != 0)
+
+def _removable(instruction, definitions):
+    # Whether instruction can be deleted when its value is unused
+    if instruction.opcode in PURE_OPCODES:
+        return True
+    if instruction.opcode == NUMBER:
+        return instruction.attr != '/' or _nonzero_constant(instruction.args[1], definitions)
+    return False
+
+def _value_facts(program, def_use):
+    """The values that may be None and those that may be UNSET."""
+    definitions = def_use.definitions
+    uses = def_use.uses
+    may_be_none = set()
+    may_be_unset = set()
+    work = [instruction for instruction in program.instructions() if instruction.dest is not None]
+    work.reverse() # pop in program order, so most operands are done first
+    # A value that gains a fact sends back the users already done; the
+    # others are still to come
+    done = set()
+    while work:
+        instruction = work.pop()
+        done.add(instruction)
+        opcode = instruction.opcode
+        args = instruction.args
+        dest = instruction.dest
+        if opcode == CONST:
+            none, unset = instruction.attr is None, False
+        elif opcode == PARAM:
+            none, unset = False, True
+        elif opcode == CHECK:
+            none, unset = args[0] in may_be_none or args[0] in may_be_unset, False
+        elif opcode == NUMBER:
+            none = instruction.attr == '/' and not _nonzero_constant(args[1], definitions)
+            unset = False
+        elif opcode == KEEP:
+            value, previous = args
+            none = value in may_be_none and previous in may_be_none
+            unset = value in may_be_unset or (value in may_be_none and previous in may_be_unset)
+        elif opcode == COPY or opcode == PHI:
+            none = any(arg in may_be_none for arg in args)
+            unset = any(arg in may_be_unset for arg in args)
+        else:
+            none, unset = True, False
+        if (none and dest not in may_be_none) or (unset and dest not in may_be_unset):
+            if none:
+                may_be_none.add(dest)
+            if unset:
+                may_be_unset.add(dest)
+            work.extend(user for user in uses.get(dest, ()) if user in done)
+    return may_be_none, may_be_unset
+
+# The IR passes by name, and the order IRInterpreter runs them in
+PASSES = {
+    'constant-propagation': constant_propagation,
+    'copy-propagation': copy_propagation,
+    'dead-code-elimination': dead_code_elimination,
+    'simplify-cfg': simplify_cfg,
+}
+DEFAULT_PIPELINE = ('constant-propagation', 'copy-propagation', 'dead-code-elimination', 'simplify-cfg')
@@ -0,0 +1,220 @@
+from collections.abc import MutableMapping
+
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+
+class _Unset:
+    # No operators are defined, so arithmetic or ordering on an unassigned
+    # slot fails with TypeError instead of producing a value
+    __slots__ = ()
+    def __repr__(self): return 'UNSET'
+
+UNSET = _Unset()
+
+# Prefix of the temporaries the loop optimizer introduces; the lexer cannot
+# produce it, so they never clash with program variables
+TEMPORARY_PREFIX = '$'
+
+def resolved_slots(root, env):
+    """The checked slots if root's slots currently refer to env, else None."""
+    resolved = env.resolved
+    if resolved is not None and resolved[0] is root and resolved[2] == Resolver.generation:
+        return resolved[1]
+    return None
+
+class Environment(MutableMapping):
+    """Variable storage backed by a list indexed by slot.
+
+    values[slot] holds the variable's value, or UNSET until it is first
+    assigned. The environment is also a name -> value mapping over the
+    assigned variables, for the GUI and for code that works by name.
+    """
+
+    def __init__(self):
+        self.names = []   # slot -> name
+        self.index = {}   # name -> slot
+        self.values = []  # slot -> value
+        self.resolved = None # (root, checked slots, Resolver.generation) of the last resolve() into it
+
+    def slot(self, name):
+        """The slot of name, allocating a new one on first use."""
+        slot = self.index.get(name)
+        if slot is None:
+            slot = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.values.append(UNSET)
+        return slot
+
+    def bind(self, names):
+        """Allocate names in order; True if they got slots 0..len(names)-1."""
+        return all(self.slot(name) == slot for slot, name in enumerate(names))
+
+    def __getitem__(self, name):
+        slot = self.index.get(name)
+        if slot is None or self.values[slot] is UNSET:
+            raise KeyError(name)
+        return self.values[slot]
+
+    def __setitem__(self, name, value):
+        self.values[self.slot(name)] = value
+
+    def __delitem__(self, name):
+        slot = self.index.get(name)
+        if slot is None or self.values[slot] is UNSET:
+            raise KeyError(name)
+        self.values[slot] = UNSET
+
+    def __contains__(self, name):
+        slot = self.index.get(name)
+        return slot is not None and self.values[slot] is not UNSET
+
+    def __iter__(self):
+        return (name for name, value in zip(self.names, self.values) if value is not UNSET)
+
+    def __len__(self):
+        return sum(value is not UNSET for value in self.values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def variables(self):
+        """The assigned program variables as a dict, without temporaries."""
+        return {name: value for name, value in self.items() if not name.startswith(TEMPORARY_PREFIX)}
+
+class Resolver:
+    """Resolves every variable of a program to a slot of an Environment.
+
+    resolve() records the slot on each VarNode and AssignNode, allocating
+    slots in evaluation order. It also runs a definite-assignment analysis:
+    a variable whose every read is preceded, on all paths, by an assignment
+    that cannot fail needs no undefined-variable check at runtime. Slots
+    that still need the check end up in checked; variables read but never
+    assigned anywhere end up in unassigned.
+
+    Nodes may be shared between trees (interned leaves, subtrees kept
+    across edits), and environments resolving the same tree in the same
+    order agree on its slots. A resolve that has to change a slot another
+    environment set bumps generation, so every other environment's
+    resolved root is resolved again before it runs.
+    """
+
+    generation = 0
+
+    def __init__(self, env):
+        self.env = env
+        self.checked = set()
+        self.unassigned = set()
+
+    def resolve(self, root):
+        self.index = self.env.index
+        self.literals = {} # literal -> whether it is invalid
+        self.assigned_names = set()
+        self.has_strings = False
+        self.saw_string = False
+        self.unsafe = set()
+        self.added = None # names added to assigned inside a branch, to undo
+        self.statement(root, set())
+        if self.saw_string:
+            # Operators may fail on string operands, which the first pass
+            # assumed impossible; redo the analysis with that in mind
+            self.has_strings = True
+            self.unsafe = set()
+            self.statement(root, set())
+        self.checked = {self.env.slot(name) for name in self.unsafe}
+        self.unassigned = self.unsafe - self.assigned_names
+        self.env.resolved = (root, self.checked, Resolver.generation)
+        return root
+
+    def statement(self, node, assigned):
+        """Resolve the variables in node, record its reads and add the
+        variables it definitely assigns to assigned; returns whether node
+        may evaluate to None."""
+        node_type = type(node)
+        if node_type is VarNode:
+            self.place(node)
+            if node.name in assigned:
+                return False
+            self.unsafe.add(node.name)
+            return True
+
+        if node_type is NumberNode:
+            invalid = self.literals.get(node.value)
+            if invalid is None:
+                invalid = self.literals[node.value] = number_value(node.value) is None
+            return invalid
+
+        if node_type is BinOpNode:
+            left_fails = self.statement(node.left, assigned)
+            right_fails = self.statement(node.right, assigned)
+            if left_fails or right_fails or self.has_strings:
+                return True
+            if node.op == '/':
+                right = node.right
+                return not (type(right) is NumberNode and number_value(right.value))
+            return node.op not in ('+', '-', '*', '<', '>', '<=', '>=')
+
+        if node_type is AssignNode:
+            fails = self.statement(node.value, assigned)
+            self.place(node)
+            self.assigned_names.add(node.name)
+            if not fails and node.name not in assigned:
+                assigned.add(node.name)
+                if self.added is not None:
+                    self.added.append(node.name)
+            return fails
+
+        if node_type is BlockNode:
+            fails = True
+            for stmt in node.statements:
+                fails = self.statement(stmt, assigned)
+            return fails
+
+        if node_type is IfNode:
+            condition_fails = self.statement(node.condition, assigned)
+            then_added = self.branch(node.then_branch, assigned)
+            else_added = self.branch(node.else_branch, assigned) if node.else_branch else []
+            if not condition_fails:
+                # One of the branches always runs
+                added = set(then_added).intersection(else_added)
+                assigned |= added
+                if self.added is not None:
+                    self.added.extend(added)
+            return True
+
+        if node_type is WhileNode:
+            self.statement(node.condition, assigned)
+            # The body may never run
+            self.branch(node.body, assigned)
+            return True
+
+        if node_type is UnaryOpNode:
+            return self.statement(node.operand, assigned) or self.has_strings
+
+        if node_type is StringNode:
+            self.saw_string = True
+            return False
+
+        return True
+
+    def place(self, node):
+        """Record the slot of node's variable on node."""
+        slot = self.index.get(node.name)
+        if slot is None:
+            slot = self.env.slot(node.name)
+        if node.slot != slot:
+            if node.slot is not None:
+                Resolver.generation += 1
+            node.slot = slot
+
+    def branch(self, node, assigned):
+        """Resolve node as a path that may not run: return the names it
+        definitely assigns that assigned lacks, leaving assigned as it was
+        (rather than resolving on a copy, which costs every variable)."""
+        outer, self.added = self.added, []
+        self.statement(node, assigned)
+        added = self.added
+        assigned.difference_update(added)
+        self.added = outer
+        return added
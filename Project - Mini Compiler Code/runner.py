@@ -0,0 +1,121 @@
+import itertools
+import queue
+import threading
+
+from governor import Cancelled
+
+class Job:
+    """One piece of work for a Runner: function(job) runs on the worker.
+
+    The function reports progress with post() and calls check() between
+    its phases; a governor it sets on job.governor is cancelled with the
+    job, which stops a running program at its next loop iteration.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, function, runner):
+        self.id = next(Job._ids)
+        self.function = function
+        self.runner = runner
+        self.cancelled = False
+        self.governor = None
+
+    def post(self, kind, *args):
+        """Queue an event (job, kind, *args) for Runner.poll()."""
+        self.runner.events.put((self, kind) + args)
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def cancel(self):
+        self.cancelled = True
+        governor = self.governor
+        if governor is not None:
+            governor.cancel()
+
+class Runner:
+    """Runs jobs one at a time on a persistent worker thread.
+
+    submit() supersedes whatever is queued or running: the running job is
+    cancelled and the new job waits in a single slot, replacing an older
+    one that never started, so rapid resubmits never pile up. Everything a
+    job reports arrives in the events queue, as (job, kind, *args) tuples:
+    'started', the job's own posts, then 'done' with its return value,
+    'cancelled', or 'failed' with the exception. poll() drains the queue
+    without blocking, for a UI thread's timer.
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.condition = threading.Condition()
+        self.pending = None
+        self.current = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.work, name='runner', daemon=True)
+        self.thread.start()
+
+    def submit(self, function):
+        job = Job(function, self)
+        with self.condition:
+            if self.pending is not None:
+                self.pending.cancel()
+                self.pending.post('cancelled')
+            if self.current is not None:
+                self.current.cancel()
+            self.pending = job
+            self.condition.notify()
+        return job
+
+    def stop(self):
+        """Cancel the running job and drop the queued one."""
+        with self.condition:
+            if self.pending is not None:
+                self.pending.cancel()
+                self.pending.post('cancelled')
+                self.pending = None
+            if self.current is not None:
+                self.current.cancel()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.stop()
+
+    def busy(self):
+        with self.condition:
+            return self.current is not None or self.pending is not None
+
+    def poll(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                job = self.current = self.pending
+                self.pending = None
+            try:
+                job.check()
+                job.post('started')
+                result = job.function(job)
+                job.check()
+            except Cancelled:
+                job.post('cancelled')
+            except Exception as e:
+                job.post('failed', e)
+            else:
+                job.post('done', result)
+            finally:
+                with self.condition:
+                    self.current = None
@@ -0,0 +1,270 @@
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from parser import VarNode, AssignNode, WhileNode, BlockNode
+from flatast import child_nodes
+from interpreter import Interpreter
+from governor import ExecutionGovernor, BudgetExceeded
+from output import CaptureSink
+
+# Estimated node evaluations below which a task is not worth sending to
+# another process (pickling the task and its results costs more)
+PARALLEL_MIN_COST = 1000
+
+# Iterations estimate_cost assumes for a loop, whose trip count is unknown
+LOOP_WEIGHT = 100
+
+def def_use(node):
+    """(reads, writes): the variables node may read and may assign."""
+    reads = set()
+    writes = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is VarNode:
+            reads.add(node.name)
+        elif type(node) is AssignNode:
+            writes.add(node.name)
+        stack.extend(child_nodes(node))
+    return reads, writes
+
+def statement_dependencies(statements):
+    """The dependency DAG of a statement list: for each statement, the
+    indices of the earlier statements it must run after.
+
+    A statement depends on the last earlier statement that may assign a
+    variable it reads or assigns, and on the statements that read a
+    variable it assigns since that variable was last assigned. The edges
+    to earlier assignments of the same variable are implied through these.
+    """
+    last_writer = {}
+    readers = {} # variable -> statements reading it since its last assignment
+    dependencies = []
+    for index, statement in enumerate(statements):
+        reads, writes = def_use(statement)
+        depends = set()
+        for name in reads | writes:
+            if name in last_writer:
+                depends.add(last_writer[name])
+        for name in writes:
+            depends.update(readers.get(name, ()))
+        depends.discard(index)
+        dependencies.append(depends)
+        for name in reads:
+            readers.setdefault(name, []).append(index)
+        for name in writes:
+            last_writer[name] = index
+            readers[name] = []
+    return dependencies
+
+def plan_tasks(dependencies):
+    """Group the statements into tasks: a statement that only depends on
+    one statement, which nothing else depends on, joins that statement's
+    task. Returns (tasks, task_dependencies), each task a list of statement
+    indices in order."""
+    dependents = [0] * len(dependencies)
+    for depends in dependencies:
+        for index in depends:
+            dependents[index] += 1
+    task_of = []
+    tasks = []
+    for index, depends in enumerate(dependencies):
+        if len(depends) == 1:
+            (previous,) = depends
+            if dependents[previous] == 1:
+                task = task_of[previous]
+                tasks[task].append(index)
+                task_of.append(task)
+                continue
+        task_of.append(len(tasks))
+        tasks.append([index])
+    task_dependencies = [
+        {task_of[previous] for index in task for previous in dependencies[index]} - {number}
+        for number, task in enumerate(tasks)
+    ]
+    return tasks, task_dependencies
+
+def estimate_cost(node):
+    """Node evaluations node may take, counting every loop as running
+    LOOP_WEIGHT iterations."""
+    cost = 0
+    stack = [(node, 1)]
+    while stack:
+        node, weight = stack.pop()
+        cost += weight
+        if type(node) is WhileNode:
+            weight *= LOOP_WEIGHT
+        stack.extend((child, weight) for child in child_nodes(node))
+    return cost
+
+def _run_task(payload):
+    # Runs in a worker process: the task's statements on the variables they
+    # need, with each statement's output captured separately
+    statements, inputs, writes, governor = pickle.loads(payload)
+    interpreter = Interpreter({}, governor=governor)
+    for name, value in inputs.items():
+        interpreter.env[name] = value
+    governor.start(interpreter.env)
+    interpreter.resolve(BlockNode(statements))
+    results = []
+    outputs = []
+    for statement in statements:
+        interpreter.output = CaptureSink()
+        results.append(interpreter.execute(statement))
+        for diagnostic in interpreter.output.diagnostics:
+            diagnostic.node = None # a copy, which the caller cannot use
+        outputs.append(interpreter.output)
+    env = interpreter.env
+    return results, outputs, {name: env[name] for name in writes if name in env}, governor.steps
+
+class ParallelInterpreter(Interpreter):
+    """Interpreter that runs independent top-level statements concurrently.
+
+    The statements of the top-level block are grouped into tasks along
+    their dependency DAG (statement_dependencies), and tasks whose
+    dependencies are done run at the same time: expensive ones in a
+    process pool, cheap ones in this process. A task gets the current
+    values of the variables it uses, and the variables it assigns are
+    merged back when it finishes; tasks running at the same time never
+    assign the same variable, so the merge order does not matter. The
+    output of every statement is captured and written to self.output in
+    program order at the end; diagnostics from other processes lose their
+    node.
+
+    The result, environment and output are those of running the program
+    in order. A program without two expensive tasks, or with fewer than two
+    workers, simply runs in order, and so does any program whose tasks
+    raise an exception, from the start again. Every worker gets the
+    governor's remaining budgets and the steps of all tasks are added up,
+    so a run over budget also ends up running in order, to stop where the
+    sequential run stops.
+    """
+
+    def __init__(self, symbol_table, input_func=None, workers=None, governor=None, output=None):
+        super().__init__(symbol_table, input_func, governor, output)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    def eval(self, node):
+        try:
+            return self.run_program(node)
+        finally:
+            self.output.flush()
+
+    def run_program(self, node):
+        self.governor.start(self.env)
+        self.resolve(node)
+        if type(node) is not BlockNode or self.workers < 2:
+            return self.execute(node)
+        statements = node.statements
+        tasks, task_dependencies = plan_tasks(statement_dependencies(statements))
+        costs = [sum(estimate_cost(statements[index]) for index in task) for task in tasks]
+        if sum(cost >= PARALLEL_MIN_COST for cost in costs) < 2:
+            return self.execute(node)
+
+        initial = list(self.env.values)
+        try:
+            results, outputs = self.run_tasks(statements, tasks, task_dependencies, costs)
+        except Exception:
+            # Rerun in order, which raises at the same point with the same
+            # output before it
+            self.env.values[:] = initial
+            self.governor.start(self.env)
+            return self.execute(node)
+        for output in outputs:
+            output.replay(self.output)
+        return results[-1] if results else None
+
+    def run_tasks(self, statements, tasks, task_dependencies, costs):
+        results = [None] * len(statements)
+        outputs = [None] * len(statements)
+        accesses = [set().union(*def_use(BlockNode([statements[index] for index in task]))) for task in tasks]
+        waiting = [set(depends) for depends in task_dependencies]
+        dependents = [[] for _ in tasks]
+        for number, depends in enumerate(task_dependencies):
+            for previous in depends:
+                dependents[previous].append(number)
+
+        governor = self.governor
+
+        def finish(number, task_results, task_outputs, writes, steps=0):
+            governor.steps += steps
+            if governor.max_steps is not None and governor.steps > governor.max_steps:
+                raise BudgetExceeded('steps', governor.max_steps, governor.steps)
+            for index, result, output in zip(tasks[number], task_results, task_outputs):
+                results[index] = result
+                outputs[index] = output
+            for name, value in writes.items():
+                self.env[name] = value
+            for following in dependents[number]:
+                waiting[following].discard(number)
+                if not waiting[following]:
+                    ready.append(following)
+
+        ready = [number for number, depends in enumerate(waiting) if not depends]
+        running = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while ready or running:
+                ready.sort(reverse=True)
+                while ready:
+                    number = ready.pop()
+                    task = [statements[index] for index in tasks[number]]
+                    if costs[number] >= PARALLEL_MIN_COST:
+                        inputs = {name: self.env[name] for name in accesses[number] if name in self.env}
+                        writes = def_use(BlockNode(task))[1]
+                        payload = pickle.dumps((task, inputs, writes, self.worker_governor()))
+                        running[pool.submit(_run_task, payload)] = number
+                    else:
+                        finish(number, *self.run_inline(task))
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in sorted(done, key=running.get):
+                        finish(running.pop(future), *future.result())
+        return results, outputs
+
+    def worker_governor(self):
+        governor = self.governor
+        budgets = {}
+        if governor.max_steps is not None:
+            budgets['max_steps'] = governor.max_steps - governor.steps
+        if governor.max_seconds is not None:
+            budgets['max_seconds'] = governor.max_seconds - governor.elapsed()
+        return governor.copy(**budgets)
+
+    def run_inline(self, statements):
+        # The statements were resolved with the whole program, so they run
+        # on this interpreter's environment directly
+        results = []
+        outputs = []
+        output = self.output
+        try:
+            for statement in statements:
+                self.output = CaptureSink()
+                results.append(self.execute(statement))
+                outputs.append(self.output)
+        finally:
+            self.output = output
+        return results, outputs, {}
+
+def benchmark(loops=8, iterations=200000, workers=None):
+    """Time a synthetic program of independent counting loops in order and
+    with ParallelInterpreter; returns (sequential seconds, parallel seconds)."""
+    from lexer import Lexer
+    from parser import Parser
+    lines = []
+    for number in range(loops):
+        lines.append(f"n{number} = 0;")
+        lines.append(f"while n{number} < {iterations} do n{number} = n{number} + 1;")
+    program = Parser(Lexer('\n'.join(lines)).tokenize()).parse()
+    timings = []
+    governor = ExecutionGovernor(max_steps=None)
+    for engine in (Interpreter({}, governor=governor), ParallelInterpreter({}, workers=workers, governor=governor)):
+        start = time.perf_counter()
+        engine.eval(program)
+        timings.append(time.perf_counter() - start)
+    return tuple(timings)
+
+if __name__ == '__main__':
+    sequential, parallel = benchmark()
+    print(f"{os.cpu_count()} CPUs: in order {sequential:.2f}s, parallel {parallel:.2f}s, speedup {sequential / parallel:.2f}x")
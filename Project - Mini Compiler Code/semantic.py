@@ -1,41 +1,246 @@
-from parser import AssignNode, VarNode, BinOpNode, IfNode, WhileNode, BlockNode, StringNode, NumberNode
+from parser import (
+    AssignNode, VarNode, BinOpNode, UnaryOpNode, IfNode, WhileNode, BlockNode,
+    StringNode, NumberNode, number_value
+)
+import flatast
+
+# Static types: bool is the 0/1 int a comparison returns, number is int or float
+NUMERIC_TYPES = frozenset({'int', 'float', 'bool', 'number'})
+COMPARISONS = ('<', '>', '<=', '>=')
 
 class SemanticAnalyzer:
+    """Checks a program and infers the type of every expression.
+
+    The inference is flow-sensitive: it tracks the type each variable holds
+    at every point of the program, merges the types where branches join and
+    iterates loops to a fixed point. It also tracks which expressions may
+    evaluate to None at runtime (undefined variables, invalid literals,
+    division by zero, failed operands). An operator whose operands are
+    always-present numbers gets its result type recorded in node.type, so
+    the engines can skip their runtime checks for it; an operator that is
+    certain to fail on a string operand is reported as an error.
+
+    The annotations describe the tree as last analyzed, so a tree must be
+    analyzed again after it is combined with other statements.
+    """
+
     def __init__(self):
         self.symbol_table = {}
 
     def analyze(self, node, in_loop=False):
-        if isinstance(node, AssignNode):
-            self.analyze(node.value)
-            self.symbol_table[node.name] = self.infer_type(node.value)
+        self.literals = {} # literal -> (type, may_fail)
+        self.log = None # (name, previous type) of the state changes to undo, inside a branch
+        try:
+            self.infer_type(node, {}, in_loop)
+        except Exception:
+            # Annotations made inside an unfinished loop analysis may be too
+            # narrow; a rejected program keeps none of them
+            _clear_types(node)
+            raise
+
+    def infer_type(self, node, state, in_loop=False):
+        """Analyze node and return (type, may_fail) for its value.
 
-        elif isinstance(node, VarNode):
+        state maps each variable that is definitely assigned at this point
+        to its type, and is updated to the state after node. It is one dict
+        for the whole analysis: branches and loop bodies change it through
+        assign() and are undone from self.log, so an if or a loop costs
+        time for the variables it assigns rather than for all of them.
+        """
+        node_type = type(node)
+        if node_type is VarNode:
             if node.name not in self.symbol_table:
                 raise Exception(f"Semantic Error: Undefined variable '{node.name}'")
+            type_ = state.get(node.name)
+            if type_ is not None:
+                return type_, False
+            return self.symbol_table[node.name], True # may be unassigned here
 
-        elif isinstance(node, BinOpNode):
-            self.analyze(node.left)
-            self.analyze(node.right)
+        if node_type is NumberNode:
+            literal = self.literals.get(node.value)
+            if literal is None:
+                value = number_value(node.value)
+                if value is None:
+                    literal = ('unknown', True)
+                else:
+                    literal = ('float' if type(value) is float else 'int', False)
+                self.literals[node.value] = literal
+            return literal
 
-        elif isinstance(node, IfNode):
-            self.analyze(node.condition)
-            self.analyze(node.then_branch, in_loop=in_loop)
-            if node.else_branch:
-                self.analyze(node.else_branch, in_loop=in_loop)
+        if node_type is BinOpNode:
+            node.type = None
+            left_type, left_fails = self.infer_type(node.left, state, in_loop)
+            right_type, right_fails = self.infer_type(node.right, state, in_loop)
+            fails = left_fails or right_fails
+            result = RESULT_TYPES.get((node.op, left_type, right_type))
+            if result is None:
+                # Arithmetic and comparisons reject strings; with both
+                # operands always present the runtime error is certain
+                if not fails and (left_type == 'string' or right_type == 'string'):
+                    raise Exception(f"Semantic Error: Invalid operand types for operator '{node.op}': {left_type} and {right_type}")
+                return 'unknown', True
+            if fails:
+                return result, True
+            node.type = result
+            if node.op == '/':
+                # Only a literal non-zero divisor rules out division by zero
+                right = node.right
+                return result, not (type(right) is NumberNode and number_value(right.value))
+            return result, False
 
-        elif isinstance(node, WhileNode):
-            self.analyze(node.condition)
-            self.analyze(node.body, in_loop=True)
+        if node_type is AssignNode:
+            value_type, fails = self.infer_type(node.value, state, in_loop)
+            previous = self.symbol_table.get(node.name)
+            self.symbol_table[node.name] = value_type if previous is None else join_types(previous, value_type)
+            if not fails:
+                self.assign(state, node.name, value_type)
+            elif node.name in state:
+                # A failed assignment leaves the old value in place
+                self.assign(state, node.name, join_types(state[node.name], value_type))
+            return value_type, fails
 
-        elif isinstance(node, BlockNode):
+        if node_type is BlockNode:
+            result = ('unknown', True)
             for stmt in node.statements:
-                self.analyze(stmt, in_loop=in_loop)
-
-    def infer_type(self, node):
-        if isinstance(node, NumberNode):
-            return 'int'
-        elif isinstance(node, StringNode):
-            return 'string'
-        elif isinstance(node, VarNode):
-            return self.symbol_table.get(node.name, 'unknown')
-        return 'unknown'
\ No newline at end of file
+                result = self.infer_type(stmt, state, in_loop)
+            return result
+
+        if node_type is IfNode:
+            _, condition_fails = self.infer_type(node.condition, state, in_loop)
+            then_type, then_fails, then_changes = self.branch(node.then_branch, state, in_loop)
+            if node.else_branch:
+                else_type, else_fails, else_changes = self.branch(node.else_branch, state, in_loop)
+            else:
+                else_type, else_fails, else_changes = 'unknown', True, {}
+            for name in {**then_changes, **else_changes}:
+                before = state.get(name)
+                merged = join_optional(then_changes.get(name, before), else_changes.get(name, before))
+                if condition_fails:
+                    merged = join_optional(merged, before) # neither branch runs
+                if merged != before:
+                    self.assign(state, name, merged)
+            return join_types(then_type, else_type), condition_fails or then_fails or else_fails
+
+        if node_type is WhileNode:
+            # Iterate until the state at the top of the loop stops changing;
+            # the lattice is finite and every round only widens it
+            while True:
+                outer, self.log = self.log, []
+                self.infer_type(node.condition, state, in_loop)
+                exit_changes = {name: state.get(name) for name, _ in self.log}
+                self.infer_type(node.body, state, in_loop=True)
+                body_changes = {name: state.get(name) for name, _ in self.log}
+                self.undo(state)
+                self.log = outer
+                widened = False
+                for name, type_ in body_changes.items():
+                    before = state.get(name)
+                    merged = join_optional(before, type_)
+                    if merged != before:
+                        self.assign(state, name, merged)
+                        widened = True
+                if not widened:
+                    break
+            # The loop exits after its condition, on the final entry state
+            for name, type_ in exit_changes.items():
+                if state.get(name) != type_:
+                    self.assign(state, name, type_)
+            return 'unknown', True
+
+        if node_type is UnaryOpNode:
+            node.type = None
+            operand_type, fails = self.infer_type(node.operand, state, in_loop)
+            # Evaluated as 0 op operand
+            result = RESULT_TYPES.get((node.op, 'int', operand_type))
+            if result is None:
+                if not fails and operand_type == 'string':
+                    raise Exception(f"Semantic Error: Invalid operand types for operator '{node.op}': int and string")
+                return 'unknown', True
+            if not fails:
+                node.type = result
+            return result, fails
+
+        if node_type is StringNode:
+            return 'string', False
+
+        return 'unknown', True
+
+    def assign(self, state, name, type_):
+        """Set name's type in state; None makes it not definitely assigned."""
+        if self.log is not None:
+            self.log.append((name, state.get(name)))
+        if type_ is None:
+            state.pop(name, None)
+        else:
+            state[name] = type_
+
+    def undo(self, state):
+        for name, type_ in reversed(self.log):
+            if type_ is None:
+                state.pop(name, None)
+            else:
+                state[name] = type_
+
+    def branch(self, node, state, in_loop):
+        """Analyze node as one of two paths: return (type, may_fail,
+        changes), changes mapping the variables it assigns to their type at
+        its end (None if not definitely assigned), and leave state as it
+        was."""
+        outer, self.log = self.log, []
+        type_, fails = self.infer_type(node, state, in_loop)
+        changes = {name: state.get(name) for name, _ in self.log}
+        self.undo(state)
+        self.log = outer
+        return type_, fails, changes
+
+def cannot_fail(node):
+    """Whether the operator node is typed and always evaluates without
+    printing an error, so optimizations may move, merge or repeat it."""
+    if node.type is None:
+        return False
+    if node.op != '/':
+        return True
+    # Division by anything but a non-zero literal may still hit zero
+    return type(node.right) is NumberNode and bool(number_value(node.right.value))
+
+def _clear_types(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if type(node) in (BinOpNode, UnaryOpNode):
+            node.type = None
+        stack.extend(flatast.child_nodes(node))
+
+def join_types(a, b):
+    if a == b:
+        return a
+    if a in ('int', 'bool') and b in ('int', 'bool'):
+        return 'int'
+    if a in NUMERIC_TYPES and b in NUMERIC_TYPES:
+        return 'number'
+    return 'unknown'
+
+def join_optional(a, b):
+    # A variable stays definitely assigned only if it is on both paths
+    if a is None or b is None:
+        return None
+    return join_types(a, b)
+
+def _result_type(op, left, right):
+    if op in COMPARISONS:
+        return 'bool'
+    if op == '/':
+        return 'float'
+    if left in ('int', 'bool') and right in ('int', 'bool'):
+        return 'int'
+    if 'float' in (left, right):
+        return 'float'
+    return 'number'
+
+# (operator, left type, right type) -> result type, for numeric operands
+RESULT_TYPES = {
+    (op, left, right): _result_type(op, left, right)
+    for op in ('+', '-', '*', '/') + COMPARISONS
+    for left in NUMERIC_TYPES
+    for right in NUMERIC_TYPES
+}
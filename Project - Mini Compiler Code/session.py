@@ -0,0 +1,175 @@
+import hashlib
+import sys
+
+from parser import BlockNode
+from resolver import UNSET
+from flatast import FlatAST
+from output import CaptureSink
+
+# Bytes of checkpoints a Session keeps (estimated with sys.getsizeof)
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+
+# A checkpoint copies the whole environment, so checkpoints are at least
+# (variables / CHECKPOINT_SPACING) statements apart
+CHECKPOINT_SPACING = 64
+
+def statement_digest(node):
+    """A digest of node's structure: equal for trees that run the same."""
+    flat = FlatAST.encode(node)
+    digest = hashlib.blake2b(digest_size=16)
+    for array_ in (flat.kinds, flat.a, flat.b, flat.c, flat.children):
+        digest.update(array_.tobytes())
+    digest.update(repr(flat.pool).encode())
+    return digest.digest()
+
+class Checkpoint:
+    """The state of a run at a top-level statement boundary: the
+    environment, the last statement's result, the steps used so far and
+    the output so far (a chain of (previous chain, entries) pairs shared
+    with the earlier checkpoints). size estimates the memory it takes,
+    counting only the output written since the previous checkpoint."""
+
+    __slots__ = ('names', 'index', 'values', 'result', 'steps', 'output', 'size')
+
+    def __init__(self, env, result, steps, output, written):
+        self.names = list(env.names)
+        self.index = dict(env.index)
+        self.values = list(env.values)
+        self.result = result
+        self.steps = steps
+        self.output = output
+        self.size = (sys.getsizeof(self.names) + sys.getsizeof(self.index) + sys.getsizeof(self.values)
+                     + sum(sys.getsizeof(value) for value in self.values if value is not UNSET)
+                     + sum(sys.getsizeof(str(entry)) for entry in written))
+
+    def restore(self, env):
+        env.names = list(self.names)
+        env.index = dict(self.index)
+        env.values = list(self.values)
+
+    def entries(self):
+        chunks = []
+        output = self.output
+        while output is not None:
+            output, entries = output
+            chunks.append(entries)
+        return [entry for entries in reversed(chunks) for entry in entries]
+
+class Session:
+    """Runs edited versions of a program on the tree Interpreter, resuming
+    after the longest unchanged run of leading top-level statements.
+
+    While a program runs, the environment is checkpointed at top-level
+    statement boundaries, keyed by a hash of the governor's budgets and the
+    statements before the boundary (see statement_digest), so a checkpoint
+    only matches a run under the same budgets of a program that starts with
+    exactly those statements; changing a statement invalidates every
+    checkpoint after it. run() restores the latest
+    matching checkpoint, replays the output the skipped statements wrote
+    and carries on from there. Checkpoints are evicted least recently used
+    first once they take more than max_bytes.
+
+    A resumed run gives the result, environment and output of a full run,
+    and its steps start from those the skipped statements used; only the
+    time they took is not counted again.
+    """
+
+    def __init__(self, max_bytes=CHECKPOINT_BYTES):
+        self.max_bytes = max_bytes
+        self.checkpoints = {} # prefix key -> Checkpoint, least recently used first
+        self.size = 0
+        self.digests = {} # id(statement) -> (statement, digest), for the last program
+        # Statistics of the last run()
+        self.resumed = 0
+        self.executed = 0
+
+    def prefix_keys(self, statements, governor):
+        """keys[k], for k = 0..len(statements): the key of statements[:k]
+        run under governor."""
+        digests = {}
+        # Whether a statement prints or stops the run depends on these; the
+        # clock is not reproducible anyway
+        settings = (governor.trace, governor.max_steps, governor.max_iterations,
+                    governor.max_env_size, governor.check_interval)
+        key = hashlib.blake2b(repr(settings).encode(), digest_size=16).digest()
+        keys = [key]
+        for statement in statements:
+            entry = self.digests.get(id(statement))
+            if entry is None or entry[0] is not statement:
+                entry = (statement, statement_digest(statement))
+            digests[id(statement)] = entry
+            key = hashlib.blake2b(key + entry[1], digest_size=16).digest()
+            keys.append(key)
+        self.digests = digests
+        return keys
+
+    def run(self, interpreter, node):
+        """Evaluate node on interpreter, a new Interpreter, like
+        interpreter.eval(node), and return the result."""
+        if type(node) is not BlockNode:
+            self.resumed, self.executed = 0, 1
+            return interpreter.eval(node)
+        statements = node.statements
+        governor = interpreter.governor
+        keys = self.prefix_keys(statements, governor)
+
+        start = len(statements)
+        while start and keys[start] not in self.checkpoints:
+            start -= 1
+        env = interpreter.env
+        output = interpreter.output
+        result = None
+        chain = None
+        steps = 0
+        if start:
+            checkpoint = self.checkpoints.pop(keys[start])
+            self.checkpoints[keys[start]] = checkpoint
+            checkpoint.restore(env)
+            for entry in checkpoint.entries():
+                if type(entry) is str:
+                    output.write(entry)
+                else:
+                    output.error(entry.kind, entry.message, entry.node)
+            result, chain, steps = checkpoint.result, checkpoint.output, checkpoint.steps
+        self.resumed, self.executed = start, len(statements) - start
+
+        governor.start(env)
+        governor.steps = steps
+        since = 0 # statements since the last checkpoint
+        written = [] # and the output they wrote
+        try:
+            interpreter.resolve(node)
+            for index in range(start, len(statements)):
+                capture = interpreter.output = CaptureSink()
+                try:
+                    result = interpreter.execute(statements[index])
+                finally:
+                    interpreter.output = output
+                    capture.replay(output)
+                if capture.entries:
+                    chain = (chain, tuple(capture.entries))
+                    written += capture.entries
+                since += 1
+                if since * CHECKPOINT_SPACING >= len(env.values) or index + 1 == len(statements):
+                    self.save(keys[index + 1], Checkpoint(env, result, governor.steps, chain, written))
+                    since = 0
+                    written = []
+            return result
+        finally:
+            output.flush()
+
+    def save(self, key, checkpoint):
+        old = self.checkpoints.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        if checkpoint.size > self.max_bytes:
+            return
+        self.checkpoints[key] = checkpoint
+        self.size += checkpoint.size
+        while self.size > self.max_bytes:
+            evicted = self.checkpoints.pop(next(iter(self.checkpoints)))
+            self.size -= evicted.size
+
+    def clear(self):
+        self.checkpoints = {}
+        self.size = 0
@@ -0,0 +1,96 @@
+import random
+
+from lexer import Lexer
+from parser import Parser
+
+# Hand-written programs covering every statement form, the literal kinds
+# and the diagnostics the engines report
+SAMPLES = {
+    'example': '''
+        x = 10;
+        y = 20;
+        sum = x + y;
+        if sum > 25 then
+            result = sum * 2
+        else
+            result = sum / 2;
+        counter = 0;
+        while counter < 3 do
+            counter = counter + 1;
+    ''',
+    'arithmetic': 'a = 7; b = 2; c = a + b * 3 - (a - b) / 2; d = -a + +b; e = a * a * a * a * a;',
+    'floats': 'x = 1.5; y = x * 2; z = y / 4; w = 0.1 + 0.2; v = 10 / 4;',
+    'comparisons': 'a = 3 < 4; b = 3 > 4; c = 4 <= 4; d = 5 >= 6; e = (1 < 2) + (2 < 3);',
+    'booleans': 't = true; f = false; n = t + f; if t then x = 1 else x = 2;',
+    'strings': 's = "hello"; c = \'q\'; t = s; u = s + 1; v = -s;',
+    'undefined': 'x = y + 1; z = 2;',
+    'division by zero': 'z = 0; a = 1 / z; b = 4 / 2; c = a + 1;',
+    'chained assignment': 'a = b = c = 4; d = (e = 2) * e;',
+    'nested if': '''
+        x = 5;
+        if x > 3 then
+            if x > 4 then y = 1 else y = 2
+        else if x > 1 then y = 3
+        else y = 4;
+    ''',
+    'counting loop': 'i = 0; total = 0; while i < 50 do i = i + 1; n = 0; while n < 40 do n = n + 3;',
+    'downward loop': 'k = 100; while k > 7 do k = k - 9; m = 10; while 0 < m do m = m - 1;',
+    'nested loops': '''
+        i = 0; j = 0; total = 0;
+        while (i = i + 1) < 6 do
+            while j < i do total = total + i * (j = j + 1);
+    ''',
+    'invariant loop': 'a = 4; b = 5; i = 0; while i < 200 do i = i + a * b - 19; s = a * b;',
+    'loop never runs': 'i = 10; while i < 5 do i = i + 1; j = i;',
+    'conditional assignment': 'x = 1; if x > 2 then y = 1; z = x;',
+    'loop with if': '''
+        i = 0; high = 0; low = 0;
+        while i < 25 do
+            if (i = i + 1) > 12 then high = high + 1 else low = low + i;
+    ''',
+    'large counts': '''
+        i = 9007199254740993; while i > 9007199254740990.5 do i = i - 1;
+        j = 0; while j < 1000000000000000000000 do j = j + 250000000000000000000;
+    ''',
+}
+
+def expression(rng, depth=0):
+    roll = rng.random()
+    if depth > 3 or roll < 0.3:
+        return rng.choice(['x', 'y', 'z', '0', '1', '3', '2.5', 'true', 'false'])
+    if roll < 0.4:
+        return f"({expression(rng, depth + 1)})"
+    if roll < 0.5:
+        return f"{rng.choice('-+')} {expression(rng, depth + 1)}"
+    if roll < 0.6:
+        return f"{rng.choice('xyz')} = {expression(rng, depth + 1)}"
+    operator = rng.choice(['+', '-', '*', '/', '<', '>', '<=', '>='])
+    return f"{expression(rng, depth + 1)} {operator} {expression(rng, depth + 1)}"
+
+def statement(rng, depth=0):
+    roll = rng.random()
+    if depth > 2 or roll < 0.5:
+        return expression(rng)
+    if roll < 0.75:
+        text = f"if {expression(rng)} then {statement(rng, depth + 1)}"
+        if rng.random() < 0.6:
+            text += f" else {statement(rng, depth + 1)}"
+        return text
+    return f"while {expression(rng)} do {statement(rng, depth + 1)}"
+
+def random_program(rng):
+    """A random program that parses; it may still fail analysis or loop
+    forever, so run it under a small budget."""
+    while True:
+        prelude = rng.choice(['', 's = "text";', 'd = 0;', 'w = 1 / d;', 'u = unknown + 1;'])
+        statements = [statement(rng) for _ in range(rng.randint(1, 6))]
+        code = 'x = 1; y = 2; z = 3;\n' + prelude + '\n'.join(text + ';' for text in statements)
+        try:
+            Parser(Lexer(code).tokenize()).parse()
+        except SyntaxError:
+            continue # e.g. an assignment to an operator's result
+        return code
+
+def random_programs(count, seed):
+    rng = random.Random(seed)
+    return [random_program(rng) for _ in range(count)]
@@ -0,0 +1,132 @@
+import random
+
+import pytest
+
+from batch import BatchInterpreter
+from governor import ExecutionGovernor
+from interpreter import Interpreter
+from lexer import Lexer
+from output import CaptureSink
+from parser import Parser
+
+pytest.importorskip('numpy')
+
+MAX_STEPS = 1000
+
+# Columns of the presets x, y and n. The int records include ints of 2**53
+# and more, which the batch runs with the scalar Interpreter, and zeros
+# that make / fail in some records only
+PRESETS = {
+    'ints': {
+        'x': [0, 1, -3, 7, 2 ** 53, -(2 ** 53) + 1, 2 ** 60, 12],
+        'y': [0, 2, 0, -1, 3, 5, 1, 0],
+        'n': [0, 3, 10, 1, 2, 4, 5, -2],
+    },
+    'floats': {
+        'x': [0.0, -0.0, 1.5, -2.25, 1e300, float('inf'), 0.1, 7.0],
+        'y': [0.0, 2.0, -0.0, 0.5, 1e300, 3.0, 0.2, -7.0],
+        'n': [0.0, 3.5, 10.0, 1.0, 2.0, -1.0, 0.5, 6.0],
+    },
+    'mixed': {
+        'x': [0, 1, -3, 7, 4503599627370496, 5, 9, -8],
+        'y': [0.0, 2.5, -0.0, 0.5, 1.5, 3.0, 0.25, -7.0],
+        'n': [0, 3, 10, 1, 2, 4, 5, 6],
+    },
+}
+
+PROGRAMS = [
+    'r = x * y + n;',
+    'r = x - y; s = -r; t = r - r;',
+    'c = (x < y) + (x >= n) - (y <= n) * (x > 0);',
+    # / fails in the records where y is zero, and so does what reads q
+    'r = x / y + n;',
+    'q = x / y; z = q + 1;',
+    'if x > 0 then r = x / y else r = y - x; w = r;',
+    'if y then d = n / y; e = d;',
+    # u is only assigned in some records
+    'if x > 1 then u = 1; v = u + x;',
+    'i = 0; t = 0; while i < n do t = t + (i = i + 1) * x;',
+    'while n > 0 do n = n - 1; m = n;',
+    'k = n; while (k = k - 1) > 0 do y = y + k * x;',
+    # Ints that reach 2**53 in some records only
+    'big = x * 4503599627370496; small = big - big;',
+    'f = 3; while (n = n - 1) >= 0 do f = f * 1000000;',
+    'z = 0 * (-1); w = 0.0 * (-1); v = 0 - 0.0 * x; u = (x * 0) - 0;',
+    # Literals that no record can hold in float64
+    'b = 9007199254740993 + x;',
+    'b = 9007199254740993 - 9007199254740993 + x;',
+    # Programs with strings run every record with the scalar Interpreter
+    's = "ab"; t = s + x;',
+    'if x > 0 then s = \'q\' else s = y; r = n;',
+    # Reads of variables that no record assigns
+    'r = missing + 1; s = x;',
+    'x = x;',
+]
+
+def scalar(code, columns, record):
+    """(result, variables, whether an error was reported) of code on the
+    scalar Interpreter with record's presets."""
+    output = CaptureSink()
+    interpreter = Interpreter({}, governor=ExecutionGovernor(max_steps=MAX_STEPS), output=output)
+    for name, values in columns.items():
+        interpreter.env[name] = values[record]
+    result = interpreter.eval(Parser(Lexer(code).tokenize()).parse())
+    return result, interpreter.get_formatted_env(), bool(output.diagnostics)
+
+def batched(code, columns):
+    """The same for every record, from one BatchInterpreter run."""
+    batch = BatchInterpreter(governor=ExecutionGovernor(max_steps=MAX_STEPS))
+    outcome = batch.run(Parser(Lexer(code).tokenize()).parse(), columns)
+    return list(zip(outcome.results(), outcome.environments(), outcome.errors.tolist()))
+
+def check(code, columns):
+    # repr tells 1 from 1.0 and -0.0 from 0.0, and nan equals itself. The
+    # batch lists variables in one order for all records, so the order of
+    # assignment in each record is not compared
+    def normalized(outcomes):
+        return repr([(result, sorted(variables.items()), errors) for result, variables, errors in outcomes])
+    expected = [scalar(code, columns, record) for record in range(len(columns['x']))]
+    assert normalized(batched(code, columns)) == normalized(expected), code
+
+@pytest.mark.parametrize('preset', PRESETS)
+@pytest.mark.parametrize('code', PROGRAMS)
+def test_records_match_the_scalar_interpreter(code, preset):
+    check(code, PRESETS[preset])
+
+def test_fallback_records_are_run_by_the_scalar_interpreter():
+    columns = PRESETS['ints']
+    batch = BatchInterpreter(governor=ExecutionGovernor(max_steps=MAX_STEPS))
+    outcome = batch.run(Parser(Lexer('r = x + 1;').tokenize()).parse(), columns)
+    assert sorted(outcome.overrides) == [4, 6]
+    assert outcome.column('r').tolist()[6] == 2 ** 60 + 1
+    outcome = batch.run(Parser(Lexer('s = "a"; r = x;').tokenize()).parse(), columns)
+    assert sorted(outcome.overrides) == list(range(8))
+
+def random_expression(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(['x', 'y', 'n', '0', '2', '1.5', '4503599627370496'])
+    operator = rng.choice(['+', '-', '*', '/', '<', '>=', '-'])
+    if operator == '-' and rng.random() < 0.3:
+        return f"(-{random_expression(rng, depth + 1)})"
+    return f"({random_expression(rng, depth + 1)} {operator} {random_expression(rng, depth + 1)})"
+
+def random_program(rng):
+    """Statements over the presets; n is never assigned, so every loop
+    ends within ten iterations."""
+    statements = []
+    for _ in range(rng.randint(1, 5)):
+        roll = rng.random()
+        target = rng.choice('xyabc')
+        if roll < 0.6:
+            statements.append(f"{target} = {random_expression(rng)}")
+        elif roll < 0.85:
+            statements.append(f"if {random_expression(rng)} then {target} = {random_expression(rng)} "
+                              f"else {rng.choice('abc')} = {random_expression(rng)}")
+        else:
+            statements.append(f"i = 0; while (i = i + 1) < n do {target} = {random_expression(rng)}")
+    return '; '.join(statements) + ';'
+
+def test_random_programs_match_the_scalar_interpreter():
+    rng = random.Random(17)
+    for _ in range(300):
+        check(random_program(rng), PRESETS[rng.choice(list(PRESETS))])
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from engines import create_engine
+from governor import ExecutionGovernor, BudgetExceeded
+from lexer import Lexer
+from optimizer import Optimizer
+from output import CaptureSink
+from parser import Parser
+from semantic import SemanticAnalyzer
+
+MAX_STEPS = 1000
+ENGINES = ['tree', 'vm', 'closure', 'python', 'ir']
+
+PRELUDE = 'a = 3; b = 4; c = 5; '
+
+# (program, common subexpressions eliminated). Every program must end the
+# same way with and without the optimizer, on every engine
+CORPUS = [
+    (PRELUDE + 'x = a * b + c; y = a * b + c;', 1),
+    (PRELUDE + 'x = a * b + c; y = a * b + c; z = a * b + c;', 2),
+    (PRELUDE + 'x = (a * b + c) * (a * b + c);', 1),
+    (PRELUDE + 'x = a * b + c + (a * b + c) + (a * b + c);', 2),
+    (PRELUDE + 'x = a * b * c; y = a * b * c; z = a * b;', 1),
+    ('a = 2.5; b = 4; c = 1; x = a * b - c; y = (a * b - c) * (a * b - c);', 2),
+    ('a = 9007199254740993; b = 3; c = 1; x = a * b + c; y = a * b + c;', 1),
+    # Computed at the start of both branches
+    (PRELUDE + 'if a > 1 then x = a * b + c else x = a * b + c - 1;', 1),
+    # An assignment to a variable the expression does not read
+    (PRELUDE + 'x = a * b + c; if a > 9 then x = 1; y = a * b + c;', 1),
+    (PRELUDE + 'i = 0; while i < 50 do i = i + (a * b + c) * (a * b + c);', 1),
+    # An input assigned in between, maybe or inside the expression
+    (PRELUDE + 'x = a * b + c; a = 7; y = a * b + c;', 0),
+    (PRELUDE + 'x = a * b + c; if a > 9 then b = 1; y = a * b + c;', 0),
+    (PRELUDE + 'x = a * b + c; while a < 5 do a = a + 1; y = a * b + c;', 0),
+    (PRELUDE + 'x = (a = a + 1) * b + c; y = a * b + c;', 0),
+    # Operators that can print an error are left where they are
+    ('a = 3; b = 0; c = 5; x = a / b + c; y = a / b + c;', 0),
+    ('a = 3; b = 2; c = 5; x = a / b + c; y = a / b + c;', 0),
+    (PRELUDE + 'if a > 9 then u = 1; x = u * b + c; y = u * b + c;', 0),
+]
+
+def outcome(code, level, engine='tree'):
+    """(result, variables, output) of running code optimized at level on
+    engine, or BudgetExceeded; with the Optimizer's changes."""
+    ast = Parser(Lexer(code).tokenize()).parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+    governor = ExecutionGovernor(max_steps=MAX_STEPS)
+    optimizer = Optimizer(level, governor)
+    ast = optimizer.optimize(ast)
+    sink = CaptureSink()
+    interpreter = create_engine(engine, analyzer.symbol_table, governor=governor, output=sink)
+    try:
+        result = (interpreter.eval(ast), interpreter.get_formatted_env(), sink.getvalue())
+    except BudgetExceeded:
+        result = BudgetExceeded
+    return result, optimizer.changes
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('code, eliminated', CORPUS)
+def test_eliminated_subexpressions_run_the_same(code, eliminated, engine):
+    expected, _ = outcome(code, 0)
+    actual, changes = outcome(code, 3, engine)
+    assert actual == expected
+    assert changes['common subexpressions eliminated'] == eliminated
+
+def random_expression(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(['a', 'b', 'c', 'd', '2', '1.5'])
+    operator = rng.choice(['+', '-', '*', '*', '<', '/'])
+    return f"({random_expression(rng, depth + 1)} {operator} {random_expression(rng, depth + 1)})"
+
+def random_program(rng):
+    """Statements drawing on a few shared expressions, so that most
+    programs repeat some of them."""
+    shared = [random_expression(rng) for _ in range(3)]
+    def expression():
+        if rng.random() < 0.6:
+            return rng.choice(shared)
+        return f"{rng.choice(shared)} {rng.choice('+-*')} {random_expression(rng, 2)}"
+    statements = []
+    for _ in range(rng.randint(2, 8)):
+        roll = rng.random()
+        target = rng.choice('abcdxyz')
+        if roll < 0.6:
+            statements.append(f"{target} = {expression()}")
+        elif roll < 0.8:
+            statements.append(f"if {expression()} then {target} = {expression()} else x = {expression()}")
+        else:
+            statements.append(f"while (i = i + 1) < 4 do {target} = {expression()}")
+    return rng.choice([PRELUDE + 'd = 0; ', PRELUDE + 'd = 2.5; ']) + 'i = 0; ' + '; '.join(statements) + ';'
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_random_programs_run_the_same(engine):
+    rng = random.Random(15)
+    eliminated = 0
+    for _ in range(150):
+        code = random_program(rng)
+        expected, _ = outcome(code, 0)
+        actual, changes = outcome(code, 3, engine)
+        assert actual == expected, code
+        eliminated += changes['common subexpressions eliminated']
+    assert eliminated > 300
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from engines import ENGINES, DEFAULT_ENGINE, create_engine
+from governor import ExecutionGovernor, BudgetExceeded
+from interpreter import Interpreter
+from lexer import Lexer
+from output import CaptureSink
+from parser import Parser
+from programs import SAMPLES, random_programs
+from scheduler import ParallelInterpreter
+from semantic import SemanticAnalyzer
+
+ALTERNATIVES = [name for name in ENGINES if name != DEFAULT_ENGINE]
+
+def run(name, code, max_steps=None):
+    """Run code on one engine: (result, variables, output), or the error raised."""
+    ast = Parser(Lexer(code).tokenize()).parse()
+    analyzer = SemanticAnalyzer()
+    try:
+        analyzer.analyze(ast)
+    except Exception as error:
+        return ('analysis', str(error))
+    sink = CaptureSink()
+    governor = ExecutionGovernor(max_steps=max_steps) if max_steps else None
+    engine = create_engine(name, analyzer.symbol_table, governor=governor, output=sink)
+    try:
+        result = engine.eval(ast)
+    except BudgetExceeded:
+        return BudgetExceeded
+    return result, engine.get_formatted_env(), sink.getvalue()
+
+@pytest.mark.parametrize('name', ALTERNATIVES)
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_samples_match_the_tree_interpreter(name, sample):
+    code = SAMPLES[sample]
+    assert run(name, code) == run(DEFAULT_ENGINE, code)
+
+# The parallel engine starts a process pool per program; the samples cover it
+@pytest.mark.parametrize('name', [name for name in ALTERNATIVES if name != 'parallel'])
+def test_random_programs_match_the_tree_interpreter(name):
+    compared = 0
+    for code in random_programs(300, seed=9):
+        expected = run(DEFAULT_ENGINE, code, max_steps=500)
+        if expected is BudgetExceeded:
+            continue # engines that skip loops count steps differently
+        actual = run(name, code, max_steps=500)
+        if actual is not BudgetExceeded:
+            assert actual == expected, code
+            compared += 1
+    assert compared > 200
+
+def parallel_program(rng):
+    """Two to four groups of statements over their own variables, each with
+    a loop costed above PARALLEL_MIN_COST, and some statements joining them;
+    the loops may print diagnostics or read a variable another group sets."""
+    lines = ['s = "text"; zero = 0;']
+    groups = rng.randint(2, 4)
+    for group in range(groups):
+        i, t = f"i{group}", f"t{group}"
+        body = rng.choice([
+            f"{t} = {t} + {i} * ({i} * 2 - 1) - {t} / 7",
+            f"{t} = {t} + 1 / ({i} - 3) + {i} * {i}",
+            f"{t} = {t} + {i} * {i} - (u{group} = {i} * 3) + s",
+            f"{t} = {t} + {i} * {i} + {t} / zero * 0 + 1",
+        ])
+        lines.append(f"{i} = 0; {t} = 0;")
+        lines.append(f"while ({i} = {i} + 1) < {rng.randint(2, 60)} do {body};")
+        if rng.random() < 0.3:
+            lines.append(f"if {t} > 100 then big{group} = {t} else big{group} = 0;")
+    if rng.random() < 0.5:
+        other = rng.randrange(groups)
+        lines.append(f"j = 0; while (j = j + 1) < 20 do t{other} = t{other} + j * j * j - j * 2;")
+    lines.append(' + '.join(f"t{group}" for group in range(groups)) + ';')
+    return '\n'.join(lines)
+
+def test_parallel_tasks_match_the_tree_interpreter(monkeypatch):
+    calls = []
+    run_tasks = ParallelInterpreter.run_tasks
+    def counted(self, *args):
+        finished = run_tasks(self, *args)
+        calls.append(1) # not counted when it raises and the program reruns in order
+        return finished
+    monkeypatch.setattr(ParallelInterpreter, 'run_tasks', counted)
+    rng = random.Random(18)
+    for _ in range(25):
+        code = parallel_program(rng)
+        ast = Parser(Lexer(code).tokenize()).parse()
+        results = []
+        for engine in (Interpreter({}, output=CaptureSink()), ParallelInterpreter({}, workers=2, output=CaptureSink())):
+            results.append((engine.eval(ast), engine.get_formatted_env(), engine.output.getvalue()))
+        assert results[1] == results[0], code
+    # Every program has at least two tasks for the pool
+    assert len(calls) == 25
@@ -0,0 +1,44 @@
+import random
+
+from incremental import IncrementalFrontEnd
+from lexer import Lexer
+from programs import SAMPLES, random_programs
+
+def as_tuples(tokens):
+    return [(token.type, token.value, token.pos, token.line, token.column) for token in tokens]
+
+def test_token_views_match_a_full_lex_after_edits():
+    rng = random.Random(7)
+    pieces = list(SAMPLES.values()) + random_programs(100, seed=7)
+    front_end = IncrementalFrontEnd()
+    code = ''
+    compared = 0
+    while compared < 200:
+        # Splice some program text into the source; an update that fails to
+        # lex or parse leaves the front end as it was
+        start = rng.randrange(len(code) + 1)
+        end = min(len(code), start + rng.randrange(30))
+        edited = code[:start] + rng.choice(pieces)[:rng.randrange(60)] + code[end:]
+        try:
+            front_end.update(edited)
+        except SyntaxError:
+            continue
+        code = edited
+        compared += 1
+        expected = as_tuples(Lexer(code).tokenize())
+        view = front_end.token_view()
+        assert len(view) == len(expected)
+        assert as_tuples(view) == expected, code
+        for _ in range(5):
+            start = rng.randrange(-len(expected) - 2, len(expected) + 2)
+            end = rng.randrange(-len(expected) - 2, len(expected) + 2)
+            assert as_tuples(view[start:end]) == expected[start:end], code
+            index = rng.randrange(-len(expected), len(expected))
+            assert as_tuples([view[index]]) == [expected[index]], code
+
+def test_token_views_outlive_later_updates():
+    front_end = IncrementalFrontEnd()
+    front_end.update('x = 1;\ny = 2;')
+    view = front_end.token_view()
+    front_end.update('z = 0;\nx = 1;\ny = 2;')
+    assert as_tuples(view) == as_tuples(Lexer('x = 1;\ny = 2;').tokenize())
@@ -0,0 +1,59 @@
+import io
+import random
+
+import pytest
+
+from lexer import Lexer
+from programs import SAMPLES, random_programs
+
+# Sources at the edges of the token grammar: word boundaries, numbers that
+# may grow, two-character operators and literals cut short
+EDGE_CASES = [
+    '12true', 'true12', 'truex = 1;', 'x = 1.5.3;', '1. + .5', 'a<=b>=c<d>e',
+    'x = "a b";', "c = 'q';", 'if1 = 2; iff = thenx;', '\n\n  x\t=\n1 ;',
+    '', ' ', '007', '1e5', 'x = -.5 * +3.;',
+]
+ILLEGAL = ['x = @;', 'x = "open', "c = 'q", 's = "line\nbreak";', 'x = 1 # 2;', 'é = 1;']
+
+def as_tuples(tokens):
+    return [(token.type, token.value, token.pos, token.line, token.column) for token in tokens]
+
+def tokens(code, backend):
+    return as_tuples(Lexer(code, backend).tokenize())
+
+def outcome(scan):
+    try:
+        return scan()
+    except SyntaxError as error:
+        return str(error)
+
+def random_source(rng):
+    pieces = ['x', 'y1', '_z', 'if', 'then', 'else', 'while', 'do', 'true', 'false', '0', '12', '3.25',
+              '"s"', "'c'", '+', '-', '*', '/', '=', '<', '>', '<=', '>=', '(', ')', ';', ' ', '\n', '.']
+    return ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 40)))
+
+SOURCES = list(SAMPLES.values()) + random_programs(100, seed=2) + EDGE_CASES
+
+@pytest.mark.parametrize('code', SOURCES + ILLEGAL)
+def test_backends_agree(code):
+    assert outcome(lambda: tokens(code, 'regex')) == outcome(lambda: tokens(code, 'table'))
+
+def test_backends_agree_on_random_sources():
+    rng = random.Random(7)
+    for _ in range(2000):
+        code = random_source(rng)
+        assert outcome(lambda: tokens(code, 'regex')) == outcome(lambda: tokens(code, 'table')), code
+
+@pytest.mark.parametrize('backend', ['regex', 'table'])
+def test_compact_and_streamed_tokens_match(backend):
+    for code in SOURCES + ILLEGAL:
+        expected = outcome(lambda: tokens(code, backend))
+        assert outcome(lambda: as_tuples(Lexer(code, backend).tokenize_compact())) == expected, code
+        # Tiny chunks put every token boundary at a chunk edge at least once
+        lexer = Lexer.from_file(io.StringIO(code), chunk_size=3, backend=backend)
+        assert outcome(lambda: as_tuples(lexer.iter_tokens())) == expected, code
+
+def test_line_spans_agree():
+    for code in SOURCES + ILLEGAL:
+        for line in code.split('\n'):
+            assert Lexer(line, 'regex').line_spans() == Lexer(line, 'table').line_spans(), line
@@ -0,0 +1,112 @@
+import random
+import threading
+
+import pytest
+
+from governor import ExecutionGovernor, BudgetExceeded
+from interpreter import Interpreter
+from lexer import Lexer
+from optimizer import Optimizer
+from output import CaptureSink
+from parser import Parser
+from semantic import SemanticAnalyzer
+
+MAX_STEPS = 1000
+
+# (program, whether the loop optimizer replaces its loop). Every program
+# must end the same way with and without the optimizer: same result,
+# variables and output, or the same budget exceeded
+CORPUS = [
+    ('i = 0; while i < 10 do i = i + 1;', True),
+    ('i = 0; while i < 10 do i = i + 3;', True),
+    ('i = 0; while i <= 10 do i = i + 2;', True),
+    ('i = 100; while i > 7 do i = i - 9;', True),
+    ('i = 100; while i >= 1 do i = i - 1;', True),
+    ('m = 10; while 0 < m do m = m - 1;', True),
+    ('n = 10; i = 0; while i < n do i = i + 1;', True),
+    ('i = 10; while i < 5 do i = i + 1; j = i;', True),
+    ('i = -5; while i < -5 do i = i + 1;', True),
+    ('i = 0; while i < 1000 do i = i + 1;', True),
+    ('i = 0; while i < 1001 do i = i + 1;', False),
+    # Large ints, where stepping through floats would lose count
+    ('i = 0; while i < 1000000000000000000000 do i = i + 250000000000000000000;', True),
+    ('i = 0; while i < 1000000000000000000001 do i = i + 250000000000000000000;', True),
+    ('i = 9007199254740993; while i > 9007199254740990 do i = i - 1;', True),
+    ('i = 9007199254740993; while i >= 9007199254740990 do i = i - 1;', True),
+    ('i = 0; while i < 100000000000000000000000000000 do i = i + 1;', False),
+    # Float bounds, compared exactly against the int induction variable
+    ('i = 0; while i < 10.5 do i = i + 2;', True),
+    ('i = 0; while i <= 10.0 do i = i + 2;', True),
+    ('i = 9007199254740993; while i > 9007199254740990.5 do i = i - 1;', True),
+    ('i = 9007199254740993; while i > 9007199254740992.0 do i = i - 1;', True),
+    ('i = 0; while i < 0.30000000000000004 do i = i + 1;', True),
+    ('i = 0; while 2.5 > i do i = i + 1;', True),
+    ('i = 0; while i < 1' + '0' * 300 + '.0 do i = i + 1;', False),
+    ('i = 0; while i < 1' + '0' * 400 + '.0 do i = i + 1;', False), # inf
+    ('i = 0; while i > -1' + '0' * 400 + '.0 do i = i - 1;', False),
+    # Loops that never end, or whose steps never reach the bound
+    ('i = 0; while i > -1 do i = i + 1;', False),
+    ('i = 0; while i < 5 do i = i + 0;', False),
+    ('i = 0; while i < 5 do i = i - 1;', False),
+]
+
+def outcome(code, level):
+    """(result, variables, output) of running code optimized at level, or
+    BudgetExceeded; with the Optimizer's changes."""
+    ast = Parser(Lexer(code).tokenize()).parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+    governor = ExecutionGovernor(max_steps=MAX_STEPS)
+    optimizer = Optimizer(level, governor)
+    ast = optimizer.optimize(ast)
+    sink = CaptureSink()
+    interpreter = Interpreter(analyzer.symbol_table, governor=governor, output=sink)
+    try:
+        result = (interpreter.eval(ast), interpreter.get_formatted_env(), sink.getvalue())
+    except BudgetExceeded:
+        result = BudgetExceeded
+    return result, optimizer.changes
+
+def finishes(func, seconds=10):
+    """func's return value, failing the test when it runs for longer than
+    seconds (the thread is left to finish on its own)."""
+    results = []
+    def target():
+        try:
+            results.append((True, func()))
+        except Exception as error:
+            results.append((False, error))
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert results, f"still running after {seconds}s"
+    returned, value = results[0]
+    if not returned:
+        raise value
+    return value
+
+@pytest.mark.parametrize('code, replaced', CORPUS)
+def test_optimized_loops_run_the_same(code, replaced):
+    expected, _ = outcome(code, 0)
+    actual, changes = finishes(lambda: outcome(code, 3))
+    assert actual == expected
+    assert bool(changes.get('loops replaced')) is replaced
+
+def test_random_counting_loops_run_the_same():
+    rng = random.Random(3)
+    bounds = [0, 1, 7, -7, 2.5, -2.5, 0.1, 0.001, 2 ** 53 + 1, 2.0 ** 53, 10 ** 20, 10.0 ** 20]
+    replaced = 0
+    for _ in range(1500):
+        start = rng.choice([0, 1, -3, 10, 2 ** 53 - 2, 10 ** 20])
+        bound = rng.choice(bounds) + rng.choice([0, 0, 1, -1, 250])
+        step = rng.choice([1, 2, 3, 7, -1, -4, 0, 10 ** 18])
+        operator = rng.choice(['<', '<=', '>', '>='])
+        # The language has no exponent notation
+        literal = repr(bound) if type(bound) is int else f"{bound:.17f}"
+        condition = f"i {operator} {literal}" if rng.random() < 0.7 else f"{literal} {operator} i"
+        code = f"i = {start}; while {condition} do i = i + {step}; j = i;".replace('+ -', '- ')
+        expected, _ = outcome(code, 0)
+        actual, changes = finishes(lambda: outcome(code, 3))
+        assert actual == expected, code
+        replaced += bool(changes.get('loops replaced'))
+    assert replaced > 500
@@ -0,0 +1,36 @@
+import pytest
+
+from interpreter import Interpreter
+from ir import Lowering, DefUse
+from lexer import Lexer
+from output import CaptureSink
+from parser import Parser
+from passes import PASSES, PassManager
+from programs import SAMPLES, random_programs
+
+def lowered(code):
+    ast = Parser(Lexer(code).tokenize()).parse()
+    interpreter = Interpreter({}, output=CaptureSink())
+    checked = interpreter.resolve(ast)
+    return Lowering().lower(ast, interpreter.env.names, checked)
+
+@pytest.mark.parametrize('code', list(SAMPLES.values()) + random_programs(200, seed=16))
+def test_kept_def_use_maps_match_the_program(code):
+    # A pass that reports no changes keeps the program's DefUse for the
+    # passes after it, so it must not have changed what the maps record
+    manager = PassManager(pipeline=[])
+    for name, function in PASSES.items():
+        def checked(program, name=name, function=function):
+            count = function(program)
+            if not count and program.analysis is not None:
+                kept = program.analysis
+                rebuilt = DefUse(program)
+                assert kept.owner == rebuilt.owner, name
+                assert kept.definitions == rebuilt.definitions, name
+                assert ({value: set(users) for value, users in kept.uses.items()}
+                        == {value: set(users) for value, users in rebuilt.uses.items()}), name
+            return count
+        manager.register(name, checked)
+    program = lowered(code)
+    program.def_use()
+    manager.run(program)
@@ -0,0 +1,50 @@
+import threading
+
+from interpreter import Interpreter
+from lexer import Lexer
+from output import CaptureSink
+from parser import Parser, BlockNode
+from resolver import Resolver, resolved_slots
+
+def parse(code):
+    return Parser(Lexer(code).tokenize()).parse()
+
+def interpreter():
+    return Interpreter({}, output=CaptureSink())
+
+def test_environments_keep_their_resolution_of_a_shared_tree():
+    tree = parse('x = 1; y = x + 2; z = y * x;')
+    first, second = interpreter(), interpreter()
+    first.resolve(tree)
+    second.resolve(tree)
+    # Both allocate x, y, z in the same order, so neither moves a slot
+    assert resolved_slots(tree, first.env) is not None
+    assert resolved_slots(tree, second.env) is not None
+
+def test_moving_a_shared_slot_resolves_the_other_tree_again():
+    tree = parse('x = 1; y = x + 2;')
+    # An edit that keeps tree's statements, as IncrementalFrontEnd does, but
+    # assigns y first, so its environment gives y and x other slots
+    edited = BlockNode(parse('y = 5;').statements + tree.statements)
+    first, second = interpreter(), interpreter()
+    assert first.eval(tree) == 3
+    generation = Resolver.generation
+    assert second.eval(edited) == 3
+    assert Resolver.generation > generation
+    assert resolved_slots(tree, first.env) is None
+    assert first.eval(tree) == 3
+    assert first.get_formatted_env() == {'x': 1, 'y': 3}
+    assert second.get_formatted_env() == {'y': 3, 'x': 1}
+
+def test_threads_run_one_tree_in_their_own_environments():
+    tree = parse('i = 0; total = 0; while i < 2000 do total = total + (i = i + 1); done = total;')
+    results = []
+    def run():
+        engine = interpreter()
+        results.append((engine.eval(tree), engine.get_formatted_env()))
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(2001000, {'i': 2000, 'total': 2001000, 'done': 2001000})] * 8
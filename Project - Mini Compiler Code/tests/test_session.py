@@ -0,0 +1,115 @@
+import random
+
+from governor import ExecutionGovernor, BudgetExceeded
+from interpreter import Interpreter
+from lexer import Lexer
+from output import CaptureSink
+from parser import Parser
+from programs import random_programs
+from session import Session
+
+def parse(code):
+    return Parser(Lexer(code).tokenize()).parse()
+
+def run(code, session=None, **budgets):
+    """(result, variables, output) of code on a new Interpreter, through
+    session when given, or BudgetExceeded with the output before it."""
+    interpreter = Interpreter({}, governor=ExecutionGovernor(**budgets), output=CaptureSink())
+    try:
+        if session is None:
+            result = interpreter.eval(parse(code))
+        else:
+            result = session.run(interpreter, parse(code))
+    except BudgetExceeded:
+        return BudgetExceeded, interpreter.output.getvalue()
+    return result, interpreter.get_formatted_env(), interpreter.output.getvalue()
+
+# (statements, index of the first statement the edit changed). Every run
+# starts from a freshly parsed tree, as the GUI's runs do
+EDITS = [
+    (['x = 1', 'y = x + 2', 'z = 1 / 0', 's = "a"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * z'], None),
+    (['x = 1', 'y = x + 2', 'z = 1 / 0', 's = "a"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * 2'], 6),
+    (['x = 1', 'y = x + 3', 'z = 1 / 0', 's = "a"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * 2'], 1),
+    (['x = 1', 'y = x + 3', 'z = 1 / 0', 's = "a"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * 2', 'v = w'], 7),
+    (['x = 1', 'y = x + 3', 'z = 1 / 0', 's = "b"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * 2', 'v = w'], 3),
+    (['x = 1', 'y = x + 3', 'z = 1 / 0', 's = "a"', 'i = 0', 'while i < 30 do i = i + y', 'w = i * 2'], 7),
+    (['x = 2', 'y = x + 3'], 0),
+]
+
+def test_resumed_runs_match_fresh_runs_over_edits():
+    session = Session()
+    for statements, changed in EDITS:
+        code = ';\n'.join(statements) + ';'
+        assert run(code, session) == run(code)
+        if changed is None:
+            assert session.resumed == 0
+        else:
+            # Each statement is checkpointed in programs this small
+            assert session.resumed == changed
+        assert session.resumed + session.executed == len(statements)
+
+def test_random_edits_match_fresh_runs():
+    rng = random.Random(24)
+    session = Session()
+    programs = random_programs(60, seed=24)
+    for code in programs:
+        statements = [text for text in code.split(';') if text.strip()]
+        for _ in range(4):
+            index = rng.randrange(len(statements))
+            statements[index] = rng.choice(programs).split(';')[0]
+            edited = ';'.join(statements) + ';'
+            assert run(edited, session, max_steps=300) == run(edited, max_steps=300), edited
+
+def test_checkpoints_only_resume_under_the_same_budgets():
+    code = 'i = 0; while i < 500 do i = i + 1; j = i; k = j * 2;'
+    session = Session()
+    assert run(code, session, max_steps=1000) == run(code, max_steps=1000)
+    assert run(code, session, max_steps=1000) == run(code, max_steps=1000)
+    assert session.resumed == 4
+    # Under a smaller budget the loop stops the run; a checkpoint taken
+    # after it would skip the loop and finish
+    assert run(code, session, max_steps=100) == run(code, max_steps=100)
+    assert session.resumed == 0
+    assert run(code, session, max_steps=1000, trace=True) == run(code, max_steps=1000, trace=True)
+    assert session.resumed == 0
+    assert run(code, session, max_steps=1000) == run(code, max_steps=1000)
+    assert session.resumed == 4
+
+def test_checkpoints_are_evicted_least_recently_used_first():
+    probe = Session()
+    run('a = 1;', probe)
+    # Every program here is one statement over one variable, so each
+    # keeps one checkpoint of the same size
+    session = Session(max_bytes=probe.size * 3)
+    for name in 'abc':
+        run(f"{name} = 1;", session)
+    run('a = 1;', session)
+    assert session.resumed == 1
+    run('d = 1;', session)
+    assert len(session.checkpoints) == 3 and session.size <= session.max_bytes
+    for name in 'acd':
+        run(f"{name} = 1;", session)
+        assert session.resumed == 1
+    run('b = 1;', session)
+    assert session.resumed == 0
+
+def test_resuming_keeps_the_checkpoint_it_resumed_from():
+    probe = Session()
+    run('a = 1; a2 = a + 1; a3 = a2 * 3;', probe)
+    session = Session(max_bytes=probe.size)
+    code = 'a = 1; a2 = a + 1; a3 = a2 * 3;'
+    run(code, session)
+    run(code, session)
+    # The last statement's checkpoint was used, so its prefixes go first
+    run('b = 1;', session)
+    assert session.size <= session.max_bytes
+    assert run(code, session) == run(code)
+    assert session.resumed == 3
+
+def test_checkpoints_larger_than_max_bytes_are_not_kept():
+    session = Session(max_bytes=10)
+    code = 'x = 1; y = 2;'
+    assert run(code, session) == run(code)
+    assert session.checkpoints == {} and session.size == 0
+    run(code, session)
+    assert session.resumed == 0
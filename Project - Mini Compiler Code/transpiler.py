@@ -0,0 +1,290 @@
+import math
+
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from interpreter import Interpreter
+from resolver import UNSET
+
+COMPARISONS = ('<', '>', '<=', '>=')
+ARITHMETIC = ('+', '-', '*', '/')
+
+class FastPathFailed(Exception):
+    """Raised by generated code for an expression only the interpreter can report."""
+
+# Errors the inline fast path may raise instead of reporting a diagnostic;
+# the expression is then re-evaluated by the interpreter, which reports it
+FAST_PATH_ERRORS = (KeyError, ZeroDivisionError, TypeError, FastPathFailed)
+
+class Transpiler:
+    """Lowers the parser's AST to the source of a Python function.
+
+    The generated function takes the list of variable slots (env.values of
+    the resolved tree's Environment), the governor's tick function and the
+    function that writes a loop trace line (None when not tracing), and
+    returns the program's result.
+    if/else and while become native Python statements. In programs without
+    string literals every operand is a number, so arithmetic and comparisons
+    are emitted as inline Python operations; an expression that fails there
+    (undefined variable, division by zero, invalid literal) is evaluated
+    again by the interpreter, which reports the usual message. Programs with
+    strings, and expressions containing nested assignments, use checked
+    helper calls instead, except for operators the semantic analyzer typed
+    as numeric, which are always inlined.
+    """
+
+    def transpile(self, node, checked_slots=()):
+        self.lines = []
+        self.nodes = [] # expressions the generated code may hand back to the interpreter
+        self.constants = {}
+        self.checked = _contains(node, StringNode)
+        self.checked_slots = checked_slots
+        self.line('def __program(slots, __tick, __trace):')
+        self.statement(node, '__r', 1)
+        self.line('return __r', 1)
+        return '\n'.join(self.lines) + '\n'
+
+    def line(self, text, depth=0):
+        self.lines.append('    ' * depth + text)
+
+    def statement(self, node, target, depth):
+        """Emit code that runs node and stores its value in target."""
+        node_type = type(node)
+        if node_type is BlockNode:
+            if not node.statements:
+                self.line(f'{target} = None', depth)
+            for stmt in node.statements:
+                self.statement(stmt, target, depth)
+
+        elif node_type is IfNode:
+            self.evaluate(node.condition, '__c', depth)
+            self.line('if __c is None:', depth)
+            self.line(f'{target} = None', depth + 1)
+            # Custom truthiness rule: > 0 is true, <= 0 is false
+            self.line('elif __c > 0:', depth)
+            self.statement(node.then_branch, target, depth + 1)
+            self.line('else:', depth)
+            if node.else_branch:
+                self.statement(node.else_branch, target, depth + 1)
+            else:
+                self.line(f'{target} = None', depth + 1)
+
+        elif node_type is WhileNode:
+            count = f'__n{depth}'
+            self.line(f'{target} = None', depth)
+            self.line(f'{count} = 0', depth)
+            self.line('while True:', depth)
+            self.evaluate(node.condition, '__c', depth + 1)
+            self.line('if not __c:', depth + 1)
+            self.line('break', depth + 2)
+            self.line(f'{count} += 1', depth + 1)
+            self.line(f'__tick({count})', depth + 1)
+            self.statement(node.body, target, depth + 1)
+            self.line('if __trace:', depth + 1)
+            self.line(f'__trace(f"Result: {{{target}}}")', depth + 2)
+
+        elif node_type in (NumberNode, VarNode, StringNode, BinOpNode, UnaryOpNode, AssignNode):
+            self.evaluate(node, target, depth)
+
+        else:
+            self.line(f'{target} = __unknown({node_type.__name__!r})', depth)
+
+    def evaluate(self, node, target, depth):
+        """Emit code that evaluates the expression node into target."""
+        value = node.value if type(node) is AssignNode else node
+        if self.checked or _contains(value, AssignNode):
+            # Nested assignments make the expression impure, so it cannot
+            # simply be re-run after a failure
+            self.line(f'{target} = {self.checked_expression(node)}', depth)
+            return
+        store = target
+        if type(node) is AssignNode:
+            # The store comes last, so a failed fast path has no side effects
+            # and the interpreter can redo the whole assignment
+            store = f'slots[{node.slot}] = {target}'
+        if type(value) is NumberNode and number_value(value.value) is not None:
+            self.line(f'{store} = {self.constant(number_value(value.value))}', depth)
+            return
+        if _is_typed(value):
+            self.line(f'{store} = {self.fast_expression(value)}', depth)
+            return
+        expression = self.fast_expression(value)
+        if type(value) is VarNode and value.slot in self.checked_slots:
+            # Inside an operator an unassigned slot raises TypeError by itself
+            expression = f'__defined({expression})'
+        self.nodes.append(node)
+        self.line('try:', depth)
+        self.line(f'{store} = {expression}', depth + 1)
+        self.line('except __FAST_PATH_ERRORS:', depth)
+        self.line(f'{target} = __eval(__nodes[{len(self.nodes) - 1}])', depth + 1)
+
+    def fast_expression(self, node):
+        node_type = type(node)
+        if node_type is NumberNode:
+            value = number_value(node.value)
+            return '__fail()' if value is None else self.constant(value)
+        if node_type is VarNode:
+            return f'slots[{node.slot}]'
+        if node_type is BinOpNode:
+            left = self.fast_expression(node.left)
+            right = self.fast_expression(node.right)
+            if node.op in ARITHMETIC:
+                return f'({left} {node.op} {right})'
+            if node.op in COMPARISONS:
+                return f'(1 if {left} {node.op} {right} else 0)'
+            return '__fail()'
+        if node_type is UnaryOpNode and node.op in ('+', '-'):
+            return f'(0 {node.op} {self.fast_expression(node.operand)})'
+        return '__fail()'
+
+    def checked_expression(self, node):
+        node_type = type(node)
+        if node_type is NumberNode:
+            value = number_value(node.value)
+            return f'__invalid({node.value!r})' if value is None else self.constant(value)
+        if node_type is StringNode:
+            return repr(node.value)
+        if node_type is VarNode:
+            return f'__load({node.slot})'
+        if node_type is BinOpNode:
+            if _is_typed(node) and not _contains(node, AssignNode):
+                return self.fast_expression(node)
+            left = self.checked_expression(node.left)
+            right = self.checked_expression(node.right)
+            return f'__binary_op({node.op!r}, {left}, {right})'
+        if node_type is UnaryOpNode:
+            if _is_typed(node) and not _contains(node, AssignNode):
+                return self.fast_expression(node)
+            return f'__binary_op({node.op!r}, 0, {self.checked_expression(node.operand)})'
+        if node_type is AssignNode:
+            return f'__store({node.slot}, {self.checked_expression(node.value)})'
+        return f'__unknown({node_type.__name__!r})'
+
+    def constant(self, value):
+        if type(value) is int or math.isfinite(value):
+            return repr(value)
+        name = self.constants.get(value)
+        if name is None:
+            name = self.constants[value] = f'__k{len(self.constants)}'
+        return name
+
+class PythonInterpreter(Interpreter):
+    """Interpreter that transpiles the AST to Python and runs the compiled code.
+
+    The generated source of the last compiled program is kept in self.source
+    for debugging.
+    """
+
+    def __init__(self, symbol_table, input_func=None, governor=None, output=None):
+        super().__init__(symbol_table, input_func, governor, output)
+        self.source = None
+        self.compiled = None # (node, program) of the last compile; ASTs are immutable
+
+    def eval(self, node):
+        if self.compiled is None or self.compiled[0] is not node:
+            self.compiled = (node, self.compile(node))
+        program = self.compiled[1]
+        if program is None:
+            return self.tree_walker().eval(node)
+        self.governor.start(self.env)
+        trace = self.output.write if self.governor.trace else None
+        try:
+            return program(self.env.values, self.governor.tick, trace)
+        finally:
+            self.output.flush()
+
+    def compile(self, node):
+        """Return the compiled program as a function of env.values, the
+        governor's tick and the trace writer, or None when CPython cannot
+        compile it (e.g. nesting deeper than its limits)."""
+        checked = self.resolve(node)
+        transpiler = Transpiler()
+        try:
+            self.source = transpiler.transpile(node, checked)
+        except RecursionError:
+            self.source = None
+            return None
+        namespace = {
+            '__nodes': transpiler.nodes,
+            # Expressions of the resolved tree: no loops, and the run's
+            # governor must not be restarted
+            '__eval': lambda node: self.tree_walker().execute(node),
+            '__binary_op': self.binary_op,
+            '__load': self.load,
+            '__store': self.store,
+            '__invalid': self.number,
+            '__unknown': self.unknown,
+            '__fail': _fail,
+            '__defined': _defined,
+            '__FAST_PATH_ERRORS': FAST_PATH_ERRORS,
+        }
+        for value, name in transpiler.constants.items():
+            namespace[name] = value
+        try:
+            code = compile(self.source, '<mini>', 'exec')
+        except (SyntaxError, RecursionError, MemoryError):
+            return None
+        exec(code, namespace)
+        return namespace['__program']
+
+    def tree_walker(self):
+        # A plain Interpreter on the same env and governor; Interpreter.eval
+        # on self would dispatch nested nodes back to this class's eval
+        interpreter = Interpreter(self.symbol_table, self.input_func, self.governor, self.output)
+        interpreter.env = self.env
+        return interpreter
+
+    def load(self, slot):
+        value = self.env.values[slot]
+        if value is UNSET:
+            self.output.error('semantic', f"Undefined variable '{self.env.names[slot]}'")
+            return None
+        return value
+
+    def store(self, slot, value):
+        if value is not None:
+            self.env.values[slot] = value
+        return value
+
+    def unknown(self, type_name):
+        self.output.error('runtime', f"Unknown AST node type: {type_name}")
+        return None
+
+def _fail():
+    raise FastPathFailed()
+
+def _defined(value):
+    if value is UNSET:
+        raise FastPathFailed()
+    return value
+
+def _is_typed(node):
+    # The semantic analyzer proved the operands are numbers, so the inline
+    # expression cannot fail; a division may still hit zero
+    return type(node) in (BinOpNode, UnaryOpNode) and node.type is not None and node.op != '/'
+
+def _contains(node, node_class):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is node_class:
+            return True
+        if type(node) is BinOpNode:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif type(node) is UnaryOpNode:
+            stack.append(node.operand)
+        elif type(node) is AssignNode:
+            stack.append(node.value)
+        elif type(node) is IfNode:
+            stack.append(node.condition)
+            stack.append(node.then_branch)
+            if node.else_branch:
+                stack.append(node.else_branch)
+        elif type(node) is WhileNode:
+            stack.append(node.condition)
+            stack.append(node.body)
+        elif type(node) is BlockNode:
+            stack.extend(node.statements)
+    return False
@@ -0,0 +1,370 @@
+from array import array
+
+from parser import (
+    NumberNode, VarNode, AssignNode, BinOpNode, UnaryOpNode, IfNode, WhileNode,
+    BlockNode, StringNode, number_value
+)
+from governor import ExecutionGovernor
+from output import StdoutSink
+from resolver import Environment, Resolver, UNSET, resolved_slots
+
+# Opcodes. Every instruction is an (opcode, argument) pair in Bytecode.code;
+# jump arguments are instruction indices, variable arguments are slots.
+(
+    LOAD_CONST,               # push constants[arg]
+    LOAD_NAME,                # push the variable in slot arg (None if undefined)
+    LOAD_FAST,                # push the variable in slot arg, known to be assigned
+    STORE_NAME,               # assign the top of stack to slot arg unless it is None
+    POP,                      # discard the top of stack
+    JUMP,                     # continue at arg
+    JUMP_IF_NONE,             # continue at arg if the top of stack is None (kept)
+    POP_JUMP_IF_NOT_POSITIVE, # pop; continue at arg unless the value is > 0
+    POP_JUMP_IF_FALSE,        # pop; continue at arg if the value is falsy
+    LOOP_START,               # start counting iterations of a new loop
+    LOOP_TICK,                # count an iteration of the innermost loop with the governor
+    LOOP_TRACE,               # write the top of stack as the iteration's result if the governor traces
+    LOOP_END,                 # stop counting iterations of the innermost loop
+    INVALID_NUMBER,           # report constants[arg] as an invalid number and push None
+    RETURN,                   # stop and return the top of stack
+    ADD, SUBTRACT, MULTIPLY, DIVIDE, LESS, GREATER, LESS_EQUAL, GREATER_EQUAL,
+    # The same operators on operands the semantic analyzer proved to be
+    # numbers: no None or type checks (division still checks for zero)
+    NUMBER_ADD, NUMBER_SUBTRACT, NUMBER_MULTIPLY, NUMBER_DIVIDE, NUMBER_LESS,
+    NUMBER_GREATER, NUMBER_LESS_EQUAL, NUMBER_GREATER_EQUAL,
+) = range(31)
+
+BINARY_OPCODES = {
+    '+': ADD,
+    '-': SUBTRACT,
+    '*': MULTIPLY,
+    '/': DIVIDE,
+    '<': LESS,
+    '>': GREATER,
+    '<=': LESS_EQUAL,
+    '>=': GREATER_EQUAL,
+}
+NUMBER_OPCODES = {op: opcode + NUMBER_ADD - ADD for op, opcode in BINARY_OPCODES.items()}
+OPERATOR_SYMBOLS = {opcode: op for op, opcode in BINARY_OPCODES.items()}
+
+OPCODE_NAMES = [
+    'LOAD_CONST', 'LOAD_NAME', 'LOAD_FAST', 'STORE_NAME', 'POP', 'JUMP', 'JUMP_IF_NONE',
+    'POP_JUMP_IF_NOT_POSITIVE', 'POP_JUMP_IF_FALSE', 'LOOP_START', 'LOOP_TICK',
+    'LOOP_TRACE', 'LOOP_END', 'INVALID_NUMBER', 'RETURN', 'ADD', 'SUBTRACT', 'MULTIPLY',
+    'DIVIDE', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'NUMBER_ADD',
+    'NUMBER_SUBTRACT', 'NUMBER_MULTIPLY', 'NUMBER_DIVIDE', 'NUMBER_LESS',
+    'NUMBER_GREATER', 'NUMBER_LESS_EQUAL', 'NUMBER_GREATER_EQUAL',
+]
+
+class Bytecode:
+    def __init__(self):
+        self.code = array('l')
+        self.constants = []
+        self.names = [] # slot -> variable name
+        self._instructions = None
+        self._constant_index = {}
+
+    def emit(self, opcode, arg=0):
+        self.code.extend((opcode, arg))
+        return len(self.code) // 2 - 1
+
+    def instructions(self):
+        """The code as a list of (opcode, argument) tuples, which the VM
+        indexes faster than the compact array."""
+        if self._instructions is None or len(self._instructions) * 2 != len(self.code):
+            self._instructions = list(zip(self.code[::2], self.code[1::2]))
+        return self._instructions
+
+    def patch(self, at, target):
+        self.code[2 * at + 1] = target
+
+    def here(self):
+        return len(self.code) // 2
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self._constant_index:
+            self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self._constant_index[key]
+
+    def disassemble(self):
+        lines = []
+        for pc, (opcode, arg) in enumerate(self.instructions()):
+            if opcode in (LOAD_CONST, INVALID_NUMBER):
+                detail = f"{arg} ({self.constants[arg]!r})"
+            elif opcode in (LOAD_NAME, LOAD_FAST, STORE_NAME):
+                detail = f"{arg} ({self.names[arg]})"
+            elif opcode in (JUMP, JUMP_IF_NONE, POP_JUMP_IF_NOT_POSITIVE, POP_JUMP_IF_FALSE):
+                detail = f"-> {arg}"
+            else:
+                detail = ''
+            lines.append(f"{pc:6} {OPCODE_NAMES[opcode]:<26} {detail}".rstrip())
+        return '\n'.join(lines)
+
+class Compiler:
+    """Compiles the parser's AST into Bytecode for the VirtualMachine.
+
+    Every statement and expression leaves exactly one value on the stack,
+    mirroring the value Interpreter.eval returns for the node. Variables
+    are addressed by their slots in env (a fresh Environment by default).
+    """
+
+    def compile(self, node, env=None):
+        if env is None:
+            env = Environment()
+        self.checked = resolved_slots(node, env)
+        if self.checked is None:
+            resolver = Resolver(env)
+            resolver.resolve(node)
+            self.checked = resolver.checked
+        self.bytecode = Bytecode()
+        self.bytecode.names = list(env.names)
+        self.leaves = {} # id(leaf node) -> its instruction; the parser shares leaves
+        self.compile_node(node)
+        self.bytecode.emit(RETURN)
+        return self.bytecode
+
+    def compile_node(self, node):
+        bc = self.bytecode
+        node_type = type(node)
+
+        if node_type is VarNode or node_type is NumberNode or node_type is StringNode:
+            instruction = self.leaves.get(id(node))
+            if instruction is None:
+                instruction = self.leaves[id(node)] = self.leaf_instruction(node)
+            bc.code.extend(instruction)
+
+        elif node_type is BinOpNode:
+            self.compile_node(node.left)
+            self.compile_node(node.right)
+            opcode = (BINARY_OPCODES if node.type is None else NUMBER_OPCODES).get(node.op)
+            if opcode is None:
+                raise SyntaxError(f"Unknown operator '{node.op}'")
+            bc.code.extend((opcode, 0))
+
+        elif node_type is UnaryOpNode:
+            # Same as the parser's 0 - x, without the literal conversion
+            bc.emit(LOAD_CONST, bc.constant(0))
+            self.compile_node(node.operand)
+            opcode = (BINARY_OPCODES if node.type is None else NUMBER_OPCODES).get(node.op)
+            if opcode is None:
+                raise SyntaxError(f"Unknown operator '{node.op}'")
+            bc.code.extend((opcode, 0))
+
+        elif node_type is AssignNode:
+            self.compile_node(node.value)
+            bc.code.extend((STORE_NAME, node.slot))
+
+        elif node_type is IfNode:
+            self.compile_if(node)
+
+        elif node_type is WhileNode:
+            self.compile_while(node)
+
+        elif node_type is BlockNode:
+            if not node.statements:
+                bc.emit(LOAD_CONST, bc.constant(None))
+            for i, stmt in enumerate(node.statements):
+                if i:
+                    bc.code.extend((POP, 0))
+                self.compile_node(stmt)
+
+        else:
+            raise TypeError(f"Cannot compile AST node type: {type(node).__name__}")
+
+    def leaf_instruction(self, node):
+        bc = self.bytecode
+        if type(node) is VarNode:
+            return (LOAD_NAME if node.slot in self.checked else LOAD_FAST, node.slot)
+        if type(node) is StringNode:
+            return (LOAD_CONST, bc.constant(node.value))
+        value = number_value(node.value)
+        if value is None:
+            return (INVALID_NUMBER, bc.constant(node.value))
+        return (LOAD_CONST, bc.constant(value))
+
+    def compile_if(self, node):
+        bc = self.bytecode
+        self.compile_node(node.condition)
+        # A failed condition (None) is itself the result of the if
+        skip_if_none = bc.emit(JUMP_IF_NONE)
+        to_else = bc.emit(POP_JUMP_IF_NOT_POSITIVE)
+        self.compile_node(node.then_branch)
+        to_end = bc.emit(JUMP)
+        bc.patch(to_else, bc.here())
+        if node.else_branch:
+            self.compile_node(node.else_branch)
+        else:
+            bc.emit(LOAD_CONST, bc.constant(None))
+        bc.patch(to_end, bc.here())
+        bc.patch(skip_if_none, bc.here())
+
+    def compile_while(self, node):
+        bc = self.bytecode
+        # The loop's result (last body value) stays on the stack below the condition
+        bc.emit(LOAD_CONST, bc.constant(None))
+        bc.emit(LOOP_START)
+        top = bc.here()
+        self.compile_node(node.condition)
+        exit_jump = bc.emit(POP_JUMP_IF_FALSE)
+        bc.emit(LOOP_TICK)
+        bc.emit(POP)
+        self.compile_node(node.body)
+        bc.emit(LOOP_TRACE)
+        bc.emit(JUMP, top)
+        bc.patch(exit_jump, bc.here())
+        bc.emit(LOOP_END)
+
+class VirtualMachine:
+    """Stack-based VM for Bytecode, with the same semantics as Interpreter."""
+
+    def __init__(self, symbol_table, input_func=None, governor=None, output=None):
+        self.env = Environment()
+        self.symbol_table = symbol_table
+        self.input_func = input_func if input_func is not None else input
+        self.governor = governor if governor is not None else ExecutionGovernor()
+        self.output = output if output is not None else StdoutSink()
+
+    def eval(self, node):
+        self.governor.start(self.env)
+        try:
+            return self.run(Compiler().compile(node, self.env))
+        finally:
+            self.output.flush()
+
+    def run(self, bytecode):
+        names = bytecode.names
+        if not self.env.bind(names):
+            raise RuntimeError("Bytecode was compiled for a different variable layout")
+        code = bytecode.instructions()
+        constants = bytecode.constants
+        values = self.env.values
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        loop_counts = []
+        tick = self.governor.tick
+        trace = self.governor.trace
+        write = self.output.write
+        error = self.output.error
+        pc = 0
+
+        while True:
+            opcode, arg = code[pc]
+            pc += 1
+
+            if opcode >= ADD:
+                right = pop()
+                left = stack[-1]
+                if opcode >= NUMBER_ADD:
+                    if opcode == NUMBER_ADD:
+                        stack[-1] = left + right
+                    elif opcode == NUMBER_SUBTRACT:
+                        stack[-1] = left - right
+                    elif opcode == NUMBER_MULTIPLY:
+                        stack[-1] = left * right
+                    elif opcode == NUMBER_LESS:
+                        stack[-1] = 1 if left < right else 0
+                    elif opcode == NUMBER_GREATER:
+                        stack[-1] = 1 if left > right else 0
+                    elif opcode == NUMBER_LESS_EQUAL:
+                        stack[-1] = 1 if left <= right else 0
+                    elif opcode == NUMBER_GREATER_EQUAL:
+                        stack[-1] = 1 if left >= right else 0
+                    elif right:
+                        stack[-1] = left / right
+                    else:
+                        error('runtime', "Division by zero")
+                        stack[-1] = None
+                    continue
+                if left is None or right is None:
+                    stack[-1] = None
+                    continue
+                if not (isinstance(left, (int, float)) and isinstance(right, (int, float))):
+                    error('semantic', f"Invalid operand types for operator '{OPERATOR_SYMBOLS[opcode]}': {type(left).__name__} and {type(right).__name__}")
+                    stack[-1] = None
+                    continue
+                if opcode == ADD:
+                    stack[-1] = left + right
+                elif opcode == SUBTRACT:
+                    stack[-1] = left - right
+                elif opcode == MULTIPLY:
+                    stack[-1] = left * right
+                elif opcode == DIVIDE:
+                    if right == 0:
+                        error('runtime', "Division by zero")
+                        stack[-1] = None
+                    else:
+                        stack[-1] = left / right
+                elif opcode == LESS:
+                    stack[-1] = int(left < right)
+                elif opcode == GREATER:
+                    stack[-1] = int(left > right)
+                elif opcode == LESS_EQUAL:
+                    stack[-1] = int(left <= right)
+                else:
+                    stack[-1] = int(left >= right)
+
+            elif opcode == LOAD_FAST:
+                push(values[arg])
+
+            elif opcode == LOAD_CONST:
+                push(constants[arg])
+
+            elif opcode == LOAD_NAME:
+                value = values[arg]
+                if value is UNSET:
+                    error('semantic', f"Undefined variable '{names[arg]}'")
+                    value = None
+                push(value)
+
+            elif opcode == STORE_NAME:
+                value = stack[-1]
+                if value is not None:
+                    values[arg] = value
+
+            elif opcode == POP:
+                pop()
+
+            elif opcode == JUMP:
+                pc = arg
+
+            elif opcode == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+
+            elif opcode == LOOP_TICK:
+                loop_counts[-1] += 1
+                tick(loop_counts[-1])
+
+            elif opcode == LOOP_TRACE:
+                if trace:
+                    write(f"Result: {stack[-1]}")
+
+            elif opcode == JUMP_IF_NONE:
+                if stack[-1] is None:
+                    pc = arg
+
+            elif opcode == POP_JUMP_IF_NOT_POSITIVE:
+                # Custom truthiness rule: > 0 is true, <= 0 is false
+                if not pop() > 0:
+                    pc = arg
+
+            elif opcode == LOOP_START:
+                loop_counts.append(0)
+
+            elif opcode == LOOP_END:
+                loop_counts.pop()
+
+            elif opcode == INVALID_NUMBER:
+                error('semantic', f"Invalid number '{constants[arg]}'")
+                push(None)
+
+            elif opcode == RETURN:
+                return pop()
+
+            else:
+                raise RuntimeError(f"Unknown opcode {opcode} at {pc - 1}")
+
+    def get_formatted_env(self):
+        return self.env.variables()